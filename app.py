@@ -1,11 +1,38 @@
 import os
 import subprocess
 import sys
+import json
+import uuid
 from pathlib import Path
-from flask import Flask, request, render_template_string
+from flask import Flask, Response, jsonify, request, render_template_string, url_for
+
+import jobs
+import metricas
+import perfil
+import workspace
 
 BASE_DIR = Path(__file__).resolve().parent
 
+# "etapas": un script por etapa, cada una espera a la anterior completa
+# "streaming": pipeline.py avanza cada slide por sus etapas de forma independiente
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "etapas")
+# "proceso": las etapas corren dentro del servidor con clientes ya inicializados (runner.py)
+# "subproceso": un intérprete nuevo por etapa, comunicadas por config.json y slides.json
+RUN_MODE = os.getenv("RUN_MODE", "proceso")
+# Si el proyecto ya existe, solo se regeneran los slides cuyo texto cambió (ver incremental.py)
+INCREMENTAL = os.getenv("INCREMENTAL", "1") != "0"
+# SUBTITLE_MODE=texto: títulos nativos en el XML, sin rasterizar subtítulos (ver subtitle_gen.py)
+SUBTITLE_MODE = os.getenv("SUBTITLE_MODE", "png")
+
+if RUN_MODE == "proceso":
+    import runner
+
+# Jobs de /jobs que corren a la vez en segundo plano
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Con JOB_QUEUE_DB, /jobs encola en la cola durable y los jobs los corren los
+# workers (worker.py) en esta u otras máquinas; sin ella corren en este proceso
+JOB_QUEUE_DB = os.getenv("JOB_QUEUE_DB")
+
 HTML_FORM = """
 <!doctype html>
 <html>
@@ -34,8 +61,12 @@ HTML_FORM = """
         <label for="guion">Guion / Script</label>
         <textarea id="guion" name="guion" placeholder="Pega aquí tu guion..." required></textarea>
 
+        <label><input type="checkbox" name="perfilar" value="1"> Perfilar etapas (cProfile + tracemalloc)</label>
+
         <button type="submit">Generar video</button>
+        <button type="button" id="en-segundo-plano">Generar en segundo plano</button>
       </form>
+      <pre id="progreso" hidden></pre>
       {% if log %}
       <h2>Resultado</h2>
       <pre>{{ log }}</pre>
@@ -45,6 +76,27 @@ HTML_FORM = """
       {% endif %}
       {% endif %}
     </div>
+    <script>
+      document.getElementById("en-segundo-plano").addEventListener("click", async () => {
+        const form = document.querySelector("form");
+        if (!form.reportValidity()) return;
+        const out = document.getElementById("progreso");
+        out.hidden = false;
+        out.textContent = "";
+        const r = await fetch("/jobs", { method: "POST", body: new FormData(form) });
+        const job = await r.json();
+        if (!r.ok) { out.textContent = job.error; return; }
+        out.textContent = `job ${job.job_id}\n`;
+        const es = new EventSource(job.eventos_url);
+        es.onmessage = (m) => {
+          const e = JSON.parse(m.data);
+          if (e.tipo === "slide") out.textContent += `${e.etapa}: slide ${e.slide}/${e.total}\n`;
+          else if (e.tipo === "etapa") out.textContent += `▶ ${e.etapa} ${e.estado}${e.segundos !== undefined ? " (" + e.segundos + "s)" : ""}\n`;
+          else out.textContent += `estado: ${e.estado}${e.xml ? " → " + e.xml : ""}\n`;
+          if (e.tipo === "estado" && (e.estado === "ok" || e.estado === "error")) es.close();
+        };
+      });
+    </script>
   </body>
 </html>
 """
@@ -67,10 +119,23 @@ def run_cmd(cmd, env=None):
     except Exception as e:
         return 1, f"[EXCEPTION] {e}"
 
-def find_generated_xml(project_name: str) -> str | None:
-    out = (BASE_DIR / project_name / f"{project_name}.xml")
-    if out.exists():
-        return str(out)
+def _ejecutar_job(nombre, guion, modo, emitir, perfilar=None):
+    import runner
+    return runner.ejecutar(nombre, guion, modo=modo, base_dir=BASE_DIR, on_evento=emitir, perfilar=perfilar)
+
+def pide_perfil(datos) -> bool:
+    """Campo `perfilar` de un form (checkbox) o de un JSON (true/1)."""
+    return str(datos.get("perfilar") or "").lower() in ("1", "true", "on")
+
+if JOB_QUEUE_DB:
+    import job_queue
+    job_manager = job_queue.ColaManager(job_queue.ColaJobs(JOB_QUEUE_DB))
+else:
+    job_manager = jobs.JobManager(_ejecutar_job, max_workers=JOB_WORKERS)
+
+def find_generated_xml(proyecto: workspace.Proyecto) -> str | None:
+    if proyecto.xml_path.exists():
+        return str(proyecto.xml_path)
     return None
 
 @app.route("/", methods=["GET"])
@@ -85,67 +150,147 @@ def run_pipeline():
     if not nombre or not guion:
         return render_template_string(HTML_FORM, log="ERROR: nombre y guion son requeridos.", output_path=None)
 
+    if RUN_MODE == "proceso":
+        ok, log, xml_path = runner.ejecutar(nombre, guion, modo=PIPELINE_MODE, base_dir=BASE_DIR,
+                                            perfilar=pide_perfil(request.form) or None)
+        return render_template_string(HTML_FORM, log="\n\n".join(log), output_path=xml_path if ok else None)
+
+    # Workspace propio del job: su config.json no lo comparte con ningún otro /run
+    job_dir = workspace.crear_workspace(uuid.uuid4().hex[:12])
+    cfg_path = job_dir / "config.json"
+
     env = os.environ.copy()
     env["NOMBRE"] = nombre
     env["GUION"] = guion
+    env["VIDEONEWS_CONFIG"] = str(cfg_path)
 
+    nombre_proyecto = workspace.nombre_proyecto(nombre)
+    proyecto = workspace.Proyecto(nombre_proyecto, BASE_DIR / nombre_proyecto)
+    perfil_dir = proyecto.dir / "perfil" if pide_perfil(request.form) or perfil.PROFILE_STAGES else None
+    with workspace.bloqueo_proyecto(proyecto):
+        ok, log, xml_path = _run_subprocesos(env, cfg_path, incremental=INCREMENTAL and proyecto.slides_path.exists(),
+                                             perfil_dir=perfil_dir)
+    # Si falló se conserva jobs/<id>/ para depurar; si terminó bien ya nadie lo lee
+    if ok:
+        workspace.borrar_workspace(job_dir)
+    return render_template_string(HTML_FORM, log="\n\n".join(log), output_path=xml_path if ok else None)
+
+def _run_subprocesos(env, cfg_path, incremental=False, perfil_dir=None):
     log = []
     def step(title, cmd, env=None):
         rc, out = run_cmd(cmd, env=env)
         log.append(f"$ {' '.join(cmd)}\n{out}\n[exit {rc}]")
         return rc
 
-    # 1) chunking.py
-    rc = step("chunking", [sys.executable, "chunking.py"], env=env)
+    ordenes = []
+    def comando(script):
+        # Perfilado en subprocesos: cada script corre bajo cProfile y deja solo su .pstats
+        if not perfil_dir:
+            return [sys.executable, script]
+        ordenes.append(script)
+        salida = perfil_dir / f"{len(ordenes):02d}_{Path(script).stem}.pstats"
+        return [sys.executable, "-m", "cProfile", "-o", str(salida), script]
+
+    if perfil_dir:
+        perfil_dir.mkdir(parents=True, exist_ok=True)
+        env["SUBTITLE_WORKERS"] = "1"  # cProfile no ve los procesos del pool
+
+    if incremental:
+        primera, siguientes = "incremental.py", ["generate_xml.py"]
+    elif PIPELINE_MODE == "streaming":
+        primera, siguientes = "pipeline.py", ["generate_xml.py"]
+    else:
+        primera, siguientes = "chunking.py", ["image_gen.py", "voice_gen.py", "subtitle_gen.py", "generate_xml.py"]
+        if SUBTITLE_MODE == "texto":
+            siguientes.remove("subtitle_gen.py")
+
+    # 1) chunking.py / pipeline.py / incremental.py
+    rc = step(primera, comando(primera), env=env)
     if rc != 0:
-        return render_template_string(HTML_FORM, log="\n\n".join(log), output_path=None)
+        return False, log, None
 
-    # Read config.json to locate project folder name (created by chunking.py)
-    cfg_path = BASE_DIR / "config.json"
-    project_name = None
+    # Read the job's config.json to locate the project folder (created by chunking.py)
+    proyecto = None
     if cfg_path.exists():
         try:
-            import json
-            project_name = json.loads(cfg_path.read_text(encoding="utf-8")).get("nombre_proyecto")
+            proyecto = workspace.cargar_proyecto(cfg_path)
         except Exception as e:
             log.append(f"ERROR leyendo config.json: {e}")
     else:
-        log.append("WARNING: no se encontró config.json tras chunking.py")
+        log.append(f"WARNING: no se encontró config.json tras {primera}")
 
-    # 2) image_gen.py
-    if (BASE_DIR / "image_gen.py").exists():
-        rc = step("image_gen", [sys.executable, "image_gen.py"])
-        if rc != 0:
-            return render_template_string(HTML_FORM, log="\n\n".join(log), output_path=None)
-    else:
-        log.append("WARNING: image_gen.py no encontrado, se omite.")
+    # 2..5) image_gen.py, voice_gen.py, subtitle_gen.py, generate_xml.py
+    for script in siguientes:
+        if (BASE_DIR / script).exists():
+            rc = step(script, comando(script), env=env)
+            if rc != 0:
+                return False, log, None
+        else:
+            log.append(f"WARNING: {script} no encontrado, se omite.")
 
-    # 3) voice_gen.py
-    if (BASE_DIR / "voice_gen.py").exists():
-        rc = step("voice_gen", [sys.executable, "voice_gen.py"])
-        if rc != 0:
-            return render_template_string(HTML_FORM, log="\n\n".join(log), output_path=None)
-    else:
-        log.append("WARNING: voice_gen.py no encontrado, se omite.")
+    xml_path = find_generated_xml(proyecto) if proyecto else None
+    if perfil_dir:
+        log.append(f"Perfiles por etapa (.pstats): {perfil_dir}")
+    return True, log, xml_path or "(desconocido)"
 
-    # 4) subtitle_gen.py
-    if (BASE_DIR / "subtitle_gen.py").exists():
-        rc = step("subtitle_gen", [sys.executable, "subtitle_gen.py"])
-        if rc != 0:
-            return render_template_string(HTML_FORM, log="\n\n".join(log), output_path=None)
-    else:
-        log.append("WARNING: subtitle_gen.py no encontrado, se omite.")
+@app.route("/jobs", methods=["POST"])
+def crear_job():
+    datos = request.get_json(silent=True) or request.form
+    nombre = (datos.get("nombre") or "").strip()
+    guion = (datos.get("guion") or "").strip()
+    if not nombre or not guion:
+        return jsonify({"error": "nombre y guion son requeridos"}), 400
 
-    # 5) generate_xml.py
-    if (BASE_DIR / "generate_xml.py").exists():
-        rc = step("generate_xml", [sys.executable, "generate_xml.py"])
-        if rc != 0:
-            return render_template_string(HTML_FORM, log="\n\n".join(log), output_path=None)
-    else:
-        log.append("WARNING: generate_xml.py no encontrado, se omite.")
+    job = job_manager.enviar(nombre, guion, PIPELINE_MODE, perfilar=pide_perfil(datos))
+    return jsonify({
+        "job_id": job.id,
+        "estado": job.estado,
+        "estado_url": url_for("estado_job", job_id=job.id),
+        "eventos_url": url_for("eventos_job", job_id=job.id),
+    }), 202
+
+@app.route("/jobs", methods=["GET"])
+def listar_jobs():
+    return jsonify([job.to_dict() for job in job_manager.listar()])
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def estado_job(job_id):
+    job = job_manager.obtener(job_id)
+    if job is None:
+        return jsonify({"error": "job no encontrado"}), 404
+    return jsonify(job.to_dict(con_log=True))
+
+@app.route("/jobs/<job_id>/eventos", methods=["GET"])
+def eventos_job(job_id):
+    """Server-Sent Events con el avance del job; termina cuando el job termina."""
+    job = job_manager.obtener(job_id)
+    if job is None:
+        return jsonify({"error": "job no encontrado"}), 404
+    try:
+        ultimo = int(request.headers.get("Last-Event-ID") or request.args.get("desde") or 0)
+    except ValueError:
+        ultimo = 0
+
+    def stream():
+        nonlocal ultimo
+        while True:
+            eventos = job.eventos_desde(ultimo, timeout=15)
+            if not eventos:
+                if job.estado in jobs.ESTADOS_FINALES:
+                    return
+                yield ": keepalive\n\n"
+                continue
+            for evento in eventos:
+                ultimo = evento["seq"]
+                yield f"id: {evento['seq']}\ndata: {json.dumps(evento, ensure_ascii=False)}\n\n"
+
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
-    xml_path = find_generated_xml(project_name) if project_name else None
-    return render_template_string(HTML_FORM, log="\n\n".join(log), output_path=xml_path or "(desconocido)")
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Métricas de Prometheus de los jobs que corren en este proceso (ver metricas.py)."""
+    return Response(metricas.exponer(), content_type=metricas.CONTENT_TYPE)
 
 if __name__ == "__main__":
     # For local testing: python app.py
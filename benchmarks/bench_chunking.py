@@ -0,0 +1,57 @@
+"""Compara los modos de chunking.py (secuencial, concurrente, lote) con un LLM falso.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.bench_chunking --chunks 40 --latencia 0.2 --concurrencia 8 --lote 25
+"""
+import argparse
+import time
+
+import chunking
+import ratelimit
+from fakes import FakeChatModel
+
+
+def medir(chunks, latencia, **kwargs):
+    llm = FakeChatModel(latencia=latencia)
+    chain = chunking.prompt_template | llm
+    chain_visual = chunking.prompt_visual | llm
+    chain_lote = chunking.prompt_lote | llm
+    inicio = time.perf_counter()
+    slides = chunking.generar_slides(chunks, chain, chain_visual, chain_lote=chain_lote, **kwargs)
+    return time.perf_counter() - inicio, llm.llamadas, slides
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=40)
+    parser.add_argument("--latencia", type=float, default=0.2, help="segundos por llamada al LLM")
+    parser.add_argument("--concurrencia", type=int, default=chunking.LLM_MAX_CONCURRENCY)
+    parser.add_argument("--lote", type=int, default=chunking.LLM_BATCH_SIZE, help="chunks por llamada en modo lote")
+    args = parser.parse_args()
+
+    chunks = [f"Fragmento de guion número {i}." for i in range(args.chunks)]
+    chunking.llm_cache.activa = False  # se mide el costo real de cada modo
+    # Sin presupuesto por minuto: se compara la concurrencia de cada modo, no los límites de la API
+    chat = ratelimit.proveedor("openai_chat")
+    chat.pedidos = chat.unidades = None
+
+    casos = [
+        ("secuencial", dict(max_concurrency=1)),
+        (f"concurrente (máx {args.concurrencia})", dict(max_concurrency=args.concurrencia)),
+        (f"lote ({args.lote} por llamada)", dict(max_concurrency=args.concurrencia, modo="lote", batch_size=args.lote)),
+    ]
+
+    print(f"chunks={args.chunks} latencia={args.latencia}s")
+    base = None
+    orden = None
+    for nombre, kwargs in casos:
+        t, llamadas, slides = medir(chunks, args.latencia, **kwargs)
+        base = base or t
+        chunks_slides = [s["chunk"] for s in slides]
+        orden = orden or chunks_slides
+        assert chunks_slides == orden, f"{nombre}: el orden de los slides cambió"
+        print(f"{nombre:<28}: {t:7.2f}s  llamadas={llamadas:<4}  aceleración={base / t:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Tiempo de arranque de cada etapa: `python -X importtime -c "import <módulo>"` en un intérprete nuevo.
+
+Falla (exit 1) si algún módulo supera su umbral o si importarlo carga alguno de
+los SDK pesados (langchain, openai, elevenlabs, PIL, mutagen, httpx, requests):
+esos se importan recién dentro de las funciones que los usan. Sirve como
+chequeo de regresión en CI.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.bench_import --repeticiones 5
+    python -m benchmarks.bench_import --max-ms 150 --detalle
+"""
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+MODULOS = ("chunking", "image_gen", "voice_gen", "subtitle_gen", "generate_xml", "pipeline", "incremental",
+           "runner", "worker", "app")
+PESADOS = ("langchain", "langchain_core", "langchain_openai", "openai", "elevenlabs", "PIL", "mutagen", "httpx",
+           "requests")
+# Milisegundos (import acumulado del módulo, mínimo de las repeticiones). Flask pesa
+# por sí solo: app.py tiene más margen.
+UMBRAL_MS = 200
+UMBRALES_MS = {"app": 600}
+
+
+def medir(modulo: str) -> tuple:
+    """(ms acumulados del módulo, {paquete importado por él: ms}, paquetes cargados) en frío."""
+    salida = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+                            cwd=RAIZ, capture_output=True, text=True, check=True).stderr
+    filas = []  # (profundidad, nombre, ms acumulados), en el orden en que terminan de importarse
+    for linea in salida.splitlines():
+        partes = linea.split("|", 2)
+        if not linea.startswith("import time:") or len(partes) != 3 or not partes[1].strip().isdigit():
+            continue
+        nombre = partes[2][1:]
+        filas.append(((len(nombre) - len(nombre.lstrip())) // 2, nombre.strip(), int(partes[1]) / 1000))
+
+    total = next(ms for profundidad, nombre, ms in filas if profundidad == 0 and nombre == modulo)
+    # Los hijos directos de un módulo se listan antes que él, con un nivel más de sangría
+    directos = {}
+    for profundidad, nombre, ms in filas:
+        if profundidad == 1:
+            directos[nombre] = ms
+        elif profundidad == 0:
+            if nombre == modulo:
+                break
+            directos = {}
+    cargados = {nombre.split(".")[0] for _, nombre, _ in filas}
+    return total, directos, cargados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--max-ms", type=float, help="umbral único para todos los módulos")
+    parser.add_argument("--detalle", action="store_true", help="lista los paquetes más caros de cada módulo")
+    parser.add_argument("modulos", nargs="*", default=MODULOS)
+    args = parser.parse_args()
+
+    fallas = []
+    for modulo in args.modulos:
+        mediciones = [medir(modulo) for _ in range(max(1, args.repeticiones))]
+        ms, directos, cargados = min(mediciones, key=lambda m: m[0])
+        umbral = args.max_ms or UMBRALES_MS.get(modulo, UMBRAL_MS)
+        pesados = sorted(p for p in PESADOS if p in cargados)
+        estado = "ok"
+        if ms > umbral:
+            estado = f"LENTO (umbral {umbral:.0f} ms)"
+        if pesados:
+            estado = f"importa {', '.join(pesados)}"
+        if estado != "ok":
+            fallas.append(modulo)
+        print(f"{modulo:<13}: {ms:7.1f} ms  {estado}")
+        if args.detalle:
+            for nombre, t in sorted(directos.items(), key=lambda p: -p[1])[:5]:
+                print(f"    {nombre:<24} {t:7.1f} ms")
+
+    if fallas:
+        print(f"\n{len(fallas)} módulo(s) fuera de presupuesto: {', '.join(fallas)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Benchmark de punta a punta sin red: chunking → image_gen → voice_gen → subtitle_gen → generate_xml.
+
+Corre las etapas reales contra los proveedores falsos de fakes.py (latencia y
+tasa de errores configurables; los errores pasan por los reintentos de
+ratelimit) y reporta por etapa el tiempo de reloj, la CPU (del proceso y de los
+procesos hijos, como el pool de subtítulos) y el pico de memoria de Python.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.bench_pipeline --slides 10,100,1000 --latencia 0.05 --errores 0.02
+
+tracemalloc encarece las etapas con mucho Python (sobre todo generate_xml):
+con --sin-memoria los tiempos salen sin esa sobrecarga.
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import chunking
+import fakes
+import generate_xml
+import image_gen
+import ratelimit
+import subtitle_gen
+import voice_gen
+import workspace
+
+
+def guion(slides: int) -> str:
+    """Un párrafo de ~150 caracteres por slide: el splitter no junta dos en un chunk de 200."""
+    return "\n\n".join(
+        f"Noticia {i}: las autoridades informaron hoy nuevos detalles sobre el caso número {i}, "
+        f"que sigue en investigación y tendrá novedades durante la semana."
+        for i in range(slides)
+    )
+
+
+def medir(fn, memoria: bool) -> dict:
+    if memoria:
+        tracemalloc.reset_peak()
+    antes = os.times()
+    inicio = time.perf_counter()
+    fn()
+    segundos = time.perf_counter() - inicio
+    despues = os.times()
+    cpu = sum(despues[i] - antes[i] for i in range(4))  # user + system, propios y de los hijos
+    pico = tracemalloc.get_traced_memory()[1] if memoria else None
+    return {"segundos": segundos, "cpu": cpu, "pico": pico}
+
+
+def correr(slides: int, args) -> list:
+    llm = fakes.FakeChatModel(latencia=args.latencia, fallas=fakes.Fallas(args.errores, args.semilla))
+    openai_client = fakes.FakeOpenAI(latencia=args.latencia, fallas=fakes.Fallas(args.errores, args.semilla))
+    tts_client = fakes.FakeElevenLabs(latencia=args.latencia, fallas=fakes.Fallas(args.errores, args.semilla))
+    texto = guion(slides)
+    estado = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        proyecto = workspace.Proyecto("bench", Path(tmp) / "bench")
+        proyecto.dir.mkdir()
+
+        def _chunking():
+            estado["slides"] = chunking.generar_slides_guion(texto, llm)
+
+        def _xml():
+            workspace.guardar_slides(proyecto, estado["slides"])
+            generate_xml.escribir_xml(proyecto.nombre, estado["slides"], proyecto.dir)
+
+        etapas = [
+            ("chunking", _chunking),
+            ("image_gen", lambda: image_gen.generar_imagenes(openai_client, estado["slides"], proyecto.imgs_dir)),
+            ("voice_gen", lambda: voice_gen.generar_voces(tts_client, estado["slides"], proyecto.voice_dir)),
+            ("subtitle_gen", lambda: subtitle_gen.generar_subtitulos(estado["slides"], proyecto.subs_dir)),
+            ("generate_xml", _xml),
+        ]
+        filas = [(titulo, medir(fn, not args.sin_memoria)) for titulo, fn in etapas]
+        assert len(estado["slides"]) == slides, f"se esperaban {slides} slides, salieron {len(estado['slides'])}"
+
+    errores = sum(c.fallas.errores for c in (llm, openai_client, tts_client))
+    return filas, errores
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--slides", default="10,100,1000", help="tamaños de guion, separados por coma")
+    parser.add_argument("--latencia", type=float, default=0.05, help="segundos por llamada a cada API falsa")
+    parser.add_argument("--errores", type=float, default=0.0, help="probabilidad de error transitorio por llamada")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--sin-memoria", action="store_true", help="no medir el pico de memoria (sin tracemalloc)")
+    args = parser.parse_args()
+
+    # Se mide el trabajo de cada etapa: sin cachés y sin presupuesto por minuto de las APIs
+    chunking.llm_cache.activa = False
+    image_gen.image_store.activa = False
+    voice_gen.audio_store.activa = False
+    for nombre in ("openai_chat", "openai_images", "elevenlabs"):
+        p = ratelimit.proveedor(nombre)
+        p.pedidos = p.unidades = None
+
+    if not args.sin_memoria:
+        tracemalloc.start()
+    print(f"latencia={args.latencia}s errores={args.errores:.0%} semilla={args.semilla}")
+    for slides in (int(n) for n in args.slides.split(",")):
+        filas, errores = correr(slides, args)
+        total = sum(m["segundos"] for _, m in filas)
+        print(f"\n{slides} slides: {total:.2f}s en total, {errores} errores simulados")
+        for titulo, m in filas:
+            pico = "" if m["pico"] is None else f"  pico={m['pico'] / 2**20:7.1f} MiB"
+            print(f"  {titulo:<13}: {m['segundos']:8.2f}s  cpu={m['cpu']:7.2f}s{pico}")
+    print(f"\n{ratelimit.reporte()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Compara el XML armado en memoria (ElementTree + prettify) con el escritor en streaming.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.bench_xml --slides 5000
+
+Con las plantillas de clips el costo por slide debe mantenerse plano al
+crecer --slides (comparar µs/slide con 1000 y 10000).
+"""
+import argparse
+import itertools
+import tempfile
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+
+import cache
+import generate_xml
+
+
+def en_memoria(nombre, slides, proj_dir):
+    xml = generate_xml.HEADER + generate_xml.prettify(generate_xml.build_sequence(nombre, slides, proj_dir))
+    out_path = proj_dir / f"{nombre}.xml"
+    cache.escribir_atomico(out_path, xml.encode("utf-8"))
+    return out_path
+
+
+def medir(fn, nombre, slides, proj_dir):
+    """(segundos, pico de memoria, bytes). El tiempo se mide sin tracemalloc, que lo infla."""
+    resultados = []
+    for rastrear in (False, True):
+        # UUIDs deterministas para poder comparar las salidas byte a byte
+        contador = itertools.count()
+        uuid4 = uuid.uuid4
+        uuid.uuid4 = lambda: uuid.UUID(int=next(contador))
+        if rastrear:
+            tracemalloc.start()
+        try:
+            inicio = time.perf_counter()
+            out_path = fn(nombre, slides, proj_dir)
+            resultados.append(time.perf_counter() - inicio)
+            if rastrear:
+                resultados.append(tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+            uuid.uuid4 = uuid4
+    return resultados[0], resultados[2], out_path.read_bytes()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--slides", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        proj_dir = Path(tmp)
+        for d in ("IMGS", "VOICE", "SUBS"):
+            (proj_dir / d).mkdir()
+        slides = []
+        for i in range(1, args.slides + 1):
+            (proj_dir / "VOICE" / f"chunk_voice{i}.mp3").touch()
+            (proj_dir / "SUBS" / f"sub_{i:04d}.png").touch()
+            slides.append({"slide": i, "nombre_imagen": f"img_{i:04d}.jpg", "nombre_audio": f"chunk_voice{i}.mp3",
+                           "duracion_frames": 90 + i % 60})
+
+        print(f"slides={args.slides}")
+        base = None
+        for nombre, fn in (("en memoria (prettify)", en_memoria), ("streaming", generate_xml.escribir_xml)):
+            segundos, pico, datos = medir(fn, "bench", slides, proj_dir)
+            base = base or datos
+            assert datos == base, f"{nombre}: la salida difiere"
+            print(f"{nombre:<22}: {segundos:7.2f}s  ({segundos / args.slides * 1e6:6.0f} µs/slide)  "
+                  f"pico={pico / 2**20:8.1f} MiB  xml={len(datos) / 2**20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""Caché persistente en disco, direccionada por contenido.
+
+Cada entrada es un JSON en `<directorio>/<hash[:2]>/<hash>.json`. La clave se
+calcula con `clave(...)` sobre todo lo que influye en el resultado (modelo,
+parámetros, prompt, texto), así que un cambio en cualquiera de ellos es un
+fallo de caché y no un resultado viejo.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+CACHE_DIR = Path(os.getenv("VIDEONEWS_CACHE_DIR") or Path(__file__).resolve().parent / ".cache")
+
+
+def clave(*partes) -> str:
+    """Hash estable (sha256) de cualquier combinación de valores serializables a JSON."""
+    datos = json.dumps(partes, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(datos.encode("utf-8")).hexdigest()
+
+
+@contextlib.contextmanager
+def abrir_atomico(path: Path, modo: str = "wb", **kwargs):
+    """Abre un temporal del mismo directorio; al salir sin error lo renombra encima de `path`."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=".tmp_", dir=path.parent)
+    try:
+        with os.fdopen(fd, modo, **kwargs) as f:
+            yield f
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def escribir_atomico(path: Path, datos: bytes):
+    """Escribe en un temporal del mismo directorio y lo renombra encima de `path`."""
+    with abrir_atomico(path) as f:
+        f.write(datos)
+
+
+# Cabecera de cada entrada de DiskCache: la fecha de creación va primero para
+# leerla sin parsear el valor
+_CABECERA = re.compile(rb'\{"creado": ([0-9.]+), "valor": ')
+
+
+class DiskCache:
+    """Caché JSON en disco con expiración por edad y límite de tamaño (LRU por mtime).
+
+    - `max_bytes`: al superarlo, `evict()` borra primero las entradas usadas hace más tiempo.
+    - `max_edad`: segundos desde que se escribió la entrada (no desde su último uso);
+      las más viejas se ignoran y se borran.
+    - `activa=False`: bypass total (ni lee ni escribe ni cuenta).
+
+    Cada archivo guarda `{"creado": <epoch>, "valor": ...}`: la mtime se renueva en
+    cada acierto (LRU) y no sirve para la edad. Las entradas escritas antes de este
+    formato (solo el valor) usan la mtime como fecha de creación.
+    """
+
+    def __init__(self, directorio, max_bytes=None, max_edad=None, activa=True):
+        self.directorio = Path(directorio)
+        self.max_bytes = max_bytes
+        self.max_edad = max_edad
+        self.activa = activa
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _path(self, k: str) -> Path:
+        return self.directorio / k[:2] / f"{k}.json"
+
+    def _expirada(self, creado: float) -> bool:
+        return self.max_edad is not None and time.time() - creado > self.max_edad
+
+    def _creado(self, path: Path, mtime: float) -> float:
+        with open(path, "rb") as f:
+            m = _CABECERA.match(f.read(64))
+        return float(m.group(1)) if m else mtime
+
+    def get(self, k: str):
+        if not self.activa:
+            return None
+        path = self._path(k)
+        try:
+            entrada = json.loads(path.read_text(encoding="utf-8"))
+            if isinstance(entrada, dict) and entrada.keys() == {"creado", "valor"}:
+                creado, valor = entrada["creado"], entrada["valor"]
+            else:  # entrada de antes del formato con fecha
+                creado, valor = path.stat().st_mtime, entrada
+            if self._expirada(creado):
+                path.unlink(missing_ok=True)
+                raise FileNotFoundError(path)
+            os.utime(path)  # marca de uso reciente para la política LRU
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return valor
+
+    def set(self, k: str, valor):
+        if not self.activa:
+            return
+        entrada = {"creado": round(time.time(), 3), "valor": valor}
+        escribir_atomico(self._path(k), json.dumps(entrada, ensure_ascii=False).encode("utf-8"))
+
+    def evict(self):
+        """Aplica la política de expiración y de tamaño. Devuelve cuántas entradas borró."""
+        if not self.directorio.exists():
+            return 0
+        entradas = []
+        borradas = 0
+        for path in self.directorio.glob("*/*.json"):
+            try:
+                st = path.stat()
+                # La fecha de creación es <= mtime: solo hace falta leerla si la mtime no alcanza
+                expirada = self._expirada(st.st_mtime) or (
+                    self.max_edad is not None and self._expirada(self._creado(path, st.st_mtime)))
+            except OSError:
+                continue
+            if expirada:
+                path.unlink(missing_ok=True)
+                borradas += 1
+            else:
+                entradas.append((st.st_mtime, st.st_size, path))
+
+        if self.max_bytes is not None:
+            total = sum(size for _, size, _ in entradas)
+            for _, size, path in sorted(entradas, key=lambda e: e[0]):
+                if total <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+                borradas += 1
+        return borradas
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+class BlobStore:
+    """Almacén de archivos direccionado por clave, compartido entre proyectos.
+
+    Cada entrada es `<clave><ext>` más `<clave>.json` con sus metadatos. `get`
+    enlaza (hardlink) o copia el archivo al destino; `evict` borra primero lo
+    usado hace más tiempo hasta quedar bajo `max_bytes`. Si los metadatos traen
+    `segundos` (tiempo que costó generarlo), cada acierto lo suma a `ahorro_segundos`.
+    """
+
+    def __init__(self, directorio, ext="", max_bytes=None, activa=True):
+        self.directorio = Path(directorio)
+        self.ext = ext
+        self.max_bytes = max_bytes
+        self.activa = activa
+        self.hits = 0
+        self.misses = 0
+        self.ahorro_segundos = 0.0
+        self._lock = threading.Lock()
+
+    def _paths(self, k: str):
+        base = self.directorio / k[:2]
+        return base / f"{k}{self.ext}", base / f"{k}.json"
+
+    def get(self, k: str, destino):
+        """Materializa la entrada en `destino` y devuelve sus metadatos, o None si no existe."""
+        if not self.activa:
+            return None
+        blob, meta_path = self._paths(k)
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            _enlazar_o_copiar(blob, Path(destino))
+            os.utime(blob)  # marca de uso reciente para la política LRU
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+            self.ahorro_segundos += float(meta.get("segundos", 0))
+        return meta
+
+    def put(self, k: str, origen, meta=None):
+        if not self.activa:
+            return
+        blob, meta_path = self._paths(k)
+        _enlazar_o_copiar(Path(origen), blob)
+        escribir_atomico(meta_path, json.dumps(meta or {}, ensure_ascii=False).encode("utf-8"))
+
+    def evict(self):
+        """Borra las entradas menos usadas hasta quedar bajo `max_bytes`. Devuelve cuántas borró."""
+        if self.max_bytes is None or not self.directorio.exists():
+            return 0
+        entradas = []
+        for meta_path in self.directorio.glob("*/*.json"):
+            blob = meta_path.with_name(meta_path.stem + self.ext)
+            try:
+                st = blob.stat()
+            except OSError:
+                meta_path.unlink(missing_ok=True)  # metadatos huérfanos
+                continue
+            entradas.append((st.st_mtime, st.st_size + meta_path.stat().st_size, blob, meta_path))
+
+        total = sum(e[1] for e in entradas)
+        borradas = 0
+        for _, size, blob, meta_path in sorted(entradas, key=lambda e: e[0]):
+            if total <= self.max_bytes:
+                break
+            meta_path.unlink(missing_ok=True)
+            blob.unlink(missing_ok=True)
+            total -= size
+            borradas += 1
+        return borradas
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "ahorro_segundos": round(self.ahorro_segundos, 1),
+        }
+
+
+def _enlazar_o_copiar(origen: Path, destino: Path):
+    """Hardlink atómico de `origen` en `destino`; si no se puede (otro disco), copia."""
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    tmp = destino.with_name(f".tmp_{os.getpid()}_{threading.get_ident()}_{destino.name}")
+    try:
+        os.link(origen, tmp)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        shutil.copyfile(origen, tmp)
+    try:
+        os.replace(tmp, destino)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
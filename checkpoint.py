@@ -0,0 +1,107 @@
+"""Manifiesto por slide para retomar un job interrumpido.
+
+Cada salida terminada (texto, imagen, audio, subtítulo) se anota en
+`<proyecto>/checkpoint.jsonl` con la clave de sus entradas y el tamaño del
+archivo. Al volver a correr una etapa, lo que ya figura en el manifiesto con
+la misma clave y cuyo archivo sigue intacto se salta.
+
+El archivo es solo de anexado: cada registro es una línea que se escribe y se
+sincroniza a disco de una vez; una entrada que deja de valer se anula con un
+registro `{"etapa", "archivo", "borrado": true}`. Si el proceso muere a mitad de una línea, esa
+línea se descarta al leer y el resto del manifiesto sigue siendo válido.
+"""
+import json
+import os
+import threading
+from pathlib import Path
+
+import cache
+
+NOMBRE = "checkpoint.jsonl"
+
+
+class Manifiesto:
+    def __init__(self, proj_dir):
+        self.path = Path(proj_dir) / NOMBRE
+        self._lock = threading.Lock()
+        self._entradas = {}
+        if self.path.exists():
+            self._cargar()
+
+    def _cargar(self):
+        lineas, cortadas = 0, 0
+        with open(self.path, encoding="utf-8") as f:
+            for linea in f:
+                lineas += 1
+                try:
+                    e = json.loads(linea)
+                    if e.get("borrado"):
+                        self._entradas.pop((e["etapa"], e["archivo"]), None)
+                    else:
+                        self._entradas[(e["etapa"], e["archivo"])] = e
+                except (ValueError, KeyError, TypeError):
+                    cortadas += 1  # línea cortada por una caída
+        # Se reescribe si hubo una línea cortada (el próximo anexado quedaría pegado a ella) o mucha historia
+        if cortadas or lineas > 2 * len(self._entradas) + 100:
+            self._compactar()
+
+    def _compactar(self):
+        datos = "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in self._entradas.values())
+        cache.escribir_atomico(self.path, datos.encode("utf-8"))
+
+    def _anexar(self, *entradas: dict):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entradas))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def vigente(self, etapa: str, archivo: str, clave: str, ruta=None):
+        """Datos guardados si la salida está completa: misma clave y, si hay `ruta`, mismo tamaño."""
+        with self._lock:
+            e = self._entradas.get((etapa, archivo))
+        if e is None or e["clave"] != clave:
+            return None
+        if ruta is not None:
+            try:
+                if os.path.getsize(ruta) != e["bytes"]:
+                    return None
+            except OSError:
+                return None
+        return e["datos"]
+
+    def marcar(self, etapa: str, archivo: str, clave: str, ruta=None, **datos):
+        entrada = {
+            "etapa": etapa,
+            "archivo": archivo,
+            "clave": clave,
+            "bytes": os.path.getsize(ruta) if ruta is not None else None,
+            "datos": datos,
+        }
+        with self._lock:
+            self._entradas[(etapa, archivo)] = entrada
+            self._anexar(entrada)
+
+    def renombrar(self, etapa: str, pares: list):
+        """Acompaña los renombrados (origen, destino) de archivos de una etapa.
+
+        Se aplican todos juntos, igual que el renombrado en dos fases de los
+        archivos, para que un destino no pise la entrada de un origen pendiente.
+        """
+        with self._lock:
+            movidas = [(self._entradas.pop((etapa, origen), None), destino) for origen, destino in pares]
+            quitadas = {origen for (origen, _), (e, _) in zip(pares, movidas) if e is not None}
+            for e, destino in movidas:
+                if self._entradas.pop((etapa, destino), None) is not None:
+                    quitadas.add(destino)
+            registros = []
+            for e, destino in movidas:
+                if e is not None:
+                    e = {**e, "archivo": destino}
+                    self._entradas[(etapa, destino)] = e
+                    registros.append(e)
+            # Lo que quedó sin entrada se anula en el archivo; si no, volvería al recargarlo
+            registros += [{"etapa": etapa, "archivo": archivo, "borrado": True}
+                          for archivo in sorted(quitadas) if (etapa, archivo) not in self._entradas]
+            if registros:
+                self._anexar(*registros)
@@ -1,11 +1,18 @@
 from datetime import date
 import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from dotenv import load_dotenv
 import json
 
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import PromptTemplate
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import cache
+import checkpoint
+import clientes
+import fakes
+import metricas
+import ratelimit
+import workspace
+from workspace import nombre_proyecto
 
 load_dotenv()
 openai_api_key = os.getenv("OPENAI_API_KEY")
@@ -29,10 +36,32 @@ if _env_guion and _env_guion.strip():
     GUION = _env_guion
 
 FECHA = date.today().isoformat()
-PROYECTO = f"video_{NOMBRE}_{FECHA}"
+PROYECTO = nombre_proyecto(NOMBRE)
+
+# Número máximo de llamadas simultáneas al LLM (1 = modo secuencial)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# "por_chunk": dos llamadas por chunk | "lote": una llamada JSON por cada LLM_BATCH_SIZE chunks
+LLM_MODE = os.getenv("LLM_MODE", "por_chunk")
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "25"))
+
+LLM_MODEL = "gpt-4"
+# Modo reproducible: temperatura 0 y seed fija, para que lo cacheado sea lo que se volvería a obtener
+LLM_REPRODUCIBLE = os.getenv("LLM_REPRODUCIBLE", "0") == "1"
+LLM_TEMPERATURE = 0.0 if LLM_REPRODUCIBLE else 0.8
+LLM_SEED = 1234 if LLM_REPRODUCIBLE else None
+
+# Caché de respuestas del LLM (LLM_CACHE=0 la desactiva)
+llm_cache = cache.DiskCache(
+    cache.CACHE_DIR / "llm",
+    max_bytes=int(os.getenv("LLM_CACHE_MAX_MB", "200")) * 1024 * 1024,
+    max_edad=int(os.getenv("LLM_CACHE_MAX_DAYS", "30")) * 24 * 3600,
+    activa=os.getenv("LLM_CACHE", "1") != "0",
+)
+metricas.registrar_cache("llm", llm_cache)
 
 
 def splitter_script(texto, chunk_size=200, chunk_overlap=20):
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
     splitter = RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap,
@@ -40,12 +69,9 @@ def splitter_script(texto, chunk_size=200, chunk_overlap=20):
     )
     return splitter.split_text(texto)
 
-chunks = splitter_script(GUION)
-
 
-prompt_template = PromptTemplate(
-    input_variables=["chunk"],
-    template="""
+# Las plantillas son texto plano: los PromptTemplate (langchain) se arman recién al usarlos
+TEMPLATE_TEXTO = """
 Tu tarea es generar un párrafo atractivo y breve, como si fuera para TikTok o una videonoticia viral.
 Debe ser distinto al texto original, pero basado en su contenido.
 No emojis nunca.
@@ -57,12 +83,9 @@ Texto base:
 
 Título para pantalla:
 """
-)
 
 
-prompt_visual = PromptTemplate(
-    input_variables=["chunk"],
-    template="""
+TEMPLATE_VISUAL = """
 Tu tarea es convertir el siguiente texto narrado en un prompt para generar una imagen con inteligencia artificial.
 Describe claramente la escena, personajes, entorno y estilo. No repitas el texto literal.
 Incluye detalles como edad, ambiente, iluminación, emociones, ropa, si aplica.
@@ -72,24 +95,63 @@ Texto:
 
 Prompt visual:
 """
-)
 
-llm = ChatOpenAI(
-    temperature=0.8,
-    model="gpt-4",
-    openai_api_key=openai_api_key
-)
 
-chain = prompt_template | llm
-chain_visual = prompt_visual | llm
+TEMPLATE_LOTE = """
+Vas a recibir una lista JSON de fragmentos narrados de una videonoticia. Para cada fragmento genera:
+- "texto_pantalla": un párrafo atractivo y breve, como si fuera para TikTok o una videonoticia viral.
+  Debe ser distinto al texto original, pero basado en su contenido. No emojis nunca.
+  No repitas el texto literal. No más de 120 caracteres.
+- "prompt_imagen": un prompt para generar una imagen con inteligencia artificial.
+  Describe claramente la escena, personajes, entorno y estilo. No repitas el texto literal.
+  Incluye detalles como edad, ambiente, iluminación, emociones, ropa, si aplica.
 
-resultado_slides = []
+Responde SOLO con JSON válido, sin texto adicional, con esta forma:
+{{"slides": [{{"indice": 0, "texto_pantalla": "...", "prompt_imagen": "..."}}]}}
+Incluye exactamente un elemento por cada "indice" recibido.
 
-for i, chunk in enumerate(chunks):
-    titulo_pantalla = chain.invoke({"chunk": chunk}).content.strip()
-    prompt_imagen = chain_visual.invoke({"chunk": chunk}).content.strip()
+Fragmentos:
+{chunks_json}
+"""
+
+_PROMPTS = {
+    "prompt_template": (["chunk"], TEMPLATE_TEXTO),
+    "prompt_visual": (["chunk"], TEMPLATE_VISUAL),
+    "prompt_lote": (["chunks_json"], TEMPLATE_LOTE),
+}
+
+
+@lru_cache(maxsize=None)
+def plantilla_prompt(nombre):
+    from langchain_core.prompts import PromptTemplate
+    variables, template = _PROMPTS[nombre]
+    return PromptTemplate(input_variables=variables, template=template)
+
+
+def __getattr__(nombre):
+    # chunking.prompt_template / prompt_visual / prompt_lote, como atributos del módulo
+    if nombre in _PROMPTS:
+        return plantilla_prompt(nombre)
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
+
+
+def crear_llm():
+    if fakes.ACTIVOS:
+        return fakes.llm()
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(
+        temperature=LLM_TEMPERATURE,
+        model=LLM_MODEL,
+        seed=LLM_SEED,
+        openai_api_key=openai_api_key,
+        max_retries=0,  # los reintentos los coordina ratelimit
+        http_client=clientes.http_openai(),
+        timeout=clientes.timeout_openai(),
+    )
 
-    slide_data = {
+
+def crear_slide(i, chunk, titulo_pantalla, prompt_imagen):
+    return {
         "slide": i + 1,
         "chunk": chunk,
         "texto_pantalla": titulo_pantalla,
@@ -98,14 +160,258 @@ for i, chunk in enumerate(chunks):
         "nombre_imagen": f"img_{i:02d}.jpg"
     }
 
-    resultado_slides.append(slide_data)
 
-os.makedirs(PROYECTO, exist_ok=True)
+def clave_llm(chain, entrada):
+    """Clave de caché: modelo, temperatura, seed, plantilla del prompt y variables."""
+    llm = chain.last
+    return cache.clave(
+        getattr(llm, "model_name", type(llm).__name__),
+        getattr(llm, "temperature", None),
+        getattr(llm, "seed", None),
+        chain.first.template,
+        entrada,
+    )
+
+
+def _invocar(chain, chunk):
+    with metricas.medir(metricas.SLIDE_SEGUNDOS, etapa="chunking"):
+        k = clave_llm(chain, {"chunk": chunk})
+        texto = llm_cache.get(k)
+        if texto is None:
+            texto = ratelimit.proveedor("openai_chat").llamar(
+                chain.invoke, {"chunk": chunk},
+                unidades=ratelimit.estimar_tokens(chain.first.template + chunk),
+            ).content.strip()
+            llm_cache.set(k, texto)
+    return texto
+
+
+def generar_textos(chunks, chain, chain_visual, max_concurrency=LLM_MAX_CONCURRENCY, progreso=None, guardar=None):
+    """Ejecuta ambas cadenas para todos los chunks con a lo sumo `max_concurrency`
+    llamadas en vuelo. Devuelve (texto_pantalla, prompt_imagen) en el orden de `chunks`.
+
+    `progreso(i)` se llama al terminar cada chunk, en orden; `guardar(i, par)`
+    recibe además sus textos (para el checkpoint).
+    """
+    textos = []
+    if max_concurrency <= 1:
+        for i, chunk in enumerate(chunks):
+            textos.append((_invocar(chain, chunk), _invocar(chain_visual, chunk)))
+            _terminado(i, textos[-1], progreso, guardar)
+        return textos
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+        titulos = [pool.submit(_invocar, chain, chunk) for chunk in chunks]
+        prompts = [pool.submit(_invocar, chain_visual, chunk) for chunk in chunks]
+        try:
+            for i, (t, p) in enumerate(zip(titulos, prompts)):
+                textos.append((t.result(), p.result()))
+                _terminado(i, textos[-1], progreso, guardar)
+        except BaseException:
+            # Un error o un job cancelado: lo que sigue en cola no arranca
+            pool.shutdown(cancel_futures=True)
+            raise
+    return textos
+
+
+def _terminado(i, par, progreso, guardar):
+    if guardar:
+        guardar(i, par)
+    if progreso:
+        progreso(i)
+
+
+def _extraer_json(contenido):
+    # Tolera bloques ```json ... ``` o texto alrededor del objeto
+    inicio, fin = contenido.find("{"), contenido.rfind("}")
+    if inicio == -1 or fin == -1:
+        raise ValueError("la respuesta no contiene un objeto JSON")
+    return json.loads(contenido[inicio:fin + 1])
+
+
+def validar_lote(contenido, indices):
+    """Valida la respuesta JSON de `prompt_lote`.
+
+    Devuelve {indice: (texto_pantalla, prompt_imagen)} solo con las entradas que
+    cumplen el esquema; los índices que falten se resuelven con el modo por chunk.
+    """
+    try:
+        datos = _extraer_json(contenido)
+    except ValueError:
+        return {}
+
+    items = datos.get("slides") if isinstance(datos, dict) else None
+    if not isinstance(items, list):
+        return {}
+
+    validos = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        indice = item.get("indice")
+        texto = item.get("texto_pantalla")
+        prompt = item.get("prompt_imagen")
+        if not isinstance(indice, int) or indice not in indices or indice in validos:
+            continue
+        if not isinstance(texto, str) or not texto.strip():
+            continue
+        if not isinstance(prompt, str) or not prompt.strip():
+            continue
+        validos[indice] = (texto.strip(), prompt.strip())
+    return validos
+
+
+def _invocar_lote(chain_lote, chunks, indices):
+    entrada = json.dumps([{"indice": i, "texto": chunks[i]} for i in indices], ensure_ascii=False, indent=1)
+    try:
+        respuesta = ratelimit.proveedor("openai_chat").llamar(
+            chain_lote.invoke, {"chunks_json": entrada},
+            unidades=ratelimit.estimar_tokens(chain_lote.first.template + entrada, respuesta=150 * len(indices)),
+        )
+    except Exception as e:
+        print(f"⚠️ Lote {indices[0]}-{indices[-1]} falló ({e}); se reintenta por chunk")
+        return {}
+    return validar_lote(respuesta.content, set(indices))
+
+
+def generar_textos_lote(chunks, chain_lote, chain, chain_visual,
+                        batch_size=LLM_BATCH_SIZE, max_concurrency=LLM_MAX_CONCURRENCY, progreso=None, guardar=None):
+    """Una llamada estructurada por cada `batch_size` chunks en lugar de 2 por chunk.
+
+    Lo que no pase la validación del esquema se regenera con `generar_textos`.
+    """
+    textos = {}
+    pendientes = []
+    for i, chunk in enumerate(chunks):
+        cacheado = llm_cache.get(clave_llm(chain_lote, {"chunk": chunk}))
+        if cacheado is None:
+            pendientes.append(i)
+        else:
+            textos[i] = tuple(cacheado)
+            _terminado(i, textos[i], progreso, guardar)
+
+    lotes = [pendientes[i:i + batch_size] for i in range(0, len(pendientes), batch_size)]
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(lotes)))) as pool:
+        try:
+            for resultado in pool.map(lambda indices: _invocar_lote(chain_lote, chunks, indices), lotes):
+                for i, par in resultado.items():
+                    llm_cache.set(clave_llm(chain_lote, {"chunk": chunks[i]}), list(par))
+                    _terminado(i, par, progreso, guardar)
+                textos.update(resultado)
+        except BaseException:
+            pool.shutdown(cancel_futures=True)
+            raise
+
+    fallidos = [i for i in range(len(chunks)) if i not in textos]
+    if fallidos:
+        print(f"⚠️ {len(fallidos)} chunks sin respuesta válida en modo lote; se generan por chunk")
+        respaldo = generar_textos(
+            [chunks[i] for i in fallidos], chain, chain_visual, max_concurrency,
+            progreso=(lambda j: progreso(fallidos[j])) if progreso else None,
+            guardar=(lambda j, par: guardar(fallidos[j], par)) if guardar else None,
+        )
+        textos.update(zip(fallidos, respaldo))
+
+    return [textos[i] for i in range(len(chunks))]
+
+
+def generar_slides(chunks, chain, chain_visual, max_concurrency=LLM_MAX_CONCURRENCY,
+                   modo="por_chunk", chain_lote=None, batch_size=LLM_BATCH_SIZE, progreso=None, indices=None,
+                   guardar=None):
+    """Genera los slides en el orden de `chunks` con el modo indicado.
+
+    `indices[j]` es la posición en el video del chunk j (por defecto j); sirve
+    para regenerar solo algunos slides de un proyecto ya existente.
+    """
+    if modo == "lote":
+        textos = generar_textos_lote(chunks, chain_lote, chain, chain_visual, batch_size, max_concurrency,
+                                     progreso, guardar)
+    else:
+        textos = generar_textos(chunks, chain, chain_visual, max_concurrency, progreso, guardar)
+    indices = indices or range(len(chunks))
+    return [
+        crear_slide(i, chunk, titulo, prompt)
+        for i, chunk, (titulo, prompt) in zip(indices, chunks, textos)
+    ]
+
+
+def generar_slides_guion(guion, llm, progreso=None, manifiesto=None):
+    """Divide el guion y genera sus slides con el modo configurado (LLM_MODE).
+
+    `progreso(i, total)` se llama cada vez que un slide tiene sus textos.
+    """
+    return generar_slides_chunks(splitter_script(guion), llm, progreso, manifiesto=manifiesto)
+
+
+def clave_textos(chunk):
+    return cache.clave(LLM_MODEL, TEMPLATE_TEXTO, TEMPLATE_VISUAL, chunk)
+
+
+def _archivo_textos(i):
+    return f"slide_{i + 1:04d}"
+
+
+def texto_guardado(manifiesto, i, chunk, campo):
+    """`campo` del slide i si una corrida anterior ya lo generó para este mismo chunk."""
+    datos = manifiesto.vigente(campo, _archivo_textos(i), clave_textos(chunk)) if manifiesto else None
+    return datos["texto"] if datos else None
+
+
+def guardar_texto(manifiesto, i, chunk, campo, texto):
+    if manifiesto:
+        manifiesto.marcar(campo, _archivo_textos(i), clave_textos(chunk), texto=texto)
+
+
+def generar_slides_chunks(chunks, llm, progreso=None, indices=None, manifiesto=None):
+    """Como `generar_slides`, con el modo configurado y saltando los textos que ya están en `manifiesto`."""
+    indices = list(indices) if indices is not None else list(range(len(chunks)))
+    slides, faltan = {}, []
+    for j, (i, chunk) in enumerate(zip(indices, chunks)):
+        titulo = texto_guardado(manifiesto, i, chunk, "texto_pantalla")
+        prompt = texto_guardado(manifiesto, i, chunk, "prompt_imagen")
+        if titulo is None or prompt is None:
+            faltan.append(j)
+            continue
+        slides[j] = crear_slide(i, chunk, titulo, prompt)
+        if progreso:
+            progreso(j, len(chunks))
+
+    def guardar(k, par):
+        i, chunk = indices[faltan[k]], chunks[faltan[k]]
+        guardar_texto(manifiesto, i, chunk, "texto_pantalla", par[0])
+        guardar_texto(manifiesto, i, chunk, "prompt_imagen", par[1])
+
+    nuevos = generar_slides(
+        [chunks[j] for j in faltan],
+        plantilla_prompt("prompt_template") | llm,
+        plantilla_prompt("prompt_visual") | llm,
+        modo=LLM_MODE,
+        chain_lote=plantilla_prompt("prompt_lote") | llm,
+        progreso=(lambda k: progreso(faltan[k], len(chunks))) if progreso else None,
+        indices=[indices[j] for j in faltan],
+        guardar=guardar if manifiesto else None,
+    )
+    slides.update(zip(faltan, nuevos))
+    return [slides[j] for j in range(len(chunks))]
+
+
+def reporte_cache():
+    st = llm_cache.stats()
+    return f"Caché LLM: {st['hits']} aciertos, {st['misses']} fallos"
+
+
+def main():
+    proyecto = workspace.Proyecto(PROYECTO, workspace.BASE_DIR / PROYECTO)
+    resultado_slides = generar_slides_guion(GUION, clientes.llm(), manifiesto=checkpoint.Manifiesto(proyecto.dir))
+
+    workspace.guardar_slides(proyecto, resultado_slides)
+    workspace.guardar_config(proyecto)
 
-with open(f"{PROYECTO}/slides.json", "w", encoding="utf-8") as f:
-    json.dump(resultado_slides, f, ensure_ascii=False, indent=4)
+    if llm_cache.activa:
+        print(reporte_cache())
+        llm_cache.evict()
 
-with open("config.json", "w", encoding="utf-8") as f:
-    json.dump({"nombre_proyecto": PROYECTO}, f, indent=4)
+    print(f"✅ Chunking")
 
-print(f"✅ Chunking")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
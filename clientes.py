@@ -0,0 +1,84 @@
+"""Clientes HTTP y de API compartidos por todas las etapas del proceso.
+
+Cada proceso arma una sola vez sus pools de conexiones: una `requests.Session`
+para descargas, un cliente httpx para el SDK de OpenAI (chat e imágenes van al
+mismo host y comparten conexiones) y otro para ElevenLabs. Así el handshake TCP
+y TLS se paga una vez por proceso (por worker) y no una por imagen o audio.
+
+`llm()`, `cliente_openai()` y `cliente_tts()` devuelven los clientes de API
+ya creados; el runner y los `main()` de las etapas los piden acá, así que en
+un mismo proceso todas las etapas usan los mismos.
+
+Todos los timeouts son explícitos (ver README): conexión y lectura por separado.
+"""
+import os
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:  # solo para las anotaciones: requests se importa al crear la sesión
+    import requests
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+# Lectura: una imagen de DALL·E o un audio largo pueden tardar bastante en empezar a llegar
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "120"))
+# Conexiones keep-alive por pool; alcanza con cubrir la concurrencia de las etapas
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+
+
+def timeout_requests(lectura: float = None) -> tuple:
+    """(conexión, lectura) para requests."""
+    return HTTP_CONNECT_TIMEOUT, lectura or HTTP_READ_TIMEOUT
+
+
+@lru_cache(maxsize=None)
+def sesion() -> "requests.Session":
+    """Session de requests con pool keep-alive, para descargar las imágenes generadas."""
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    s = requests.Session()
+    # Los reintentos los coordina ratelimit / el manifiesto, no urllib3
+    adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE, max_retries=0)
+    s.mount("https://", adaptador)
+    s.mount("http://", adaptador)
+    return s
+
+
+def timeout_openai():
+    import openai
+    return openai.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+
+
+@lru_cache(maxsize=None)
+def http_openai():
+    """Cliente httpx del SDK de OpenAI (DefaultHttpxClient conserva sus límites y redirecciones)."""
+    import openai
+    return openai.DefaultHttpxClient(timeout=timeout_openai())
+
+
+@lru_cache(maxsize=None)
+def http_elevenlabs():
+    import httpx
+    return httpx.Client(
+        timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        limits=httpx.Limits(max_connections=HTTP_POOL_SIZE, max_keepalive_connections=HTTP_POOL_SIZE),
+        follow_redirects=True,
+    )
+
+
+@lru_cache(maxsize=None)
+def llm():
+    import chunking
+    return chunking.crear_llm()
+
+
+@lru_cache(maxsize=None)
+def cliente_openai():
+    import image_gen
+    return image_gen.crear_cliente()
+
+
+@lru_cache(maxsize=None)
+def cliente_tts():
+    import voice_gen
+    return voice_gen.crear_cliente()
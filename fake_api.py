@@ -0,0 +1,173 @@
+"""Servidor local que imita las APIs de OpenAI y ElevenLabs con límites de tasa.
+
+Sirve para probar `ratelimit` sin gastar: responde 429 con Retry-After cuando
+se supera `--rpm` (ventana deslizante de un minuto por API) y, además, con
+probabilidad `--prob-429`. Las respuestas son deterministas (ver fakes.py).
+
+    python fake_api.py --puerto 8099 --rpm 30 --prob-429 0.1
+    OPENAI_BASE_URL=http://127.0.0.1:8099/v1 ELEVENLABS_BASE_URL=http://127.0.0.1:8099 python app.py
+
+Rutas: POST /v1/chat/completions, POST /v1/images/generations,
+GET /img/<n>.jpg y POST /v1/text-to-speech/<voice_id>[/stream].
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import fakes
+from fakes import SEGUNDOS_POR_CARACTER
+
+
+class ServidorFake:
+    def __init__(self, puerto=0, rpm=60, prob_429=0.0, latencia=0.05, semilla=0):
+        self.rpm = rpm
+        self.prob_429 = prob_429
+        self.latencia = latencia
+        self.pedidos = defaultdict(int)
+        self.rechazados = defaultdict(int)
+        self._ventanas = defaultdict(deque)
+        self._azar = random.Random(semilla)
+        self._lock = threading.Lock()
+        self._imagenes = {}
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", puerto), self._handler())
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.httpd.server_port}"
+
+    def iniciar(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def detener(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def registrar_imagen(self, prompt, size) -> str:
+        """URL en la que este servidor entrega el JPEG sintético de `prompt`."""
+        with self._lock:
+            n = len(self._imagenes)
+            self._imagenes[n] = (prompt, size)
+        return f"{self.url}/img/{n}.jpg"
+
+    def _admitir(self, api):
+        """None si se admite el pedido; si no, los segundos de Retry-After."""
+        ahora = time.monotonic()
+        with self._lock:
+            self.pedidos[api] += 1
+            ventana = self._ventanas[api]
+            while ventana and ahora - ventana[0] >= 60:
+                ventana.popleft()
+            if self.rpm and len(ventana) >= self.rpm:
+                self.rechazados[api] += 1
+                return max(1, math.ceil(60 - (ahora - ventana[0])))
+            if self.prob_429 and self._azar.random() < self.prob_429:
+                self.rechazados[api] += 1
+                return 1
+            ventana.append(ahora)
+            return None
+
+    def _handler(self):
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _responder(self, estado, cuerpo: bytes, tipo="application/json", headers=None):
+                self.send_response(estado)
+                self.send_header("Content-Type", tipo)
+                self.send_header("Content-Length", str(len(cuerpo)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(cuerpo)
+
+            def _json(self, estado, datos, headers=None):
+                self._responder(estado, json.dumps(datos, ensure_ascii=False).encode("utf-8"), headers=headers)
+
+            def _leer(self):
+                largo = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(largo) or b"{}")
+
+            def _limitar(self, api):
+                espera = servidor._admitir(api)
+                if espera is None:
+                    time.sleep(servidor.latencia)
+                    return False
+                self._json(429, {"error": {"message": "Rate limit reached (fake)", "type": "requests",
+                                           "code": "rate_limit_exceeded"}},
+                           headers={"Retry-After": str(espera)})
+                return True
+
+            def do_POST(self):
+                datos = self._leer()
+                if self.path.startswith("/v1/chat/completions"):
+                    if self._limitar("chat"):
+                        return
+                    prompt = (datos.get("messages") or [{}])[-1].get("content", "")
+                    texto = fakes.responder(prompt)
+                    self._json(200, {
+                        "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()),
+                        "model": datos.get("model", "fake"),
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": texto}}],
+                        "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(texto) // 4,
+                                  "total_tokens": (len(prompt) + len(texto)) // 4},
+                    })
+                elif self.path.startswith("/v1/images/generations"):
+                    if self._limitar("images"):
+                        return
+                    url = servidor.registrar_imagen(datos.get("prompt", ""), datos.get("size", "1792x1024"))
+                    self._json(200, {"created": int(time.time()), "data": [{"url": url}]})
+                elif self.path.startswith("/v1/text-to-speech/"):
+                    if self._limitar("tts"):
+                        return
+                    segundos = max(0.5, len(datos.get("text", "")) * SEGUNDOS_POR_CARACTER)
+                    self._responder(200, fakes.mp3_sintetico(segundos), tipo="audio/mpeg")
+                else:
+                    self._json(404, {"error": {"message": f"ruta desconocida {self.path}"}})
+
+            def do_GET(self):
+                if self.path.startswith("/img/"):
+                    try:
+                        prompt, size = servidor._imagenes[int(self.path[5:].split(".")[0])]
+                    except (KeyError, ValueError):
+                        return self._json(404, {"error": {"message": "imagen desconocida"}})
+                    ancho, alto = (int(x) for x in size.split("x"))
+                    self._responder(200, fakes.jpeg_sintetico(ancho, alto, prompt), tipo="image/jpeg")
+                else:
+                    self._json(404, {"error": {"message": f"ruta desconocida {self.path}"}})
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--puerto", type=int, default=8099)
+    parser.add_argument("--rpm", type=int, default=60, help="pedidos por minuto admitidos por API (0 = sin límite)")
+    parser.add_argument("--prob-429", type=float, default=0.0, help="probabilidad de 429 aleatorio")
+    parser.add_argument("--latencia", type=float, default=0.05)
+    args = parser.parse_args()
+
+    servidor = ServidorFake(args.puerto, args.rpm, args.prob_429, args.latencia)
+    print(f"API falsa en {servidor.url} (rpm={args.rpm}, prob_429={args.prob_429})")
+    try:
+        servidor.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        resumen = {api: (servidor.pedidos[api], servidor.rechazados[api]) for api in servidor.pedidos}
+        print(f"pedidos/rechazados por API: {resumen}")
+
+
+if __name__ == "__main__":
+    main()
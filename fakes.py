@@ -0,0 +1,227 @@
+"""Proveedores falsos para medir el pipeline sin llamar a las APIs reales.
+
+Con PROVIDERS=fake, `chunking.crear_llm`, `image_gen.crear_cliente` y
+`voice_gen.crear_cliente` devuelven estos fakes en lugar de los clientes de
+OpenAI y ElevenLabs. Son deterministas: el mismo texto da la misma respuesta,
+la misma imagen y el mismo audio, y los errores simulados caen siempre en los
+mismos pedidos (por texto e intento), sin importar el orden de los hilos.
+
+    PROVIDERS=fake FAKE_LATENCY=0.2 FAKE_ERROR_RATE=0.05 python app.py
+"""
+import json
+import os
+import threading
+import time
+import types
+import zlib
+from collections import defaultdict
+from functools import lru_cache
+from typing import Any
+
+_lock = threading.Lock()
+
+
+def _huella(texto: str) -> str:
+    return f"#{zlib.crc32(texto.encode('utf-8')) % 10000:04d}"
+
+
+# PROVIDERS=fake: todas las etapas usan los fakes de este módulo
+ACTIVOS = os.getenv("PROVIDERS", "real") == "fake"
+LATENCIA = float(os.getenv("FAKE_LATENCY", "0.05"))
+PROB_ERROR = float(os.getenv("FAKE_ERROR_RATE", "0"))
+SEMILLA = int(os.getenv("FAKE_SEED", "0"))
+SEGUNDOS_POR_CARACTER = 0.06
+
+
+class ErrorFake(Exception):
+    """Error transitorio simulado; `ratelimit` lo reintenta igual que un 429/503 real."""
+
+    def __init__(self, status_code=503, retry_after_ms=100):
+        super().__init__(f"Error simulado {status_code} (fake)")
+        self.status_code = status_code
+        self.headers = {"retry-after-ms": str(retry_after_ms)}
+
+
+class Fallas:
+    """Decide de forma determinista qué pedidos fallan: por (semilla, texto, número de intento)."""
+
+    def __init__(self, prob=0.0, semilla=0):
+        self.prob = prob
+        self.semilla = semilla
+        self.errores = 0
+        self._intentos = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def verificar(self, texto: str):
+        if not self.prob:
+            return
+        with self._lock:
+            intento = self._intentos[texto]
+            self._intentos[texto] += 1
+        if zlib.crc32(f"{self.semilla}:{intento}:{texto}".encode("utf-8")) / 2**32 < self.prob:
+            with self._lock:
+                self.errores += 1
+            raise ErrorFake(429 if intento % 2 == 0 else 503)
+
+
+@lru_cache(maxsize=None)
+def _clase_chat():
+    """FakeChatModel se define al primer uso: langchain_core tarda en importarse."""
+    from langchain_core.language_models.chat_models import SimpleChatModel
+
+    class FakeChatModel(SimpleChatModel):
+        """Chat model determinista con latencia fija por llamada.
+
+        Responde siempre lo mismo para el mismo prompt, así que sirve para comparar
+        modos de ejecución (secuencial, concurrente, por lotes) sin gastar tokens.
+        Si el prompt trae una lista JSON de fragmentos (modo lote de chunking.py)
+        responde con el JSON estructurado que ese modo espera.
+        """
+
+        latencia: float = 0.5
+        respuesta: str = "Texto generado sin conexión"
+        llamadas: int = 0
+        fallas: Any = None
+
+        @property
+        def _llm_type(self) -> str:
+            return "fake-chat-model"
+
+        def _call(self, messages, stop=None, run_manager=None, **kwargs: Any) -> str:
+            with _lock:
+                self.llamadas += 1
+            if self.latencia > 0:
+                time.sleep(self.latencia)
+            prompt = messages[-1].content if messages else ""
+            if self.fallas:
+                self.fallas.verificar(prompt)
+            return responder(prompt, self.respuesta)
+
+    return FakeChatModel
+
+
+def __getattr__(nombre):
+    if nombre == "FakeChatModel":
+        return _clase_chat()
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
+
+
+class FakeOpenAI:
+    """Cliente con la forma de `OpenAI` para `images.generate`.
+
+    Devuelve una URL a un servidor HTTP local (fake_api.py, sin límites) que
+    sirve un JPEG sintético del tamaño pedido, así que la descarga de
+    image_gen se ejercita igual que con DALL·E.
+    """
+
+    def __init__(self, latencia=0.05, fallas=None):
+        self.latencia = latencia
+        self.fallas = fallas
+        self.llamadas = 0
+        self.images = types.SimpleNamespace(generate=self._generar)
+        self._servidor = None
+        self._lock = threading.Lock()
+
+    def _url_imagen(self, prompt, size):
+        with self._lock:
+            if self._servidor is None:
+                import fake_api  # fake_api importa este módulo
+                self._servidor = fake_api.ServidorFake(rpm=0, latencia=0).iniciar()
+            self.llamadas += 1
+        return self._servidor.registrar_imagen(prompt, size)
+
+    def _generar(self, model=None, prompt="", size="1792x1024", quality=None, n=1, **kwargs):
+        if self.latencia > 0:
+            time.sleep(self.latencia)
+        if self.fallas:
+            self.fallas.verificar(prompt)
+        url = self._url_imagen(prompt, size)
+        return types.SimpleNamespace(data=[types.SimpleNamespace(url=url, revised_prompt=prompt)])
+
+
+class FakeElevenLabs:
+    """Cliente con la forma de `ElevenLabs` para `text_to_speech.convert`: MP3 válido de
+    SEGUNDOS_POR_CARACTER por carácter, entregado en bloques como el stream real."""
+
+    def __init__(self, latencia=0.05, fallas=None):
+        self.latencia = latencia
+        self.fallas = fallas
+        self.llamadas = 0
+        self.text_to_speech = types.SimpleNamespace(convert=self._convertir)
+        self._lock = threading.Lock()
+
+    def _convertir(self, text="", **kwargs):
+        if self.latencia > 0:
+            time.sleep(self.latencia)
+        if self.fallas:
+            self.fallas.verificar(text)
+        with self._lock:
+            self.llamadas += 1
+        datos = mp3_sintetico(max(0.5, len(text) * SEGUNDOS_POR_CARACTER))
+        return (datos[i:i + 4096] for i in range(0, len(datos), 4096))
+
+
+def _fallas():
+    return Fallas(PROB_ERROR, SEMILLA)
+
+
+def llm():
+    return _clase_chat()(latencia=LATENCIA, fallas=_fallas())
+
+
+def cliente_openai():
+    return FakeOpenAI(latencia=LATENCIA, fallas=_fallas())
+
+
+def cliente_tts():
+    return FakeElevenLabs(latencia=LATENCIA, fallas=_fallas())
+
+
+def responder(prompt: str, respuesta: str = "Texto generado sin conexión") -> str:
+    """Respuesta determinista para `prompt`; JSON estructurado si es un prompt de lote."""
+    lote = _leer_lote(prompt)
+    if lote is not None:
+        return json.dumps({"slides": [
+            {
+                "indice": item["indice"],
+                "texto_pantalla": f"{respuesta} {_huella(item['texto'])}",
+                "prompt_imagen": f"Ilustración de: {item['texto'][:80]}",
+            }
+            for item in lote
+        ]}, ensure_ascii=False)
+    return f"{respuesta} {_huella(prompt)}"
+
+
+def _leer_lote(prompt):
+    inicio, fin = prompt.find("\n["), prompt.rfind("]")
+    if inicio == -1 or fin < inicio:
+        return None
+    try:
+        lote = json.loads(prompt[inicio + 1:fin + 1])
+    except ValueError:
+        return None
+    if isinstance(lote, list) and all(isinstance(x, dict) and "indice" in x for x in lote):
+        return lote
+    return None
+
+
+def mp3_sintetico(segundos: float) -> bytes:
+    """MP3 válido (MPEG-1 Layer III, 128 kbps, 44.1 kHz) de silencio que dura `segundos`."""
+    frames = max(1, round(segundos * 44100 / 1152))
+    datos = bytearray()
+    for i in range(frames):
+        # Relleno cada tres frames, como un encoder real a 128 kbps / 44.1 kHz
+        relleno = 1 if i % 3 == 0 else 0
+        datos += bytes([0xFF, 0xFB, 0x90 | (relleno << 1), 0x64])
+        datos += bytes(144 * 128000 // 44100 + relleno - 4)
+    return bytes(datos)
+
+
+def jpeg_sintetico(ancho: int, alto: int, semilla: str = "") -> bytes:
+    """JPEG de `ancho`x`alto` con un color derivado de `semilla` (mismo texto, misma imagen)."""
+    import io
+    from PIL import Image
+    h = zlib.crc32(semilla.encode("utf-8"))
+    buf = io.BytesIO()
+    Image.new("RGB", (ancho, alto), (h & 0xFF, (h >> 8) & 0xFF, (h >> 16) & 0xFF)).save(buf, "JPEG", quality=85)
+    return buf.getvalue()
@@ -1,9 +1,18 @@
+import copy
+import functools
+import io
+import itertools
 import json
+import re
 import uuid
 from pathlib import Path
 import xml.etree.ElementTree as ET
 from xml.dom import minidom
 
+import cache
+import subtitle_gen
+import workspace
+
 FPS_DEFAULT = 30
 WIDTH_DEFAULT = 1080
 HEIGHT_DEFAULT = 1350
@@ -22,30 +31,118 @@ def prettify(xml_root: ET.Element) -> str:
     rough = ET.tostring(xml_root, encoding="utf-8", xml_declaration=False)
     return minidom.parseString(rough).toprettyxml(indent="\t", encoding="UTF-8").decode("utf-8")
 
-ROOT = Path(__file__).resolve().parent
-CONFIG_PATH = ROOT / "config.json"
-if not CONFIG_PATH.exists():
-    raise FileNotFoundError(f"No se encontró config.json en {CONFIG_PATH}")
-
-config = json.loads(CONFIG_PATH.read_text(encoding="utf-8"))
-PROYECTO = config.get("nombre_proyecto")
-if not PROYECTO:
-    raise ValueError("config.json debe incluir 'nombre_proyecto'")
-
-PROJ_DIR = ROOT / PROYECTO
-IMGS_DIR = PROJ_DIR / "IMGS"
-VOICE_DIR = PROJ_DIR / "VOICE"
-SLIDES_PATH = PROJ_DIR / "slides.json"
-if not SLIDES_PATH.exists():
-    alt = ROOT / "slides.json"
-    if alt.exists():
-        SLIDES_PATH = alt
+def centro(ubicacion: dict) -> tuple:
+    """Center de Basic Motion para un recuadro del cuadro: desde el centro del cuadro,
+    en fracciones de su ancho/alto (±0.5 es el borde)."""
+    return (round((ubicacion["x"] + ubicacion["ancho"] / 2 - WIDTH_DEFAULT / 2) / WIDTH_DEFAULT, 7),
+            round((ubicacion["y"] + ubicacion["alto"] / 2 - HEIGHT_DEFAULT / 2) / HEIGHT_DEFAULT, 7))
+
+def add_posicion(clip, horiz, vert):
+    """Basic Motion a escala 100 que lleva un PNG recortado a su lugar en el cuadro (ver `centro`)."""
+    filt = ET.SubElement(clip, "filter")
+    eff = ET.SubElement(filt, "effect")
+    add_text(eff, "name", "Basic Motion")
+    add_text(eff, "effectid", "basic")
+    add_text(eff, "effectcategory", "motion")
+    add_text(eff, "effecttype", "motion")
+    add_text(eff, "mediatype", "video")
+    add_text(eff, "pproBypass", "false")
+
+    p_scale = ET.SubElement(eff, "parameter", {"authoringApp": "PremierePro"})
+    add_text(p_scale, "parameterid", "scale")
+    add_text(p_scale, "name", "Scale")
+    add_text(p_scale, "valuemin", 0)
+    add_text(p_scale, "valuemax", 1000)
+    add_text(p_scale, "value", 100)
+
+    p_rot = ET.SubElement(eff, "parameter", {"authoringApp": "PremierePro"})
+    add_text(p_rot, "parameterid", "rotation")
+    add_text(p_rot, "name", "Rotation")
+    add_text(p_rot, "valuemin", -8640)
+    add_text(p_rot, "valuemax", 8640)
+    add_text(p_rot, "value", 0)
+
+    p_center = ET.SubElement(eff, "parameter", {"authoringApp": "PremierePro"})
+    add_text(p_center, "parameterid", "center")
+    add_text(p_center, "name", "Center")
+    val = ET.SubElement(p_center, "value")
+    add_text(val, "horiz", horiz)
+    add_text(val, "vert", vert)
+
+    p_anchor = ET.SubElement(eff, "parameter", {"authoringApp": "PremierePro"})
+    add_text(p_anchor, "parameterid", "centerOffset")
+    add_text(p_anchor, "name", "Anchor Point")
+    val_anchor = ET.SubElement(p_anchor, "value")
+    add_text(val_anchor, "horiz", 0)
+    add_text(val_anchor, "vert", 0)
+
+    p_af = ET.SubElement(eff, "parameter", {"authoringApp": "PremierePro"})
+    add_text(p_af, "parameterid", "antiflicker")
+    add_text(p_af, "name", "Anti-flicker Filter")
+    add_text(p_af, "valuemin", 0.0)
+    add_text(p_af, "valuemax", 1.0)
+    add_text(p_af, "value", 0)
+
+def add_parametro(eff, parameterid, name, value, valuemin=None, valuemax=None):
+    param = ET.SubElement(eff, "parameter")
+    add_text(param, "parameterid", parameterid)
+    add_text(param, "name", name)
+    if valuemin is not None:
+        add_text(param, "valuemin", valuemin)
+        add_text(param, "valuemax", valuemax)
+    if isinstance(value, dict):
+        val = ET.SubElement(param, "value")
+        for tag, v in value.items():
+            add_text(val, tag, v)
     else:
-        raise FileNotFoundError(f"No se encontró slides.json en {PROYECTO} ni en la raíz")
+        add_text(param, "value", value)
+    return param
+
+def add_titulo(track, idx: int, texto: str, frames: int, start: int):
+    """Título de texto editable (generador "Text" de xmeml) en lugar del PNG del subtítulo.
+
+    Fuente, tamaño y cortes de línea salen del mismo layout que subtitle_gen
+    usa para rasterizar; el título queda centrado sobre donde iría el recuadro.
+    """
+    t = subtitle_gen.titulo(texto)
+    gen = ET.SubElement(track, "generatoritem", {"id": f"titulo-{idx}"})
+    add_text(gen, "name", t["texto"].split("\n")[0][:40] or "Texto")
+    add_text(gen, "enabled", "TRUE")
+    add_text(gen, "duration", frames)
+    gr = ET.SubElement(gen, "rate"); add_text(gr, "timebase", int(FPS_DEFAULT)); add_text(gr, "ntsc", "FALSE")
+    add_text(gen, "start", start)
+    add_text(gen, "end", start + frames)
+    add_text(gen, "in", 0)
+    add_text(gen, "out", frames)
+    add_text(gen, "anamorphic", "FALSE")
+    add_text(gen, "alphatype", "black")
+
+    eff = ET.SubElement(gen, "effect")
+    add_text(eff, "name", "Text")
+    add_text(eff, "effectid", "Text")
+    add_text(eff, "effectcategory", "Text")
+    add_text(eff, "effecttype", "generator")
+    add_text(eff, "mediatype", "video")
+    add_parametro(eff, "str", "Text", t["texto"])
+    add_parametro(eff, "fontname", "Font", t["fuente"])
+    add_parametro(eff, "fontsize", "Size", t["tamano"], 0, 1000)
+    add_parametro(eff, "fontstyle", "Style", 1, 1, 4)
+    add_parametro(eff, "fontalign", "Alignment", 2, 1, 3)
+    r, g, b, a = subtitle_gen.TEXT_FILL
+    add_parametro(eff, "fontcolor", "Font Color", {"alpha": a, "red": r, "green": g, "blue": b})
+    horiz, vert = centro(t)
+    add_parametro(eff, "origin", "Origin", {"horiz": horiz, "vert": vert})
+    add_parametro(eff, "tracking", "Tracking", 0, -200, 200)
+    add_parametro(eff, "leading", "Leading", t["interlineado"], -100, 100)
+    add_parametro(eff, "aspect", "Aspect", 1, 0.1, 5)
+    add_parametro(eff, "autokern", "Auto Kerning", "TRUE")
+    add_parametro(eff, "subpixel", "Use Subpixel", "TRUE")
+    return gen
 
-slides = json.loads(SLIDES_PATH.read_text(encoding="utf-8"))
+ROOT = Path(__file__).resolve().parent
 
-def build_sequence(project_name: str, slides: list) -> ET.Element:
+def _esqueleto(project_name: str, slides: list):
+    """La secuencia sin clips: todo lo que no depende de cada slide, con sus tres pistas vacías."""
     xmeml = ET.Element("xmeml", {"version": "4"})
     sequence = ET.SubElement(xmeml, "sequence", {
         "id": f"sequence-{uuid.uuid4()}",
@@ -156,183 +253,6 @@ def build_sequence(project_name: str, slides: list) -> ET.Element:
         "premiereTrackType": "Stereo"
     })
 
-    current_start_frames = 0
-    for idx, slide in enumerate(slides, start=1):
-        img_name = slide.get("nombre_imagen")
-        frames = int(slide.get("duracion_frames", 0))
-        voice_name = slide.get("nombre_audio") or None
-
-        if not img_name or frames <= 0:
-            raise ValueError(f"Slide {idx} sin nombre_imagen o duracion_frames inválida.")
-
-        img_path = (IMGS_DIR / img_name).resolve()
-        a_path = (VOICE_DIR / voice_name).resolve() if voice_name else None
-
-        vclip = ET.SubElement(vtrack, "clipitem", {"id": f"vclip-{idx}"})
-        add_text(vclip, "masterclipid", f"masterclip-v-{idx}")
-        add_text(vclip, "name", img_path.name)
-        add_text(vclip, "enabled", "TRUE")
-        add_text(vclip, "duration", frames)
-        vr = ET.SubElement(vclip, "rate"); add_text(vr, "timebase", int(FPS_DEFAULT)); add_text(vr, "ntsc", "FALSE")
-        add_text(vclip, "start", current_start_frames)
-        add_text(vclip, "end", current_start_frames + frames)
-        add_text(vclip, "in", 0)
-        add_text(vclip, "out", frames)
-        add_text(vclip, "alphatype", "none")
-        add_text(vclip, "pixelaspectratio", "square")
-        add_text(vclip, "anamorphic", "FALSE")
-
-        filt = ET.SubElement(vclip, "filter")
-        eff = ET.SubElement(filt, "effect")
-        add_text(eff, "name", "Basic Motion")
-        add_text(eff, "effectid", "basic")
-        add_text(eff, "effectcategory", "motion")
-        add_text(eff, "effecttype", "motion")
-        add_text(eff, "mediatype", "video")
-        add_text(eff, "pproBypass", "false")
-
-        p_scale = ET.SubElement(eff, "parameter", {"authoringApp": "PremierePro"})
-        add_text(p_scale, "parameterid", "scale")
-        add_text(p_scale, "name", "Scale")
-        add_text(p_scale, "valuemin", 0)
-        add_text(p_scale, "valuemax", 1000)
-        add_text(p_scale, "value", 133)
-
-        p_rot = ET.SubElement(eff, "parameter", {"authoringApp": "PremierePro"})
-        add_text(p_rot, "parameterid", "rotation")
-        add_text(p_rot, "name", "Rotation")
-        add_text(p_rot, "valuemin", -8640)
-        add_text(p_rot, "valuemax", 8640)
-        add_text(p_rot, "value", 0)
-
-        p_center = ET.SubElement(eff, "parameter", {"authoringApp": "PremierePro"})
-        add_text(p_center, "parameterid", "center")
-        add_text(p_center, "name", "Center")
- 
-        val = ET.SubElement(p_center, "value")
-        add_text(val, "horiz", -0.0279018)
-        add_text(val, "vert", 0)
-
-        kf1 = ET.SubElement(p_center, "keyframe")
-        add_text(kf1, "when", 0)
-        v1 = ET.SubElement(kf1, "value")
-        add_text(v1, "horiz", -0.0223214)
-        add_text(v1, "vert", 0)
-
-        kf2 = ET.SubElement(p_center, "keyframe")
-        add_text(kf2, "when", frames - 1)
-        v2 = ET.SubElement(kf2, "value")
-        add_text(v2, "horiz", 0.0502232)
-        add_text(v2, "vert", 0)
-
-        p_anchor = ET.SubElement(eff, "parameter", {"authoringApp": "PremierePro"})
-        add_text(p_anchor, "parameterid", "centerOffset")
-        add_text(p_anchor, "name", "Anchor Point")
-        val_anchor = ET.SubElement(p_anchor, "value")
-        add_text(val_anchor, "horiz", 0)
-        add_text(val_anchor, "vert", 0)
-
-        p_af = ET.SubElement(eff, "parameter", {"authoringApp": "PremierePro"})
-        add_text(p_af, "parameterid", "antiflicker")
-        add_text(p_af, "name", "Anti-flicker Filter")
-        add_text(p_af, "valuemin", 0.0)
-        add_text(p_af, "valuemax", 1.0)
-        add_text(p_af, "value", 0)
-
-        vfile = ET.SubElement(vclip, "file", {"id": f"vfile-{idx}"})
-        add_text(vfile, "name", img_path.name)
-        add_text(vfile, "pathurl", file_url(img_path))
-        vfr = ET.SubElement(vfile, "rate"); add_text(vfr, "timebase", int(FPS_DEFAULT)); add_text(vfr, "ntsc", "TRUE")
-        vtc = ET.SubElement(vfile, "timecode")
-        vtr = ET.SubElement(vtc, "rate"); add_text(vtr, "timebase", int(FPS_DEFAULT)); add_text(vtr, "ntsc", "TRUE")
-        add_text(vtc, "string", "00;00;00;00")
-        add_text(vtc, "frame", 0)
-        add_text(vtc, "displayformat", "DF")
-        vmedia = ET.SubElement(vfile, "media")
-        vvid = ET.SubElement(vmedia, "video")
-        vs = ET.SubElement(vvid, "samplecharacteristics")
-        vr2 = ET.SubElement(vs, "rate"); add_text(vr2, "timebase", int(FPS_DEFAULT)); add_text(vr2, "ntsc", "TRUE")
-        add_text(vs, "width", int(WIDTH_DEFAULT))
-        add_text(vs, "height", int(HEIGHT_DEFAULT))
-        add_text(vs, "anamorphic", "FALSE")
-        add_text(vs, "pixelaspectratio", "square")
-        add_text(vs, "fielddominance", "none")
-
-
-        sub_path = (PROJ_DIR / "SUBS" / f"sub_{idx:04d}.png").resolve()
-        if sub_path.exists():
-            sclip = ET.SubElement(vtrack2, "clipitem", {"id": f"sclip-{idx}"})
-            add_text(sclip, "masterclipid", f"masterclip-s-{idx}")
-            add_text(sclip, "name", sub_path.name)
-            add_text(sclip, "enabled", "TRUE")
-            add_text(sclip, "duration", frames)
-            sr = ET.SubElement(sclip, "rate"); add_text(sr, "timebase", int(FPS_DEFAULT)); add_text(sr, "ntsc", "FALSE")
-            add_text(sclip, "start", current_start_frames)
-            add_text(sclip, "end", current_start_frames + frames)
-            add_text(sclip, "in", 0)
-            add_text(sclip, "out", frames)
-            add_text(sclip, "alphatype", "none")
-            add_text(sclip, "pixelaspectratio", "square")
-            add_text(sclip, "anamorphic", "FALSE")
-
-            sfile = ET.SubElement(sclip, "file", {"id": f"sfile-{idx}"})
-            add_text(sfile, "name", sub_path.name)
-            add_text(sfile, "pathurl", file_url(sub_path))
-            sfr = ET.SubElement(sfile, "rate"); add_text(sfr, "timebase", int(FPS_DEFAULT)); add_text(sfr, "ntsc", "TRUE")
-            stc = ET.SubElement(sfile, "timecode")
-            strt = ET.SubElement(stc, "rate"); add_text(strt, "timebase", int(FPS_DEFAULT)); add_text(strt, "ntsc", "TRUE")
-            add_text(stc, "string", "00;00;00;00")
-            add_text(stc, "frame", 0)
-            add_text(stc, "displayformat", "DF")
-            smedia = ET.SubElement(sfile, "media")
-            svid = ET.SubElement(smedia, "video")
-            ssamp = ET.SubElement(svid, "samplecharacteristics")
-            sr2 = ET.SubElement(ssamp, "rate"); add_text(sr2, "timebase", int(FPS_DEFAULT)); add_text(sr2, "ntsc", "TRUE")
-            add_text(ssamp, "width", int(WIDTH_DEFAULT))
-            add_text(ssamp, "height", int(HEIGHT_DEFAULT))
-            add_text(ssamp, "anamorphic", "FALSE")
-            add_text(ssamp, "pixelaspectratio", "square")
-            add_text(ssamp, "fielddominance", "none")
-
-        if a_path and a_path.exists():
-            aclip = ET.SubElement(atrack, "clipitem", {"id": f"aclip-{idx}", "premiereChannelType": "stereo"})
-            add_text(aclip, "masterclipid", f"masterclip-a-{idx}")
-            add_text(aclip, "name", a_path.name)
-            add_text(aclip, "enabled", "TRUE")
-            add_text(aclip, "duration", frames)
-            ar = ET.SubElement(aclip, "rate"); add_text(ar, "timebase", int(FPS_DEFAULT)); add_text(ar, "ntsc", "FALSE")
-            add_text(aclip, "start", current_start_frames)
-            add_text(aclip, "end", current_start_frames + frames)
-            add_text(aclip, "in", 0)
-            add_text(aclip, "out", frames)
-
-            afile = ET.SubElement(aclip, "file", {"id": f"afile-{idx}"})
-            add_text(afile, "name", a_path.name)
-            add_text(afile, "pathurl", file_url(a_path))
-            afr = ET.SubElement(afile, "rate"); add_text(afr, "timebase", int(FPS_DEFAULT)); add_text(afr, "ntsc", "FALSE")
-            add_text(afile, "duration", max(1, frames - 1))
-            atc = ET.SubElement(afile, "timecode")
-            atrate = ET.SubElement(atc, "rate"); add_text(atrate, "timebase", int(FPS_DEFAULT)); add_text(atrate, "ntsc", "FALSE")
-            add_text(atc, "string", "00:00:00:00")
-            add_text(atc, "frame", 0)
-            add_text(atc, "displayformat", "NDF")
-            amedia = ET.SubElement(afile, "media")
-            aaudio = ET.SubElement(amedia, "audio")
-            asamp = ET.SubElement(aaudio, "samplecharacteristics")
-            add_text(asamp, "depth", int(AUDIO_BIT_DEPTH_DEFAULT))
-            add_text(asamp, "samplerate", int(AUDIO_SAMPLERATE_DEFAULT))
-            add_text(aaudio, "channelcount", 2)
-
-            source = ET.SubElement(aclip, "sourcetrack")
-            add_text(source, "mediatype", "audio")
-            add_text(source, "trackindex", 1)
-
-            add_text(atrack, "enabled", "TRUE")
-            add_text(atrack, "locked", "FALSE")
-            add_text(atrack, "outputchannelindex", 1)
-
-        current_start_frames += frames
-
     timecode = ET.SubElement(sequence, "timecode")
     tr = ET.SubElement(timecode, "rate"); add_text(tr, "timebase", int(FPS_DEFAULT)); add_text(tr, "ntsc", "FALSE")
     add_text(timecode, "string", "00:00:00:00")
@@ -344,17 +264,425 @@ def build_sequence(project_name: str, slides: list) -> ET.Element:
     for tag in ("description","scene","shottake","lognote","good","originalvideofilename","originalaudiofilename"):
         add_text(logginginfo, tag, "")
 
+    return xmeml, (vtrack, vtrack2, atrack)
+
+def _vclip(vtrack, c):
+    """Clip de la imagen del slide (con su Basic Motion) en la pista de video 1."""
+    vclip = ET.SubElement(vtrack, "clipitem", {"id": f"vclip-{c['idx']}"})
+    add_text(vclip, "masterclipid", f"masterclip-v-{c['idx']}")
+    add_text(vclip, "name", c["name"])
+    add_text(vclip, "enabled", "TRUE")
+    add_text(vclip, "duration", c["frames"])
+    vr = ET.SubElement(vclip, "rate"); add_text(vr, "timebase", int(FPS_DEFAULT)); add_text(vr, "ntsc", "FALSE")
+    add_text(vclip, "start", c["start"])
+    add_text(vclip, "end", c["end"])
+    add_text(vclip, "in", 0)
+    add_text(vclip, "out", c["frames"])
+    add_text(vclip, "alphatype", "none")
+    add_text(vclip, "pixelaspectratio", "square")
+    add_text(vclip, "anamorphic", "FALSE")
+
+    filt = ET.SubElement(vclip, "filter")
+    eff = ET.SubElement(filt, "effect")
+    add_text(eff, "name", "Basic Motion")
+    add_text(eff, "effectid", "basic")
+    add_text(eff, "effectcategory", "motion")
+    add_text(eff, "effecttype", "motion")
+    add_text(eff, "mediatype", "video")
+    add_text(eff, "pproBypass", "false")
+
+    p_scale = ET.SubElement(eff, "parameter", {"authoringApp": "PremierePro"})
+    add_text(p_scale, "parameterid", "scale")
+    add_text(p_scale, "name", "Scale")
+    add_text(p_scale, "valuemin", 0)
+    add_text(p_scale, "valuemax", 1000)
+    add_text(p_scale, "value", 133)
+
+    p_rot = ET.SubElement(eff, "parameter", {"authoringApp": "PremierePro"})
+    add_text(p_rot, "parameterid", "rotation")
+    add_text(p_rot, "name", "Rotation")
+    add_text(p_rot, "valuemin", -8640)
+    add_text(p_rot, "valuemax", 8640)
+    add_text(p_rot, "value", 0)
+
+    p_center = ET.SubElement(eff, "parameter", {"authoringApp": "PremierePro"})
+    add_text(p_center, "parameterid", "center")
+    add_text(p_center, "name", "Center")
+ 
+    val = ET.SubElement(p_center, "value")
+    add_text(val, "horiz", -0.0279018)
+    add_text(val, "vert", 0)
+
+    kf1 = ET.SubElement(p_center, "keyframe")
+    add_text(kf1, "when", 0)
+    v1 = ET.SubElement(kf1, "value")
+    add_text(v1, "horiz", -0.0223214)
+    add_text(v1, "vert", 0)
+
+    kf2 = ET.SubElement(p_center, "keyframe")
+    add_text(kf2, "when", c["ultimo"])
+    v2 = ET.SubElement(kf2, "value")
+    add_text(v2, "horiz", 0.0502232)
+    add_text(v2, "vert", 0)
+
+    p_anchor = ET.SubElement(eff, "parameter", {"authoringApp": "PremierePro"})
+    add_text(p_anchor, "parameterid", "centerOffset")
+    add_text(p_anchor, "name", "Anchor Point")
+    val_anchor = ET.SubElement(p_anchor, "value")
+    add_text(val_anchor, "horiz", 0)
+    add_text(val_anchor, "vert", 0)
+
+    p_af = ET.SubElement(eff, "parameter", {"authoringApp": "PremierePro"})
+    add_text(p_af, "parameterid", "antiflicker")
+    add_text(p_af, "name", "Anti-flicker Filter")
+    add_text(p_af, "valuemin", 0.0)
+    add_text(p_af, "valuemax", 1.0)
+    add_text(p_af, "value", 0)
+
+    vfile = ET.SubElement(vclip, "file", {"id": f"vfile-{c['idx']}"})
+    add_text(vfile, "name", c["name"])
+    add_text(vfile, "pathurl", c["pathurl"])
+    vfr = ET.SubElement(vfile, "rate"); add_text(vfr, "timebase", int(FPS_DEFAULT)); add_text(vfr, "ntsc", "TRUE")
+    vtc = ET.SubElement(vfile, "timecode")
+    vtr = ET.SubElement(vtc, "rate"); add_text(vtr, "timebase", int(FPS_DEFAULT)); add_text(vtr, "ntsc", "TRUE")
+    add_text(vtc, "string", "00;00;00;00")
+    add_text(vtc, "frame", 0)
+    add_text(vtc, "displayformat", "DF")
+    vmedia = ET.SubElement(vfile, "media")
+    vvid = ET.SubElement(vmedia, "video")
+    vs = ET.SubElement(vvid, "samplecharacteristics")
+    vr2 = ET.SubElement(vs, "rate"); add_text(vr2, "timebase", int(FPS_DEFAULT)); add_text(vr2, "ntsc", "TRUE")
+    add_text(vs, "width", int(WIDTH_DEFAULT))
+    add_text(vs, "height", int(HEIGHT_DEFAULT))
+    add_text(vs, "anamorphic", "FALSE")
+    add_text(vs, "pixelaspectratio", "square")
+    add_text(vs, "fielddominance", "none")
+
+def _sclip(vtrack2, c, posicion: bool):
+    """PNG del subtítulo en la pista de video 2; con `posicion`, recortado y ubicado con Center."""
+    sclip = ET.SubElement(vtrack2, "clipitem", {"id": f"sclip-{c['idx']}"})
+    add_text(sclip, "masterclipid", f"masterclip-s-{c['idx']}")
+    add_text(sclip, "name", c["name"])
+    add_text(sclip, "enabled", "TRUE")
+    add_text(sclip, "duration", c["frames"])
+    sr = ET.SubElement(sclip, "rate"); add_text(sr, "timebase", int(FPS_DEFAULT)); add_text(sr, "ntsc", "FALSE")
+    add_text(sclip, "start", c["start"])
+    add_text(sclip, "end", c["end"])
+    add_text(sclip, "in", 0)
+    add_text(sclip, "out", c["frames"])
+    add_text(sclip, "alphatype", "none")
+    add_text(sclip, "pixelaspectratio", "square")
+    add_text(sclip, "anamorphic", "FALSE")
+
+    # Subtítulo recortado (SUBTITLE_CROP): PNG del tamaño del recuadro, ubicado con Center
+    if posicion:
+        add_posicion(sclip, c["horiz"], c["vert"])
+
+    sfile = ET.SubElement(sclip, "file", {"id": f"sfile-{c['idx']}"})
+    add_text(sfile, "name", c["name"])
+    add_text(sfile, "pathurl", c["pathurl"])
+    sfr = ET.SubElement(sfile, "rate"); add_text(sfr, "timebase", int(FPS_DEFAULT)); add_text(sfr, "ntsc", "TRUE")
+    stc = ET.SubElement(sfile, "timecode")
+    strt = ET.SubElement(stc, "rate"); add_text(strt, "timebase", int(FPS_DEFAULT)); add_text(strt, "ntsc", "TRUE")
+    add_text(stc, "string", "00;00;00;00")
+    add_text(stc, "frame", 0)
+    add_text(stc, "displayformat", "DF")
+    smedia = ET.SubElement(sfile, "media")
+    svid = ET.SubElement(smedia, "video")
+    ssamp = ET.SubElement(svid, "samplecharacteristics")
+    sr2 = ET.SubElement(ssamp, "rate"); add_text(sr2, "timebase", int(FPS_DEFAULT)); add_text(sr2, "ntsc", "TRUE")
+    add_text(ssamp, "width", c["width"] if posicion else int(WIDTH_DEFAULT))
+    add_text(ssamp, "height", c["height"] if posicion else int(HEIGHT_DEFAULT))
+    add_text(ssamp, "anamorphic", "FALSE")
+    add_text(ssamp, "pixelaspectratio", "square")
+    add_text(ssamp, "fielddominance", "none")
+
+def _aclip(atrack, c):
+    """Audio del slide en la pista de audio (más los campos de pista que lo acompañan)."""
+    aclip = ET.SubElement(atrack, "clipitem", {"id": f"aclip-{c['idx']}", "premiereChannelType": "stereo"})
+    add_text(aclip, "masterclipid", f"masterclip-a-{c['idx']}")
+    add_text(aclip, "name", c["name"])
+    add_text(aclip, "enabled", "TRUE")
+    add_text(aclip, "duration", c["frames"])
+    ar = ET.SubElement(aclip, "rate"); add_text(ar, "timebase", int(FPS_DEFAULT)); add_text(ar, "ntsc", "FALSE")
+    add_text(aclip, "start", c["start"])
+    add_text(aclip, "end", c["end"])
+    add_text(aclip, "in", 0)
+    add_text(aclip, "out", c["frames"])
+
+    afile = ET.SubElement(aclip, "file", {"id": f"afile-{c['idx']}"})
+    add_text(afile, "name", c["name"])
+    add_text(afile, "pathurl", c["pathurl"])
+    afr = ET.SubElement(afile, "rate"); add_text(afr, "timebase", int(FPS_DEFAULT)); add_text(afr, "ntsc", "FALSE")
+    add_text(afile, "duration", c["duracion_archivo"])
+    atc = ET.SubElement(afile, "timecode")
+    atrate = ET.SubElement(atc, "rate"); add_text(atrate, "timebase", int(FPS_DEFAULT)); add_text(atrate, "ntsc", "FALSE")
+    add_text(atc, "string", "00:00:00:00")
+    add_text(atc, "frame", 0)
+    add_text(atc, "displayformat", "NDF")
+    amedia = ET.SubElement(afile, "media")
+    aaudio = ET.SubElement(amedia, "audio")
+    asamp = ET.SubElement(aaudio, "samplecharacteristics")
+    add_text(asamp, "depth", int(AUDIO_BIT_DEPTH_DEFAULT))
+    add_text(asamp, "samplerate", int(AUDIO_SAMPLERATE_DEFAULT))
+    add_text(aaudio, "channelcount", 2)
+
+    source = ET.SubElement(aclip, "sourcetrack")
+    add_text(source, "mediatype", "audio")
+    add_text(source, "trackindex", 1)
+
+    add_text(atrack, "enabled", "TRUE")
+    add_text(atrack, "locked", "FALSE")
+    add_text(atrack, "outputchannelindex", 1)
+
+class _Marcas(dict):
+    """Valores de una plantilla en construcción: cada campo vale "{{campo}}"."""
+    def __missing__(self, campo):
+        return "{{" + campo + "}}"
+
+_MARCA = re.compile(r"\{\{(\w+)\}\}")
+
+class Plantilla:
+    """Clip (o grupo de elementos de pista) armado una sola vez, con marcas en los campos
+    que cambian por slide: frames, start/end, IDs, rutas, el `when` del último keyframe.
+
+    Por slide solo se rellenan esos campos: `elementos` copia el subárbol para
+    build_sequence y `texto` concatena el XML ya serializado (y escapado igual
+    que prettify) para el escritor en streaming, así que el costo por clip no
+    depende de cuántos slides tenga la secuencia.
+    """
+
+    def __init__(self, construir):
+        pista = ET.Element("track")
+        construir(pista, _Marcas())
+        self.elementos_base = list(pista)
+        self._huecos = []  # (elemento, ruta de índices, atributo o None, texto con marcas)
+        self._en_atributo = set()
+        for n, el in enumerate(self.elementos_base):
+            self._buscar(el, (n,))
+        self._textos = {}
+
+    def _buscar(self, el, ruta):
+        for k, v in el.attrib.items():
+            if _MARCA.search(v):
+                self._huecos.append((ruta, k, v))
+                self._en_atributo.update(_MARCA.findall(v))
+        if el.text and _MARCA.search(el.text):
+            self._huecos.append((ruta, None, el.text))
+        for n, hijo in enumerate(el):
+            self._buscar(hijo, ruta + (n,))
+
+    def elementos(self, valores: dict) -> list:
+        copias = [copy.deepcopy(el) for el in self.elementos_base]
+        for ruta, atributo, texto in self._huecos:
+            el = copias[ruta[0]]
+            for n in ruta[1:]:
+                el = el[n]
+            relleno = _MARCA.sub(lambda m: str(valores[m.group(1)]), texto)
+            if atributo is None:
+                el.text = relleno
+            else:
+                el.set(atributo, relleno)
+        return copias
+
+    def texto(self, indent: str, valores: dict) -> str:
+        partes = self._textos.get(indent)
+        if partes is None:
+            buf = []
+            for el in self.elementos_base:
+                escribir_elemento(buf.append, el, indent)
+            # Literales en las posiciones pares, nombres de campo en las impares
+            partes = self._textos[indent] = _MARCA.split("".join(buf))
+        escapados = {k: _escapar(str(v), k in self._en_atributo) for k, v in valores.items()}
+        return "".join(parte if n % 2 == 0 else escapados[parte] for n, parte in enumerate(partes))
+
+@functools.lru_cache(maxsize=None)
+def plantilla(tipo: str) -> Plantilla:
+    construir = {
+        "vclip": _vclip,
+        "sclip": lambda pista, c: _sclip(pista, c, posicion=False),
+        "sclip_posicion": lambda pista, c: _sclip(pista, c, posicion=True),
+        "aclip": _aclip,
+    }[tipo]
+    return Plantilla(construir)
+
+def _tiempos(idx: int, slide: dict, current_start_frames: int) -> dict:
+    frames = int(slide.get("duracion_frames", 0))
+    return {"idx": idx, "frames": frames, "start": current_start_frames, "end": current_start_frames + frames}
+
+def clip_video(idx: int, slide: dict, current_start_frames: int, proj_dir: Path) -> list:
+    """Piezas de la pista de video 1 para un slide: [(plantilla, valores)] o elementos sueltos."""
+    img_name = slide.get("nombre_imagen")
+    c = _tiempos(idx, slide, current_start_frames)
+    if not img_name or c["frames"] <= 0:
+        raise ValueError(f"Slide {idx} sin nombre_imagen o duracion_frames inválida.")
+    img_path = (proj_dir / "IMGS" / img_name).resolve()
+    c.update(name=img_path.name, pathurl=file_url(img_path), ultimo=c["frames"] - 1)
+    return [(plantilla("vclip"), c)]
+
+def clip_subtitulo(idx: int, slide: dict, current_start_frames: int, proj_dir: Path) -> list:
+    """Subtítulo del slide en la pista de video 2: PNG o título nativo (SUBTITLE_MODE=texto)."""
+    c = _tiempos(idx, slide, current_start_frames)
+    if subtitle_gen.TEXTO_NATIVO:
+        if not (slide.get("texto_pantalla") or "").strip():
+            return []
+        pista = ET.Element("track")
+        add_titulo(pista, idx, slide["texto_pantalla"], c["frames"], current_start_frames)
+        return list(pista)
+    sub_path = (proj_dir / "SUBS" / f"sub_{idx:04d}.png").resolve()
+    if not sub_path.exists():
+        return []
+    c.update(name=sub_path.name, pathurl=file_url(sub_path))
+    ubicacion = slide.get("subtitulo")
+    if not ubicacion:
+        return [(plantilla("sclip"), c)]
+    horiz, vert = centro(ubicacion)
+    c.update(horiz=horiz, vert=vert, width=int(ubicacion["ancho"]), height=int(ubicacion["alto"]))
+    return [(plantilla("sclip_posicion"), c)]
+
+def clip_audio(idx: int, slide: dict, current_start_frames: int, proj_dir: Path) -> list:
+    """Audio del slide, si existe, en la pista de audio."""
+    voice_name = slide.get("nombre_audio") or None
+    a_path = (proj_dir / "VOICE" / voice_name).resolve() if voice_name else None
+    if not (a_path and a_path.exists()):
+        return []
+    c = _tiempos(idx, slide, current_start_frames)
+    c.update(name=a_path.name, pathurl=file_url(a_path), duracion_archivo=max(1, c["frames"] - 1))
+    return [(plantilla("aclip"), c)]
+
+CLIPS = (clip_video, clip_subtitulo, clip_audio)
+
+def _elementos(piezas: list):
+    for pieza in piezas:
+        if isinstance(pieza, tuple):
+            yield from pieza[0].elementos(pieza[1])
+        else:
+            yield pieza
+
+def build_sequence(project_name: str, slides: list, proj_dir: Path) -> ET.Element:
+    xmeml, pistas = _esqueleto(project_name, slides)
+    current_start_frames = 0
+    for idx, slide in enumerate(slides, start=1):
+        for clip, track in zip(CLIPS, pistas):
+            track.extend(_elementos(clip(idx, slide, current_start_frames, proj_dir)))
+        current_start_frames += int(slide.get("duracion_frames", 0))
+
     return xmeml
 
+def _escapar(valor: str, atributo: bool = False) -> str:
+    """Escapa como minidom: el caso común (sin caracteres especiales) sale tal cual."""
+    if not _ESPECIALES.search(valor):
+        return valor
+    # Casos raros: se delega en minidom para escapar igual que prettify en esta versión de Python
+    buf = io.StringIO()
+    if atributo:
+        el = _DOC.createElement("a")
+        el.setAttribute("v", valor)
+        el.writexml(buf)
+        return buf.getvalue()[len('<a v="'):-len('"/>')]
+    # ET no escapa \r en el texto y el parser de minidom lo normaliza a \n
+    _DOC.createTextNode(valor.replace("\r\n", "\n").replace("\r", "\n")).writexml(buf)
+    return buf.getvalue()
+
+_ESPECIALES = re.compile(r'[&<>"\r\n\t]')
+_DOC = minidom.Document()
+
+def _nodos(el: ET.Element, hijos=None):
+    if el.text:
+        yield el.text
+    for hijo in (el if hijos is None else hijos):
+        yield hijo
+        if hijo.tail:
+            yield hijo.tail
+
+def escribir_elemento(write, el: ET.Element, indent: str = "", hijos: dict = None):
+    """Escribe `el` con el formato exacto de prettify (toprettyxml con tabs), sin reparsear.
+
+    `hijos` mapea id(elemento) -> función(indent) que devuelve sus hijos: esos
+    se escriben a medida que se generan en lugar de estar en el árbol. Cada
+    hijo es un elemento o un `Serializado` (XML ya escrito por una plantilla).
+    """
+    abre = indent + "<" + el.tag
+    if el.attrib:
+        abre += "".join(f' {k}="{_escapar(v, True)}"' for k, v in el.attrib.items())
+    fuente = hijos.get(id(el)) if hijos else None
+    if fuente is None and not len(el):
+        # Hoja (el caso de casi todos los elementos): una sola escritura
+        if el.text:
+            write(f"{abre}>{_escapar(el.text)}</{el.tag}>\n")
+        else:
+            write(abre + "/>\n")
+        return
+    nodos = _nodos(el, fuente(indent + "\t") if fuente else None)
+    primero = next(nodos, None)
+    if primero is None:
+        write(abre + "/>\n")
+        return
+    write(abre + ">\n")
+    for nodo in itertools.chain((primero,), nodos):
+        if isinstance(nodo, Serializado):
+            write(nodo)
+        elif isinstance(nodo, str):
+            write(_escapar(indent + "\t" + nodo + "\n"))
+        else:
+            escribir_elemento(write, nodo, indent + "\t", hijos)
+    write(f"{indent}</{el.tag}>\n")
+
+class Serializado(str):
+    """Fragmento de XML ya escrito con el formato de prettify; se copia tal cual."""
+    tail = None
+
+def _clips(clip, slides: list, proj_dir: Path, indent: str):
+    """Clips de una pista, generados de a un slide (cada uno se descarta después de escribirlo)."""
+    current_start_frames = 0
+    for idx, slide in enumerate(slides, start=1):
+        for pieza in clip(idx, slide, current_start_frames, proj_dir):
+            yield Serializado(pieza[0].texto(indent, pieza[1])) if isinstance(pieza, tuple) else pieza
+        current_start_frames += int(slide.get("duracion_frames", 0))
+
+def escribir_secuencia(f, project_name: str, slides: list, proj_dir: Path):
+    """Escribe en `f` (texto) lo mismo que HEADER + prettify(build_sequence(...)) en una sola pasada.
+
+    Solo el esqueleto de la secuencia y el clip en curso están en memoria.
+    """
+    xmeml, pistas = _esqueleto(project_name, slides)
+    partes = []
+
+    def volcar(clips):
+        for pieza in clips:
+            f.write("".join(partes))
+            partes.clear()
+            yield pieza
+
+    def clips_de(clip, indent):
+        return volcar(_clips(clip, slides, proj_dir, indent))
+
+    hijos = {id(track): functools.partial(clips_de, clip) for clip, track in zip(CLIPS, pistas)}
+    f.write(HEADER + '<?xml version="1.0" encoding="UTF-8"?>\n')
+    escribir_elemento(partes.append, xmeml, "", hijos)
+    f.write("".join(partes))
+
+HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE xmeml>\n'
+
+def escribir_xml(project_name: str, slides: list, proj_dir: Path) -> Path:
+    out_path = proj_dir / f"{project_name}.xml"
+    # newline="": los \n se escriben tal cual también en Windows
+    with cache.abrir_atomico(out_path, "w", encoding="utf-8", newline="") as f:
+        escribir_secuencia(f, project_name, slides, proj_dir)
+    return out_path
+
 def main():
-    xmeml = build_sequence(PROYECTO, slides)
-    xml_body = prettify(xmeml)
-    header = '<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE xmeml>\n'
-    final_xml = header + xml_body
-
-    out_path = PROJ_DIR / f"{PROYECTO}.xml"
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    out_path.write_text(final_xml, encoding="utf-8")
+    proyecto = workspace.cargar_proyecto()
+    slides_path = proyecto.slides_path
+    if not slides_path.exists():
+        alt = ROOT / "slides.json"
+        if alt.exists():
+            slides_path = alt
+        else:
+            raise FileNotFoundError(f"No se encontró slides.json en {proyecto.nombre} ni en la raíz")
+
+    slides = json.loads(slides_path.read_text(encoding="utf-8"))
+    out_path = escribir_xml(proyecto.nombre, slides, proyecto.dir)
     print(f"✅ XML generado en: {out_path}")
 
 if __name__ == "__main__":
@@ -1,26 +1,47 @@
 import os
-import json
-import requests
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from openai import OpenAI
-from PIL import Image
+
+import cache
+import checkpoint
+import clientes
+import fakes
+import metricas
+import ratelimit
+import workspace
 
 load_dotenv()
 openai_api_key = os.getenv("OPENAI_API_KEY")
 
-with open("config.json", "r") as f:
-    config = json.load(f)
+# Imágenes generadas en paralelo (cada worker: API -> descarga -> recodificado)
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "4"))
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DOWNLOAD_TIMEOUT = 60
 
-PROYECTO = config["nombre_proyecto"]
-IMGS_DIR = os.path.join(PROYECTO, "IMGS")
-os.makedirs(IMGS_DIR, exist_ok=True)
+IMAGE_MODEL = "dall-e-3"
+IMAGE_SIZE = "1792x1024"
+IMAGE_QUALITY = "standard"
 
-client = OpenAI(api_key=openai_api_key)
+# Store de imágenes compartido entre proyectos (IMAGE_STORE=0 lo desactiva)
+image_store = cache.BlobStore(
+    os.getenv("IMAGE_STORE_DIR") or cache.CACHE_DIR / "images",
+    ext=".jpg",
+    max_bytes=int(os.getenv("IMAGE_STORE_MAX_MB", "2048")) * 1024 * 1024,
+    activa=os.getenv("IMAGE_STORE", "1") != "0",
+)
+metricas.registrar_cache("imagenes", image_store)
 
-with open(os.path.join(PROYECTO, "slides.json"), "r", encoding="utf-8") as f:
-    slides = json.load(f)
+def crear_cliente():
+    if fakes.ACTIVOS:
+        return fakes.cliente_openai()
+    from openai import OpenAI
+    return OpenAI(api_key=openai_api_key, max_retries=0,  # los reintentos los coordina ratelimit
+                  http_client=clientes.http_openai(), timeout=clientes.timeout_openai())
 
 def reparar_jpg_para_premiere(path):
+    from PIL import Image
     try:
         with Image.open(path) as img:
             rgb_img = img.convert("RGB")  # Asegura el modo correcto
@@ -28,32 +49,91 @@ def reparar_jpg_para_premiere(path):
     except Exception as e:
         print(f"Error al recodificar {path}: {e}")
 
-def generar_imagen(prompt, ruta_guardado):
-    response = client.images.generate(
-        model="dall-e-3",
+def descargar_imagen(url, ruta_destino):
+    """Descarga en streaming a un temporal propio del job y lo mueve de forma atómica."""
+    fd, nombre_temporal = tempfile.mkstemp(suffix=".jpg", prefix=".tmp_", dir=os.path.dirname(ruta_destino))
+    try:
+        with os.fdopen(fd, "wb") as handler, \
+                clientes.sesion().get(url, stream=True, timeout=clientes.timeout_requests(DOWNLOAD_TIMEOUT)) as r:
+            r.raise_for_status()
+            for bloque in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                handler.write(bloque)
+
+        reparar_jpg_para_premiere(nombre_temporal)
+        os.replace(nombre_temporal, ruta_destino)
+    except BaseException:
+        if os.path.exists(nombre_temporal):
+            os.remove(nombre_temporal)
+        raise
+
+def clave_imagen(prompt):
+    return cache.clave(IMAGE_MODEL, IMAGE_SIZE, IMAGE_QUALITY, prompt)
+
+def generar_imagen(client, prompt, ruta_guardado):
+    k = clave_imagen(prompt)
+    if image_store.get(k, ruta_guardado) is not None:
+        return
+
+    inicio = time.perf_counter()
+    response = ratelimit.proveedor("openai_images").llamar(
+        client.images.generate,
+        model=IMAGE_MODEL,
         prompt=prompt,
-        size="1792x1024",
-        quality="standard",
+        size=IMAGE_SIZE,
+        quality=IMAGE_QUALITY,
         n=1
     )
-    
+
     image_url = response.data[0].url
-    img_data = requests.get(image_url).content
-    
-    nombre_temporal = "temp_image.jpg"
-    with open(nombre_temporal, 'wb') as handler:
-        handler.write(img_data)
+    descargar_imagen(image_url, ruta_guardado)
+    image_store.put(k, ruta_guardado, {"segundos": round(time.perf_counter() - inicio, 2), "prompt": prompt})
+
+def generar_imagen_slide(client, slide, imgs_dir, manifiesto=None):
+    """Genera la imagen de un slide salvo que el manifiesto ya la tenga completa."""
+    ruta = os.path.join(imgs_dir, slide["nombre_imagen"])
+    k = clave_imagen(slide["prompt_imagen"])
+    if manifiesto and manifiesto.vigente("imagenes", slide["nombre_imagen"], k, ruta) is not None:
+        return
+    with metricas.medir(metricas.SLIDE_SEGUNDOS, etapa="image_gen"):
+        generar_imagen(client, slide["prompt_imagen"], ruta)
+    if manifiesto:
+        manifiesto.marcar("imagenes", slide["nombre_imagen"], k, ruta)
+
+def reporte_store():
+    st = image_store.stats()
+    return (f"Store de imágenes: {st['hits']} llamadas a la API ahorradas, "
+            f"~{st['ahorro_segundos']}s de generación ahorrados, {st['misses']} generadas")
+
+def generar_imagenes(client, slides, imgs_dir, workers=IMAGE_WORKERS, progreso=None, manifiesto=None):
+    """Genera las imágenes de todos los slides con un pool acotado de `workers` hilos.
+
+    `progreso(i)` se llama al terminar cada imagen, en orden. Con `manifiesto`
+    se saltan las imágenes que ya quedaron completas en una corrida anterior.
+    """
+    os.makedirs(imgs_dir, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futuros = [pool.submit(generar_imagen_slide, client, slide, imgs_dir, manifiesto) for slide in slides]
+        try:
+            for i, futuro in enumerate(futuros):
+                futuro.result()
+                if progreso:
+                    progreso(i)
+        except BaseException:
+            # Un error o un job cancelado: lo que sigue en cola no arranca
+            pool.shutdown(cancel_futures=True)
+            raise
 
-    reparar_jpg_para_premiere(nombre_temporal)
-    os.rename(nombre_temporal, ruta_guardado)
+def main():
+    proyecto = workspace.cargar_proyecto()
+    slides = workspace.cargar_slides(proyecto)
 
+    generar_imagenes(clientes.cliente_openai(), slides, proyecto.imgs_dir, manifiesto=checkpoint.Manifiesto(proyecto.dir))
 
+    if image_store.activa:
+        print(reporte_store())
+        image_store.evict()
 
-for i, slide in enumerate(slides):
-    prompt = slide["prompt_imagen"]
-    nombre_archivo = f"img_{i:02d}.jpg"
-    ruta_guardado = os.path.join(IMGS_DIR, nombre_archivo)
-    
-    generar_imagen(prompt, ruta_guardado)
+    print(f"✅ Images")
 
-print(f"✅ Images")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""Reconstrucción incremental: regenera solo los slides cuyo chunk cambió.
+
+Compara los chunks del guion nuevo con los `chunk` del `slides.json` existente.
+Los slides con el mismo texto reutilizan su texto en pantalla, prompt, imagen,
+audio y subtítulo (renombrados a su nueva posición). Solo los slides nuevos o
+modificados pasan por el LLM, DALL·E, ElevenLabs y el render de subtítulos.
+
+En `incremental.json` se guarda una huella de la configuración de cada etapa
+(modelo, voz, tamaño de imagen...). Si cambia, esa etapa se regenera completa.
+Un proyecto sin `incremental.json` se asume generado con la configuración actual.
+"""
+import json
+import os
+from collections import defaultdict
+from pathlib import Path
+
+import cache
+import checkpoint
+import chunking
+import clientes
+import image_gen
+import subtitle_gen
+import voice_gen
+import workspace
+
+# INCREMENTAL=0 fuerza siempre la reconstrucción completa
+INCREMENTAL = os.getenv("INCREMENTAL", "1") != "0"
+
+ETAPAS = ("textos", "imagenes", "voces", "subtitulos")
+
+
+def huellas() -> dict:
+    """Huella de la configuración que determina la salida de cada etapa."""
+    return {
+        "textos": cache.clave(chunking.LLM_MODEL, chunking.TEMPLATE_TEXTO, chunking.TEMPLATE_VISUAL),
+        "imagenes": cache.clave(image_gen.IMAGE_MODEL, image_gen.IMAGE_SIZE, image_gen.IMAGE_QUALITY),
+        "voces": cache.clave(voice_gen.VOICE_ID, voice_gen.MODEL_ID, voice_gen.OUTPUT_FORMAT,
+                             voice_gen.VOICE_SETTINGS),
+        "subtitulos": cache.clave(subtitle_gen.WIDTH, subtitle_gen.HEIGHT, subtitle_gen.START_FONT_SIZE,
+                                  subtitle_gen.MIN_FONT_SIZE, subtitle_gen.BOX_MAX_HEIGHT_RATIO,
+                                  subtitle_gen.SUBTITLE_CROP, subtitle_gen.SUBTITLE_MODE),
+    }
+
+
+def _huellas_path(proyecto: workspace.Proyecto) -> Path:
+    return proyecto.dir / "incremental.json"
+
+
+def guardar_huellas(proyecto: workspace.Proyecto):
+    cache.escribir_atomico(_huellas_path(proyecto), json.dumps(huellas(), indent=2).encode("utf-8"))
+
+
+def disponible(proyecto: workspace.Proyecto) -> bool:
+    return INCREMENTAL and proyecto.slides_path.exists()
+
+
+def emparejar(chunks: list, previos: list) -> list:
+    """Para cada chunk nuevo, el slide previo con el mismo texto (o None).
+
+    Con chunks repetidos se emparejan en orden de aparición; cada slide previo se usa una sola vez.
+    """
+    por_texto = defaultdict(list)
+    for slide in previos:
+        por_texto[slide.get("chunk")].append(slide)
+    return [por_texto[chunk].pop(0) if por_texto[chunk] else None for chunk in chunks]
+
+
+def _activos(slide: dict, proyecto: workspace.Proyecto) -> dict:
+    return {
+        "imagenes": proyecto.imgs_dir / slide["nombre_imagen"],
+        "voces": proyecto.voice_dir / slide["nombre_audio"],
+        "subtitulos": proyecto.subs_dir / subtitle_gen.nombre_subtitulo(slide["slide"]),
+    }
+
+
+def _renumerar(movimientos: list):
+    """Renombra (origen, destino) en dos fases para que un destino nunca pise un origen pendiente."""
+    temporales = []
+    for origen, destino in movimientos:
+        if origen != destino and origen.exists():
+            temporal = destino.with_name(f".inc_{destino.name}")
+            os.replace(origen, temporal)
+            temporales.append((temporal, destino))
+    for temporal, destino in temporales:
+        os.replace(temporal, destino)
+
+
+def _limpiar(directorio: Path, patron: str, vigentes: set):
+    for f in directorio.glob(patron):
+        if f.name not in vigentes:
+            f.unlink()
+
+
+def reconstruir(proyecto: workspace.Proyecto, chunks: list, llm, openai_client, tts_client, progreso=None,
+                manifiesto=None):
+    """Actualiza el proyecto para `chunks` regenerando solo lo necesario.
+
+    Devuelve (slides, resumen). `progreso(etapa, i, total)` se llama por cada
+    slide regenerado. No escribe slides.json: eso queda para quien llama.
+    """
+    previos = workspace.cargar_slides(proyecto) if proyecto.slides_path.exists() else []
+    pareja = emparejar(chunks, previos)
+
+    anteriores = {}
+    if _huellas_path(proyecto).exists():
+        anteriores = json.loads(_huellas_path(proyecto).read_text(encoding="utf-8"))
+    actuales = huellas()
+    config_cambio = {e: e in anteriores and anteriores[e] != actuales[e] for e in ETAPAS}
+
+    # Slides con su numeración nueva; los reutilizados conservan textos y duración
+    slides = []
+    for i, (chunk, previo) in enumerate(zip(chunks, pareja)):
+        if previo is not None and not config_cambio["textos"]:
+            slide = chunking.crear_slide(i, chunk, previo["texto_pantalla"], previo["prompt_imagen"])
+            # Mismo texto en pantalla: el subtítulo recortado conserva su ubicación
+            if "subtitulo" in previo and not config_cambio["subtitulos"]:
+                slide["subtitulo"] = previo["subtitulo"]
+        else:
+            slide = chunking.crear_slide(i, chunk, None, None)
+        # La voz depende solo del chunk: su duración se conserva aunque cambien los textos
+        for campo in ("duracion_segundos", "duracion_frames"):
+            if previo is not None and campo in previo:
+                slide[campo] = previo[campo]
+        slides.append(slide)
+
+    for d in (proyecto.imgs_dir, proyecto.voice_dir, proyecto.subs_dir):
+        d.mkdir(parents=True, exist_ok=True)
+    for etapa in ("imagenes", "voces", "subtitulos"):
+        movimientos = [
+            (_activos(previo, proyecto)[etapa], _activos(slide, proyecto)[etapa])
+            for slide, previo in zip(slides, pareja) if previo is not None
+        ]
+        _renumerar(movimientos)
+        if manifiesto:
+            manifiesto.renombrar(etapa, [(o.name, d.name) for o, d in movimientos if o != d])
+    vigentes = [_activos(slide, proyecto) for slide in slides]
+    _limpiar(proyecto.imgs_dir, "img_*.jpg", {a["imagenes"].name for a in vigentes})
+    _limpiar(proyecto.voice_dir, "chunk_voice*.mp3", {a["voces"].name for a in vigentes})
+    _limpiar(proyecto.subs_dir, "sub_*.png", {a["subtitulos"].name for a in vigentes})
+
+    textos = [i for i, s in enumerate(slides) if s["texto_pantalla"] is None]
+    sin_texto = set(textos)
+    pendientes = {
+        "imagenes": [i for i in range(len(slides))
+                     if i in sin_texto or config_cambio["imagenes"] or not vigentes[i]["imagenes"].exists()],
+        "voces": [i for i in range(len(slides))
+                  if pareja[i] is None or config_cambio["voces"] or not vigentes[i]["voces"].exists()
+                  or "duracion_frames" not in slides[i]],
+        "subtitulos": [i for i in range(len(slides))
+                       if i in sin_texto or config_cambio["subtitulos"] or not vigentes[i]["subtitulos"].exists()],
+    }
+    if subtitle_gen.TEXTO_NATIVO:
+        pendientes["subtitulos"] = []  # los títulos van dentro del XML
+
+    def avisar(etapa, indices):
+        if not progreso:
+            return None
+        return lambda j, total=None: progreso(etapa, indices[j], len(indices))
+
+    if textos:
+        nuevos = chunking.generar_slides_chunks([chunks[i] for i in textos], llm,
+                                                progreso=avisar("chunking", textos), indices=textos,
+                                                manifiesto=manifiesto)
+        for i, slide in zip(textos, nuevos):
+            slides[i].update(texto_pantalla=slide["texto_pantalla"], prompt_imagen=slide["prompt_imagen"])
+
+    subset = lambda etapa: [slides[i] for i in pendientes[etapa]]
+    if pendientes["imagenes"]:
+        image_gen.generar_imagenes(openai_client, subset("imagenes"), proyecto.imgs_dir,
+                                   progreso=avisar("image_gen", pendientes["imagenes"]), manifiesto=manifiesto)
+    if pendientes["voces"]:
+        voice_gen.generar_voces(tts_client, subset("voces"), proyecto.voice_dir,
+                                progreso=avisar("voice_gen", pendientes["voces"]), manifiesto=manifiesto)
+    if pendientes["subtitulos"]:
+        subtitle_gen.generar_subtitulos(subset("subtitulos"), proyecto.subs_dir,
+                                        progreso=avisar("subtitle_gen", pendientes["subtitulos"]),
+                                        manifiesto=manifiesto)
+
+    guardar_huellas(proyecto)
+    reutilizados = sum(1 for p in pareja if p is not None)
+    resumen = (f"Incremental: {reutilizados}/{len(slides)} slides reutilizados, "
+               f"{len(textos)} textos, {len(pendientes['imagenes'])} imágenes, "
+               f"{len(pendientes['voces'])} audios y {len(pendientes['subtitulos'])} subtítulos regenerados")
+    return slides, resumen
+
+
+def main():
+    proyecto = workspace.Proyecto(chunking.PROYECTO, workspace.BASE_DIR / chunking.PROYECTO)
+    chunks = chunking.splitter_script(chunking.GUION)
+    slides, resumen = reconstruir(proyecto, chunks, clientes.llm(), clientes.cliente_openai(), clientes.cliente_tts(),
+                                  manifiesto=checkpoint.Manifiesto(proyecto.dir))
+
+    workspace.guardar_slides(proyecto, slides)
+    workspace.guardar_config(proyecto)
+
+    print(resumen)
+    print(f"✅ Incremental")
+
+if __name__ == "__main__":
+    main()
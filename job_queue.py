@@ -0,0 +1,234 @@
+"""Cola de jobs durable en SQLite, compartida por workers en varias máquinas.
+
+La base vive en el filesystem compartido (JOB_QUEUE_DB). Un worker toma un job
+con un lease de `lease_segundos` y lo renueva con heartbeats mientras corre; si
+el worker muere el lease vence y cualquier otro worker vuelve a tomar el job
+(hasta `max_intentos`). Los eventos de progreso también se guardan en la base,
+así el servidor Flask puede servir el SSE de un job que corre en otra máquina.
+
+Se usa el journal por defecto de SQLite (no WAL): WAL necesita memoria
+compartida y no funciona sobre NFS/SMB.
+"""
+import json
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+from jobs import ESTADOS_FINALES
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    nombre TEXT NOT NULL,
+    guion TEXT NOT NULL,
+    modo TEXT NOT NULL,
+    perfilar INTEGER NOT NULL DEFAULT 0,
+    estado TEXT NOT NULL,
+    intentos INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_hasta REAL,
+    creado REAL NOT NULL,
+    inicio REAL,
+    fin REAL,
+    xml TEXT,
+    log TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_estado ON jobs (estado, creado);
+CREATE TABLE IF NOT EXISTS eventos (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    datos TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+"""
+
+
+class ColaJobs:
+    """Cola durable. Cada operación abre su propia conexión: es segura entre hilos y procesos."""
+
+    def __init__(self, path, lease_segundos=60, max_intentos=3):
+        self.path = Path(path)
+        self.lease_segundos = lease_segundos
+        self.max_intentos = max_intentos
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            db.executescript(ESQUEMA)
+            columnas = {f[1] for f in db.execute("PRAGMA table_info(jobs)")}
+            if "perfilar" not in columnas:  # bases creadas antes de la opción
+                db.execute("ALTER TABLE jobs ADD COLUMN perfilar INTEGER NOT NULL DEFAULT 0")
+        finally:
+            db.close()
+
+    @contextmanager
+    def _tx(self):
+        # BEGIN IMMEDIATE toma el lock de escritura al empezar: dos workers no
+        # pueden leer el mismo job libre y tomarlo los dos
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            yield db
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        finally:
+            db.close()
+
+    @contextmanager
+    def _lectura(self):
+        # Consultas de una sola sentencia en autocommit: toman un lock SHARED
+        # mientras leen y no compiten por el de escritura con tomar/renovar/terminar
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def _emitir(self, db, job_id, evento):
+        seq = db.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM eventos WHERE job_id = ?", (job_id,)).fetchone()[0]
+        evento = {"seq": seq, "t": round(time.time(), 3), **evento}
+        db.execute("INSERT INTO eventos (job_id, seq, datos) VALUES (?, ?, ?)",
+                   (job_id, seq, json.dumps(evento, ensure_ascii=False)))
+
+    # --- lado del servidor ---
+
+    def encolar(self, nombre, guion, modo, perfilar=False) -> str:
+        job_id = uuid.uuid4().hex[:12]
+        with self._tx() as db:
+            db.execute("INSERT INTO jobs (id, nombre, guion, modo, perfilar, estado, creado) "
+                       "VALUES (?, ?, ?, ?, ?, 'en_cola', ?)",
+                       (job_id, nombre, guion, modo, int(perfilar), time.time()))
+            self._emitir(db, job_id, {"tipo": "estado", "estado": "en_cola"})
+        return job_id
+
+    def fila(self, job_id):
+        with self._lectura() as db:
+            return db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+    def filas(self, limite=200):
+        with self._lectura() as db:
+            return db.execute("SELECT * FROM jobs ORDER BY creado DESC LIMIT ?", (limite,)).fetchall()
+
+    def eventos(self, job_id, desde=0) -> list:
+        with self._lectura() as db:
+            filas = db.execute("SELECT datos FROM eventos WHERE job_id = ? AND seq > ? ORDER BY seq",
+                               (job_id, desde)).fetchall()
+        return [json.loads(f["datos"]) for f in filas]
+
+    # --- lado del worker ---
+
+    def tomar(self, worker):
+        """Toma el job libre más antiguo (o uno con lease vencido). Devuelve la fila o None."""
+        ahora = time.time()
+        with self._tx() as db:
+            # Jobs cuyo worker murió demasiadas veces: se dan por fallidos
+            for f in db.execute("SELECT id FROM jobs WHERE estado = 'corriendo' AND lease_hasta < ? AND intentos >= ?",
+                                (ahora, self.max_intentos)).fetchall():
+                db.execute("UPDATE jobs SET estado = 'error', fin = ?, worker = NULL, log = ? WHERE id = ?",
+                           (ahora, f"[ERROR] lease vencido tras {self.max_intentos} intentos", f["id"]))
+                self._emitir(db, f["id"], {"tipo": "estado", "estado": "error", "xml": None})
+
+            f = db.execute(
+                "SELECT * FROM jobs WHERE estado = 'en_cola' OR (estado = 'corriendo' AND lease_hasta < ?) "
+                "ORDER BY creado LIMIT 1", (ahora,)).fetchone()
+            if f is None:
+                return None
+            db.execute("UPDATE jobs SET estado = 'corriendo', worker = ?, lease_hasta = ?, intentos = intentos + 1, "
+                       "inicio = ? WHERE id = ?", (worker, ahora + self.lease_segundos, ahora, f["id"]))
+            self._emitir(db, f["id"], {"tipo": "estado", "estado": "corriendo", "worker": worker,
+                                       "intento": f["intentos"] + 1})
+        return f
+
+    def renovar(self, job_id, worker) -> bool:
+        """Heartbeat: extiende el lease. False si el job ya no es de este worker."""
+        with self._tx() as db:
+            cur = db.execute("UPDATE jobs SET lease_hasta = ? WHERE id = ? AND worker = ? AND estado = 'corriendo'",
+                             (time.time() + self.lease_segundos, job_id, worker))
+        return cur.rowcount == 1
+
+    def emitir(self, job_id, worker, evento):
+        with self._tx() as db:
+            if db.execute("SELECT 1 FROM jobs WHERE id = ? AND worker = ?", (job_id, worker)).fetchone():
+                self._emitir(db, job_id, evento)
+
+    def terminar(self, job_id, worker, ok, log, xml) -> bool:
+        """Guarda el resultado. False si el lease se perdió y otro worker tomó el job."""
+        with self._tx() as db:
+            cur = db.execute(
+                "UPDATE jobs SET estado = ?, fin = ?, log = ?, xml = ?, lease_hasta = NULL "
+                "WHERE id = ? AND worker = ? AND estado = 'corriendo'",
+                ("ok" if ok else "error", time.time(), "\n\n".join(log), xml, job_id, worker))
+            if cur.rowcount == 1:
+                self._emitir(db, job_id, {"tipo": "estado", "estado": "ok" if ok else "error", "xml": xml})
+        return cur.rowcount == 1
+
+
+class JobEnCola:
+    """Vista de un job de la cola con la misma interfaz que `jobs.Job` para las rutas de app.py."""
+
+    def __init__(self, cola: ColaJobs, fila):
+        self._cola = cola
+        self._fila = fila
+        self.id = fila["id"]
+
+    @property
+    def estado(self):
+        return self._fila["estado"]
+
+    def eventos_desde(self, seq: int, timeout: float, intervalo=0.5):
+        limite = time.monotonic() + timeout
+        while True:
+            eventos = self._cola.eventos(self.id, seq)
+            self._fila = self._cola.fila(self.id)
+            if eventos or self.estado in ESTADOS_FINALES or time.monotonic() >= limite:
+                return eventos
+            time.sleep(intervalo)
+
+    def to_dict(self, con_log=False) -> dict:
+        f = self._fila
+        progreso = {}
+        for evento in self._cola.eventos(self.id):
+            if evento.get("tipo") == "estado" and evento["estado"] == "corriendo":
+                progreso = {}  # un job retomado cuenta solo el intento actual
+            elif evento.get("tipo") == "slide":
+                etapa = progreso.setdefault(evento["etapa"], {"hechos": 0, "total": evento["total"]})
+                etapa["hechos"] += 1
+        d = {
+            "job_id": f["id"],
+            "nombre": f["nombre"],
+            "modo": f["modo"],
+            "perfilar": bool(f["perfilar"]),
+            "estado": f["estado"],
+            "creado": f["creado"],
+            "inicio": f["inicio"],
+            "fin": f["fin"],
+            "progreso": progreso,
+            "xml": f["xml"],
+            "worker": f["worker"],
+            "intentos": f["intentos"],
+        }
+        if con_log:
+            d["log"] = f["log"] or ""
+        return d
+
+
+class ColaManager:
+    """Adaptador de ColaJobs con la interfaz de `jobs.JobManager` (enviar/obtener/listar)."""
+
+    def __init__(self, cola: ColaJobs):
+        self.cola = cola
+
+    def enviar(self, nombre, guion, modo, perfilar=False) -> JobEnCola:
+        return JobEnCola(self.cola, self.cola.fila(self.cola.encolar(nombre, guion, modo, perfilar)))
+
+    def obtener(self, job_id):
+        fila = self.cola.fila(job_id)
+        return JobEnCola(self.cola, fila) if fila else None
+
+    def listar(self) -> list:
+        return [JobEnCola(self.cola, f) for f in reversed(self.cola.filas())]
@@ -0,0 +1,121 @@
+"""Jobs asíncronos para el servidor Flask.
+
+`/jobs` encola el pipeline en un pool de workers y responde de inmediato con
+el id del job. Cada job acumula sus eventos (etapas y slides) con un número de
+secuencia, así un cliente SSE puede reconectarse y seguir desde el último que
+vio (cabecera Last-Event-ID).
+"""
+import itertools
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+ESTADOS_FINALES = ("ok", "error")
+
+
+class Job:
+    def __init__(self, nombre, guion, modo, perfilar=False):
+        self.id = uuid.uuid4().hex[:12]
+        self.nombre = nombre
+        self.guion = guion
+        self.modo = modo
+        self.perfilar = perfilar
+        self.estado = "en_cola"
+        self.creado = time.time()
+        self.inicio = None
+        self.fin = None
+        self.log = []
+        self.xml = None
+        self.eventos = []
+        self.progreso = {}  # etapa -> {"hechos": n, "total": m}
+        self._seq = itertools.count(1)
+        self._cond = threading.Condition()
+
+    def emitir(self, evento: dict):
+        with self._cond:
+            self._agregar(evento)
+
+    def terminar(self, ok: bool, log: list, xml):
+        """Evento final y estado final juntos: quien ve el estado terminado ya tiene el evento."""
+        with self._cond:
+            self.log, self.xml, self.fin = log, xml, time.time()
+            self._agregar({"tipo": "estado", "estado": "ok" if ok else "error", "xml": xml})
+            self.estado = "ok" if ok else "error"
+
+    def _agregar(self, evento: dict):
+        evento = {"seq": next(self._seq), "t": round(time.time(), 3), **evento}
+        self.eventos.append(evento)
+        if evento.get("tipo") == "slide":
+            etapa = self.progreso.setdefault(evento["etapa"], {"hechos": 0, "total": evento["total"]})
+            etapa["hechos"] += 1
+        self._cond.notify_all()
+
+    def eventos_desde(self, seq: int, timeout: float):
+        """Eventos con número > `seq`; espera hasta `timeout` si todavía no hay ninguno."""
+        with self._cond:
+            if len(self.eventos) <= seq and self.estado not in ESTADOS_FINALES:
+                self._cond.wait(timeout)
+            # seq empieza en 1 y es consecutivo: el evento n está en la posición n - 1
+            return self.eventos[seq:]
+
+    def to_dict(self, con_log=False) -> dict:
+        d = {
+            "job_id": self.id,
+            "nombre": self.nombre,
+            "modo": self.modo,
+            "perfilar": self.perfilar,
+            "estado": self.estado,
+            "creado": self.creado,
+            "inicio": self.inicio,
+            "fin": self.fin,
+            "progreso": self.progreso,
+            "xml": self.xml,
+        }
+        if con_log:
+            d["log"] = "\n\n".join(self.log)
+        return d
+
+
+class JobManager:
+    """Pool de `max_workers` jobs simultáneos; conserva los últimos `historial` jobs."""
+
+    def __init__(self, ejecutar, max_workers=2, historial=200):
+        self._ejecutar = ejecutar
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = OrderedDict()
+        self._historial = historial
+        self._lock = threading.Lock()
+
+    def enviar(self, nombre, guion, modo, perfilar=False) -> Job:
+        job = Job(nombre, guion, modo, perfilar)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._purgar()
+        job.emitir({"tipo": "estado", "estado": job.estado})
+        self._pool.submit(self._correr, job)
+        return job
+
+    def obtener(self, job_id) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def listar(self) -> list:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def _correr(self, job: Job):
+        job.estado, job.inicio = "corriendo", time.time()
+        job.emitir({"tipo": "estado", "estado": job.estado})
+        try:
+            ok, log, xml = self._ejecutar(job.nombre, job.guion, job.modo, job.emitir,
+                                          perfilar=job.perfilar or None)
+        except Exception as e:  # el runner ya captura errores por etapa; esto es un fallo inesperado
+            ok, log, xml = False, [f"[EXCEPTION] {e}"], None
+        job.terminar(ok, log, xml)
+
+    def _purgar(self):
+        terminados = [j for j in self._jobs.values() if j.estado in ESTADOS_FINALES]
+        for job in terminados[:max(0, len(self._jobs) - self._historial)]:
+            del self._jobs[job.id]
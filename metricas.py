@@ -0,0 +1,222 @@
+"""Métricas del proceso en formato de texto de Prometheus.
+
+Contadores e histogramas en memoria, seguros entre hilos, sin dependencias:
+`app.py` los expone en `/metrics` y `worker.py --puerto-metricas` en su propio
+puerto. Se registran:
+
+- duración de cada etapa y tiempo por slide dentro de cada etapa;
+- latencia de cada intento de llamada a las APIs, reintentos y tiempo de
+  espera por los límites de tasa (`ratelimit.py`);
+- tokens estimados (chat) y caracteres (TTS) enviados;
+- aciertos y fallos de las cachés en disco.
+
+Son acumulados del proceso: varios jobs en paralelo suman en las mismas series.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LIMITES_LLAMADA = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+LIMITES_SLIDE = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+LIMITES_ETAPA = (0.5, 1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+
+
+def _etiquetas(nombres, valores, extra="") -> str:
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _numero(valor) -> str:
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Contador:
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, valor=1, **etiquetas):
+        k = tuple(str(etiquetas[n]) for n in self.etiquetas)
+        with self._lock:
+            self._series[k] = self._series.get(k, 0) + valor
+
+    def valores(self) -> dict:
+        with self._lock:
+            return dict(self._series)
+
+    def exponer(self) -> list:
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} counter"]
+        for k, v in sorted(self.valores().items()):
+            lineas.append(f"{self.nombre}{_etiquetas(self.etiquetas, k)} {_numero(v)}")
+        return lineas
+
+
+class Histograma:
+    def __init__(self, nombre, ayuda, etiquetas=(), limites=LIMITES_LLAMADA):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.limites = tuple(limites)
+        self._series = {}  # etiquetas -> [cuentas por cubeta..., suma, total]
+        self._lock = threading.Lock()
+
+    def observar(self, valor, **etiquetas):
+        k = tuple(str(etiquetas[n]) for n in self.etiquetas)
+        i = bisect.bisect_left(self.limites, valor)
+        with self._lock:
+            serie = self._series.get(k)
+            if serie is None:
+                serie = self._series[k] = [0] * (len(self.limites) + 2)
+            if i < len(self.limites):
+                serie[i] += 1
+            serie[-2] += valor
+            serie[-1] += 1
+
+    def valores(self) -> dict:
+        """etiquetas -> {"cuenta", "suma"}."""
+        with self._lock:
+            return {k: {"cuenta": s[-1], "suma": s[-2]} for k, s in self._series.items()}
+
+    def exponer(self) -> list:
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        with self._lock:
+            series = sorted((k, list(s)) for k, s in self._series.items())
+        for k, serie in series:
+            acumulado = 0
+            for limite, cuenta in zip(self.limites, serie):
+                acumulado += cuenta
+                le = f'le="{_numero(float(limite))}"'
+                lineas.append(f"{self.nombre}_bucket{_etiquetas(self.etiquetas, k, le)} {acumulado}")
+            le = 'le="+Inf"'
+            lineas.append(f"{self.nombre}_bucket{_etiquetas(self.etiquetas, k, le)} {serie[-1]}")
+            lineas.append(f"{self.nombre}_sum{_etiquetas(self.etiquetas, k)} {_numero(float(serie[-2]))}")
+            lineas.append(f"{self.nombre}_count{_etiquetas(self.etiquetas, k)} {serie[-1]}")
+        return lineas
+
+
+ETAPA_SEGUNDOS = Histograma("videonews_etapa_segundos", "Duración de cada etapa del pipeline.",
+                            ("etapa", "resultado"), LIMITES_ETAPA)
+SLIDE_SEGUNDOS = Histograma("videonews_slide_segundos",
+                            "Tiempo de cada slide dentro de su etapa (en chunking, por texto pedido al LLM).",
+                            ("etapa",), LIMITES_SLIDE)
+LLAMADA_SEGUNDOS = Histograma("videonews_proveedor_llamada_segundos",
+                              "Latencia de cada intento de llamada a una API.", ("proveedor", "resultado"))
+ESPERA_SEGUNDOS = Histograma("videonews_proveedor_espera_segundos",
+                             "Espera por presupuesto por minuto y concurrencia antes de cada intento.",
+                             ("proveedor",))
+LLAMADAS = Contador("videonews_proveedor_llamadas_total",
+                    "Intentos de llamada a una API por resultado (ok, reintento, error).", ("proveedor", "resultado"))
+REINTENTOS = Contador("videonews_proveedor_reintentos_total",
+                      "Reintentos por motivo (código HTTP o 'red').", ("proveedor", "motivo"))
+UNIDADES = Contador("videonews_proveedor_unidades_total",
+                    "Unidades enviadas: tokens estimados (chat) o caracteres (TTS).", ("proveedor",))
+JOBS = Contador("videonews_jobs_total", "Jobs terminados por resultado.", ("resultado",))
+
+_METRICAS = [ETAPA_SEGUNDOS, SLIDE_SEGUNDOS, LLAMADA_SEGUNDOS, ESPERA_SEGUNDOS, LLAMADAS, REINTENTOS, UNIDADES, JOBS]
+_caches = {}
+
+
+def registrar_cache(nombre: str, c):
+    """Expone los aciertos y fallos de una caché con `stats()` (cache.DiskCache / BlobStore)."""
+    _caches[nombre] = c
+
+
+def stats_caches() -> dict:
+    return {nombre: c.stats() for nombre, c in sorted(_caches.items())}
+
+
+def _exponer_caches() -> list:
+    stats = stats_caches()
+    lineas = []
+    for metrica, campo, ayuda in (("videonews_cache_aciertos_total", "hits", "Lecturas de caché con acierto."),
+                                  ("videonews_cache_fallos_total", "misses", "Lecturas de caché sin acierto.")):
+        lineas += [f"# HELP {metrica} {ayuda}", f"# TYPE {metrica} counter"]
+        lineas += [f'{metrica}{{cache="{nombre}"}} {st[campo]}' for nombre, st in stats.items()]
+    return lineas
+
+
+def exponer() -> str:
+    lineas = []
+    for m in _METRICAS:
+        lineas += m.exponer()
+    lineas += _exponer_caches()
+    return "\n".join(lineas) + "\n"
+
+
+@contextmanager
+def medir(histograma: Histograma, **etiquetas):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        histograma.observar(time.perf_counter() - inicio, **etiquetas)
+
+
+def instantanea() -> dict:
+    """Totales por proveedor y por caché, para restar el antes y el después de un job."""
+    proveedores = {}
+    for (proveedor, resultado), n in LLAMADAS.valores().items():
+        proveedores.setdefault(proveedor, {}).setdefault("llamadas", {})[resultado] = n
+    for (proveedor, _), v in LLAMADA_SEGUNDOS.valores().items():
+        p = proveedores.setdefault(proveedor, {})
+        p["segundos_llamadas"] = p.get("segundos_llamadas", 0) + v["suma"]
+    for (proveedor,), v in ESPERA_SEGUNDOS.valores().items():
+        proveedores.setdefault(proveedor, {})["segundos_espera"] = v["suma"]
+    for (proveedor,), n in UNIDADES.valores().items():
+        proveedores.setdefault(proveedor, {})["unidades"] = n
+    caches = {nombre: {"hits": st["hits"], "misses": st["misses"]} for nombre, st in stats_caches().items()}
+    return {"proveedores": proveedores, "caches": caches}
+
+
+def diferencia(antes, despues):
+    """`despues - antes` campo a campo (dicts anidados de números)."""
+    if isinstance(despues, dict):
+        antes = antes or {}
+        return {k: diferencia(antes.get(k), v) for k, v in despues.items()}
+    d = despues - (antes or 0)
+    return round(d, 3) if isinstance(d, float) else d
+
+
+def desde(antes: dict) -> dict:
+    """Lo que se sumó desde la `instantanea()` `antes`, con la tasa de aciertos de cada caché."""
+    resumen = diferencia(antes, instantanea())
+    for st in resumen["caches"].values():
+        total = st["hits"] + st["misses"]
+        st["hit_rate"] = round(st["hits"] / total, 3) if total else 0.0
+    return resumen
+
+
+def servir(puerto: int, host: str = "0.0.0.0"):
+    """Sirve `/metrics` en un hilo aparte (para procesos sin Flask, como worker.py)."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            cuerpo = exponer().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer((host, puerto), Handler)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
@@ -0,0 +1,269 @@
+"""Perfilado opcional de las etapas del pipeline (cProfile + tracemalloc).
+
+Se activa para todos los jobs con PROFILE_STAGES=1 o para uno solo con el
+campo `perfilar` de /run y /jobs. Por cada etapa deja en `<proyecto>/perfil/`:
+
+- `NN_<etapa>.pstats`: para `python -m pstats`, snakeviz, etc.;
+- `NN_<etapa>.collapsed`: pilas colapsadas (microsegundos) para flamegraph.pl
+  o speedscope;
+- `NN_<etapa>.alloc.txt`: pico de memoria y los sitios que más memoria
+  dejaron asignada durante la etapa.
+
+En Python 3.11 cProfile solo ve el hilo que lo activa, así que mientras dura
+la etapa cada hilo nuevo de un ThreadPoolExecutor (los pools de las etapas)
+arranca su propio perfil y al final se suman. Desde 3.12 cProfile usa
+sys.monitoring, que admite una sola herramienta por intérprete y ya ve todos
+los hilos: hay un único perfil del proceso, compartido por las etapas que se
+perfilan a la vez, y cada una se queda con lo acumulado entre su inicio y su
+fin. Ese perfil lleva una sola pila de llamadas para todos los hilos: los
+tiempos por función son correctos, pero las aristas llamador→llamado entre
+hilos se mezclan y el `.collapsed` es más aproximado que en 3.11. En ambos casos, si otro job trabaja en ese momento, también queda en el
+perfil. tracemalloc es global: con varias etapas perfilándose a la vez el pico
+reportado es el del proceso desde que empezó la primera de ellas.
+Un fallo del perfilado (p. ej. otra herramienta de perfilado ya activa) se
+informa y la etapa sigue sin perfil.
+Los procesos hijos no se perfilan: en el modo por etapas el runner renderiza
+los subtítulos en línea cuando perfila.
+"""
+import cProfile
+import os
+import pstats
+import re
+import sys
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+PROFILE_STAGES = os.getenv("PROFILE_STAGES", "0") == "1"
+# Sitios de asignación listados en el .alloc.txt
+TOP_ASIGNACIONES = int(os.getenv("PROFILE_TOP_ALLOCS", "25"))
+
+# 3.12+: un perfil para todo el proceso (ver arriba)
+PERFIL_GLOBAL = sys.version_info >= (3, 12)
+
+_lock = threading.Lock()
+_sesiones = []  # 3.11: listas de perfiles de hilos de las etapas que se están perfilando
+# 3.12+: el perfil del proceso lo activa la primera sesión y lo cierra la última
+_global = {"perfil": None, "activas": 0}
+# tracemalloc lo arranca la primera sesión y lo detiene la última (salvo que ya estuviera activo)
+_rastreo = {"activas": 0, "inicios": 0, "propio": False}
+
+
+def _perfilar_hilo(*args):
+    """Hook de threading.setprofile (3.11): el primer evento de un hilo nuevo le activa su perfil."""
+    sys.setprofile(None)
+    if not threading.current_thread().name.startswith("ThreadPoolExecutor"):
+        return  # servidores y hilos de larga vida quedarían perfilados para siempre
+    perfil = cProfile.Profile()
+    try:
+        perfil.enable()  # reemplaza este hook en el hilo actual
+    except (ValueError, RuntimeError):
+        return  # otra herramienta de perfilado activa: el hilo corre sin perfil
+    with _lock:
+        if not _sesiones:
+            perfil.disable()  # la etapa terminó mientras el hilo arrancaba
+        for hilos in _sesiones:
+            hilos.append(perfil)
+
+
+class _Instantanea:
+    """Stats ya calculadas con la interfaz que pstats.Stats espera de un perfil."""
+
+    def __init__(self, stats: dict):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def _stats_global() -> dict:
+    """Lo acumulado por el perfil del proceso hasta ahora, sin cerrarlo (con `_lock` tomado)."""
+    perfil = _global["perfil"]
+    perfil.disable()
+    perfil.snapshot_stats()
+    perfil.enable()
+    return perfil.stats
+
+
+def _restar(despues: dict, antes: dict) -> dict:
+    """Stats de cProfile acumuladas entre dos instantáneas del mismo perfil."""
+    resultado = {}
+    for func, (cc, nc, tt, ct, llamadores) in despues.items():
+        previo = antes.get(func)
+        if previo is None:
+            resultado[func] = (cc, nc, tt, ct, llamadores)
+            continue
+        if nc - previo[1] <= 0:
+            continue
+        llamadores = {f: tuple(a - b for a, b in zip(v, previo[4].get(f, (0, 0, 0, 0))))
+                      for f, v in llamadores.items()}
+        resultado[func] = (cc - previo[0], nc - previo[1], tt - previo[2], ct - previo[3],
+                           {f: v for f, v in llamadores.items() if v[0] > 0})
+    return resultado
+
+
+def _empezar_cprofile():
+    """Activa el perfil de la sesión. Devuelve su estado, o None si no se pudo perfilar."""
+    with _lock:
+        if PERFIL_GLOBAL:
+            if _global["perfil"] is None:
+                perfil = cProfile.Profile()
+                perfil.enable()
+                _global["perfil"], antes = perfil, {}
+            else:
+                antes = _stats_global()
+            _global["activas"] += 1
+            return {"antes": antes}
+        hilos = []
+        _sesiones.append(hilos)
+        threading.setprofile(_perfilar_hilo)
+    perfil = cProfile.Profile()
+    try:
+        perfil.enable()
+    except BaseException:
+        _cerrar_hilos(hilos)
+        raise
+    return {"perfil": perfil, "hilos": hilos}
+
+
+def _cerrar_hilos(hilos: list):
+    with _lock:
+        _sesiones.remove(hilos)
+        if not _sesiones:
+            threading.setprofile(None)
+
+
+def _terminar_cprofile(sesion: dict) -> pstats.Stats:
+    if PERFIL_GLOBAL:
+        with _lock:
+            _global["activas"] -= 1
+            if _global["activas"]:
+                despues = _stats_global()
+            else:
+                perfil, _global["perfil"] = _global["perfil"], None
+                perfil.disable()
+                perfil.snapshot_stats()
+                despues = perfil.stats
+        return pstats.Stats(_Instantanea(_restar(despues, sesion["antes"])))
+    sesion["perfil"].disable()
+    _cerrar_hilos(sesion["hilos"])
+    return pstats.Stats(sesion["perfil"], *sesion["hilos"])
+
+
+def _nombre_funcion(func) -> str:
+    archivo, linea, nombre = func
+    if archivo == "~":
+        return nombre  # built-ins: "<built-in method ...>"
+    return f"{nombre} ({Path(archivo).name}:{linea})".replace(";", ",")
+
+
+def pilas_colapsadas(stats: pstats.Stats, minimo_us: int = 1, max_profundidad: int = 64,
+                     resolucion: int = 20000, max_visitas: int = 200000) -> list:
+    """Reconstruye pilas "a;b;c microsegundos" a partir del grafo de llamadas.
+
+    cProfile guarda aristas llamador→llamado, no pilas completas: el tiempo de
+    cada función se reparte entre sus llamadores en proporción al tiempo que
+    pasó llamada desde cada uno, así que es una aproximación.
+
+    Los caminos del grafo crecen exponencialmente (LangChain tiene miles de
+    funciones): se descartan los de menos de 1/`resolucion` del tiempo total y
+    la búsqueda se corta a las `max_visitas` para no demorar el fin de la etapa.
+    """
+    llamados = {}
+    for func, (_, _, _, _, llamadores) in stats.stats.items():
+        for llamador in llamadores:
+            llamados.setdefault(llamador, []).append(func)
+    raices = [f for f, datos in stats.stats.items() if not datos[4]]
+    nombres = {func: _nombre_funcion(func) for func in stats.stats}
+    total_us = sum(stats.stats[r][3] for r in raices) * 1e6
+    minimo_us = max(minimo_us, total_us / resolucion)
+    pilas = {}
+    visitas = [0]
+
+    def visitar(func, pila, fraccion):
+        visitas[0] += 1
+        tt, ct = stats.stats[func][2], stats.stats[func][3]
+        pila = pila + (nombres[func],)
+        propio = int(tt * fraccion * 1e6)
+        if propio >= minimo_us:
+            pilas[";".join(pila)] = pilas.get(";".join(pila), 0) + propio
+        if len(pila) >= max_profundidad or not ct or visitas[0] >= max_visitas:
+            return
+        for hijo in llamados.get(func, ()):
+            if nombres[hijo] in pila:
+                continue  # recursión: su tiempo ya cuenta en el marco de más arriba
+            ct_hijo = stats.stats[hijo][3]
+            ct_desde_func = stats.stats[hijo][4][func][3]
+            if ct_hijo and ct_desde_func * fraccion * 1e6 >= minimo_us:
+                visitar(hijo, pila, fraccion * min(1.0, ct_desde_func / ct_hijo))
+
+    for raiz in raices:
+        visitar(raiz, (), 1.0)
+    return [f"{pila} {us}" for pila, us in sorted(pilas.items())]
+
+
+def _asignaciones(antes, despues, pico: int, top: int, compartido: bool = False) -> str:
+    filtros = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    diferencias = despues.filter_traces(filtros).compare_to(antes.filter_traces(filtros), "lineno")
+    if compartido:
+        titulo = "Pico de memoria de Python del proceso (otras etapas se perfilaban a la vez)"
+    else:
+        titulo = "Pico de memoria de Python durante la etapa"
+    lineas = [f"{titulo}: {pico / 2**20:.1f} MiB",
+              f"Top {top} sitios de asignación (crecimiento neto entre el inicio y el fin de la etapa):", ""]
+    for st in diferencias[:top]:
+        marco = st.traceback[0]
+        lineas.append(f"{st.size_diff / 1024:+10.1f} KiB  {st.count_diff:+8d} bloques  {marco.filename}:{marco.lineno}")
+    return "\n".join(lineas) + "\n"
+
+
+def _nombre_archivo(orden: int, etapa: str) -> str:
+    return f"{orden:02d}_{re.sub(r'[^A-Za-z0-9_-]+', '_', etapa)}"
+
+
+@contextmanager
+def perfilar_etapa(directorio: Path, orden: int, etapa: str):
+    """Perfila el bloque (y los hilos que cree) y escribe los tres archivos. Cede la ruta base.
+
+    Un error del perfilado nunca corta la etapa: se informa y se sigue sin perfil.
+    """
+    directorio.mkdir(parents=True, exist_ok=True)
+    base = directorio / _nombre_archivo(orden, etapa)
+    try:
+        sesion = _empezar_cprofile()
+    except (ValueError, RuntimeError) as e:  # p. ej. "Another profiling tool is already active"
+        print(f"⚠️ {etapa}: no se pudo activar cProfile ({e}); la etapa corre sin perfil de CPU")
+        sesion = None
+    with _lock:
+        if not _rastreo["activas"]:
+            _rastreo["propio"] = not tracemalloc.is_tracing()
+            if _rastreo["propio"]:
+                tracemalloc.start()
+            tracemalloc.reset_peak()  # solo sin otras sesiones: el pico es de todas
+        compartido = _rastreo["activas"] > 0
+        _rastreo["activas"] += 1
+        _rastreo["inicios"] += 1
+        inicio = _rastreo["inicios"]
+    # Mientras esta sesión cuente como activa nadie detiene tracemalloc
+    antes = tracemalloc.take_snapshot()
+    try:
+        yield base
+    finally:
+        despues = tracemalloc.take_snapshot()
+        pico = tracemalloc.get_traced_memory()[1]
+        with _lock:
+            compartido = compartido or _rastreo["activas"] > 1 or _rastreo["inicios"] != inicio
+            _rastreo["activas"] -= 1
+            if not _rastreo["activas"] and _rastreo["propio"]:
+                tracemalloc.stop()
+        try:
+            if sesion is not None:
+                stats = _terminar_cprofile(sesion)
+                stats.dump_stats(base.with_suffix(".pstats"))
+                base.with_suffix(".collapsed").write_text("\n".join(pilas_colapsadas(stats)) + "\n",
+                                                          encoding="utf-8")
+            base.with_suffix(".alloc.txt").write_text(
+                _asignaciones(antes, despues, pico, TOP_ASIGNACIONES, compartido), encoding="utf-8")
+        except Exception as e:
+            print(f"⚠️ {etapa}: no se pudo guardar el perfil en {base}: {e}")
@@ -0,0 +1,158 @@
+"""Pipeline por slide: cada slide avanza por sus etapas sin esperar al resto.
+
+En cuanto `splitter_script` devuelve los chunks arranca el TTS de cada uno; cada
+imagen sale apenas existe su `prompt_imagen` y cada subtítulo apenas existe su
+`texto_pantalla`. Al final se escriben `slides.json` y `config.json`; el XML se
+arma después con `generate_xml.py`, que necesita todos los slides completos.
+"""
+import os
+from concurrent.futures import FIRST_EXCEPTION, Future, ThreadPoolExecutor, wait
+
+import checkpoint
+import chunking
+import clientes
+import image_gen
+import subtitle_gen
+import voice_gen
+import workspace
+
+
+def encadenar(futuro, pool, fn, *args):
+    """Devuelve un Future que corre `fn(resultado, *args)` en `pool` cuando `futuro` termina."""
+    siguiente = Future()
+
+    def _copiar(f):
+        if f.cancelled():
+            siguiente.cancel()
+        elif f.exception() is not None:
+            siguiente.set_exception(f.exception())
+        else:
+            siguiente.set_result(f.result())
+
+    def _lanzar(f):
+        if f.cancelled():
+            siguiente.cancel()
+            return
+        if f.exception() is not None:
+            siguiente.set_exception(f.exception())
+            return
+        try:
+            pool.submit(fn, f.result(), *args).add_done_callback(_copiar)
+        except RuntimeError as e:  # el pool ya se cerró: el pipeline se cortó
+            siguiente.set_exception(e)
+
+    futuro.add_done_callback(_lanzar)
+    return siguiente
+
+
+def _texto(chain, slide, campo, manifiesto):
+    i, chunk = slide["slide"] - 1, slide["chunk"]
+    texto = chunking.texto_guardado(manifiesto, i, chunk, campo)
+    if texto is None:
+        texto = chunking._invocar(chain, chunk)
+        chunking.guardar_texto(manifiesto, i, chunk, campo, texto)
+    slide[campo] = texto
+    return texto
+
+
+def _subtitulo(_resultado, slide, subs_dir, manifiesto):
+    subtitle_gen.render_subtitle_slide(slide, subs_dir, manifiesto=manifiesto)
+
+
+def _imagen(_resultado, openai_client, slide, imgs_dir, manifiesto):
+    image_gen.generar_imagen_slide(openai_client, slide, imgs_dir, manifiesto)
+
+
+def _avisar(futuro, progreso, etapa, i):
+    """Future que termina después de avisar `progreso(etapa, i)`.
+
+    Falla si falla el slide o el aviso (p. ej. porque el job se canceló): un
+    callback de Future se tragaría esa excepción.
+    """
+    avisado = Future()
+
+    def _callback(f):
+        if f.cancelled():
+            avisado.cancel()
+        elif f.exception() is not None:
+            avisado.set_exception(f.exception())
+        else:
+            try:
+                if progreso:
+                    progreso(etapa, i)
+            except Exception as e:
+                avisado.set_exception(e)
+            else:
+                avisado.set_result(f.result())
+
+    futuro.add_done_callback(_callback)
+    return avisado
+
+
+def ejecutar(chunks, proyecto: workspace.Proyecto, chain, chain_visual, openai_client, tts_client, progreso=None,
+             manifiesto=None):
+    """Corre todas las etapas por slide. `progreso(etapa, i)` se llama al terminar cada una.
+
+    Con `manifiesto` cada salida terminada queda registrada y una corrida
+    posterior del mismo proyecto la salta.
+    """
+    imgs_dir = proyecto.imgs_dir
+    voice_dir = proyecto.voice_dir
+    subs_dir = proyecto.subs_dir
+    for d in (imgs_dir, voice_dir, subs_dir):
+        d.mkdir(parents=True, exist_ok=True)
+
+    slides = [chunking.crear_slide(i, chunk, None, None) for i, chunk in enumerate(chunks)]
+
+    with ThreadPoolExecutor(max_workers=chunking.LLM_MAX_CONCURRENCY) as llm_pool, \
+         ThreadPoolExecutor(max_workers=image_gen.IMAGE_WORKERS) as img_pool, \
+         ThreadPoolExecutor(max_workers=voice_gen.TTS_MAX_CONCURRENCY) as tts_pool, \
+         ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as subs_pool:
+        pendientes = []
+        for i, slide in enumerate(slides):
+            voz = tts_pool.submit(voice_gen.generar_voz_slide, tts_client, slide, voice_dir, manifiesto)
+
+            titulo = llm_pool.submit(_texto, chain, slide, "texto_pantalla", manifiesto)
+
+            prompt = llm_pool.submit(_texto, chain_visual, slide, "prompt_imagen", manifiesto)
+            img = encadenar(prompt, img_pool, _imagen, openai_client, slide, imgs_dir, manifiesto)
+
+            etapas = [("voice_gen", voz), ("texto_pantalla", titulo), ("prompt_imagen", prompt), ("image_gen", img)]
+            # Con títulos nativos (SUBTITLE_MODE=texto) el subtítulo lo escribe generate_xml: no hay PNG
+            if not subtitle_gen.TEXTO_NATIVO:
+                etapas.append(("subtitle_gen", encadenar(titulo, subs_pool, _subtitulo, slide, subs_dir, manifiesto)))
+            pendientes += [_avisar(futuro, progreso, etapa, i) for etapa, futuro in etapas]
+
+        hechos, faltan = wait(pendientes, return_when=FIRST_EXCEPTION)
+        if faltan:
+            # Falló un slide (o se canceló el job): lo que sigue en cola no gasta más llamadas
+            for pool in (llm_pool, img_pool, tts_pool, subs_pool):
+                pool.shutdown(wait=False, cancel_futures=True)
+        for f in pendientes:
+            if f in hechos:
+                f.result()  # propaga el primer error
+
+    return slides
+
+
+def main():
+    chunks = chunking.splitter_script(chunking.GUION)
+    llm = clientes.llm()
+    proyecto = workspace.Proyecto(chunking.PROYECTO, workspace.BASE_DIR / chunking.PROYECTO)
+    slides = ejecutar(
+        chunks,
+        proyecto,
+        chunking.prompt_template | llm,
+        chunking.prompt_visual | llm,
+        clientes.cliente_openai(),
+        clientes.cliente_tts(),
+        manifiesto=checkpoint.Manifiesto(proyecto.dir),
+    )
+
+    workspace.guardar_slides(proyecto, slides)
+    workspace.guardar_config(proyecto)
+
+    print(f"✅ Pipeline ({len(slides)} slides)")
+
+if __name__ == "__main__":
+    main()
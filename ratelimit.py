@@ -0,0 +1,276 @@
+"""Planificador de llamadas a APIs con límites de tasa.
+
+Cada proveedor (chat de OpenAI, imágenes de OpenAI, ElevenLabs) tiene:
+
+- dos token buckets: pedidos por minuto y unidades por minuto (tokens del LLM,
+  caracteres del TTS); se espera a que haya presupuesto antes de llamar;
+- un límite de concurrencia adaptativo (AIMD): se reduce a la mitad con cada
+  429 y sube de a uno tras una racha de llamadas exitosas;
+- reintentos con backoff exponencial con jitter completo, respetando
+  Retry-After cuando la API lo manda (acotado por `tope`).
+
+El proveedor es compartido por todas las etapas del proceso, así que en el
+runner el chat de `chunking` y el de `pipeline` comparten presupuesto.
+Los límites se configuran por variables de entorno (0 = sin límite); ver README.
+"""
+import email.utils
+import os
+import random
+import socket
+import sys
+import threading
+import time
+
+import metricas
+
+REINTENTABLES = {408, 409, 429, 500, 502, 503, 504}
+# Errores de socket transitorios. No todo OSError: un archivo que no se puede
+# escribir o una conexión rechazada (servicio local caído) no se arreglan esperando
+ERRORES_RED = (TimeoutError, ConnectionResetError, ConnectionAbortedError, BrokenPipeError, socket.gaierror)
+
+
+class TokenBucket:
+    """`por_minuto` unidades por minuto con ráfaga de hasta `capacidad` (por defecto, un minuto)."""
+
+    def __init__(self, por_minuto: float, capacidad: float = None):
+        self.tasa = por_minuto / 60.0
+        self.capacidad = capacidad or por_minuto
+        self.disponible = self.capacidad
+        self.ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _recargar(self):
+        ahora = time.monotonic()
+        self.disponible = min(self.capacidad, self.disponible + (ahora - self.ultimo) * self.tasa)
+        self.ultimo = ahora
+
+    def adquirir(self, n: float = 1):
+        # Un pedido mayor que la capacidad no puede esperar para siempre: se acota
+        n = min(n, self.capacidad)
+        while True:
+            with self._lock:
+                self._recargar()
+                if self.disponible >= n:
+                    self.disponible -= n
+                    return
+                espera = (n - self.disponible) / self.tasa
+            time.sleep(min(espera, 1.0))
+
+
+class ConcurrenciaAdaptativa:
+    """Semáforo cuyo límite baja a la mitad con cada throttling y sube de a uno con holgura."""
+
+    def __init__(self, maximo: int, racha: int = 10):
+        self.maximo = max(1, maximo)
+        self.limite = self.maximo
+        self.en_vuelo = 0
+        self.racha = racha
+        self._exitos = 0
+        self._cond = threading.Condition()
+
+    def entrar(self):
+        with self._cond:
+            while self.en_vuelo >= self.limite:
+                self._cond.wait()
+            self.en_vuelo += 1
+
+    def salir(self):
+        with self._cond:
+            self.en_vuelo -= 1
+            self._cond.notify_all()
+
+    def exito(self):
+        with self._cond:
+            self._exitos += 1
+            if self._exitos >= self.racha and self.limite < self.maximo:
+                self.limite += 1
+                self._exitos = 0
+                self._cond.notify_all()
+
+    def throttling(self):
+        with self._cond:
+            self.limite = max(1, self.limite // 2)
+            self._exitos = 0
+
+
+def _estado_http(e):
+    respuesta = getattr(e, "response", None)
+    estado = getattr(e, "status_code", None) or getattr(respuesta, "status_code", None)
+    headers = getattr(e, "headers", None) or getattr(respuesta, "headers", None) or {}
+    return estado, headers
+
+
+def es_reintentable(e) -> bool:
+    estado, _ = _estado_http(e)
+    if estado is not None:
+        # Un 429 por cuota agotada no se arregla esperando
+        return estado in REINTENTABLES and "insufficient_quota" not in str(e)
+    return isinstance(e, _errores_transporte()) or _error_requests(e)
+
+
+def _errores_transporte() -> tuple:
+    """Errores de red de httpx y del SDK de OpenAI, solo si ya están importados.
+
+    Si un módulo no está en sys.modules ninguna excepción puede venir de él, y
+    así ratelimit no arrastra los SDK al importarse.
+    """
+    clases = list(ERRORES_RED)
+    httpx = sys.modules.get("httpx")
+    if httpx is not None:
+        clases.append(httpx.TransportError)  # timeouts, ConnectError, ReadError, RemoteProtocolError...
+    openai = sys.modules.get("openai")
+    if openai is not None:
+        clases.append(openai.APIConnectionError)  # incluye APITimeoutError
+    return tuple(clases)
+
+
+def _error_requests(e) -> bool:
+    requests = sys.modules.get("requests")
+    if requests is None:
+        return False
+    excepciones = requests.exceptions
+    # HTTPError trae su código (ya evaluado); una URL o un esquema inválidos son ValueError
+    return isinstance(e, excepciones.RequestException) and not isinstance(e, (excepciones.HTTPError, ValueError))
+
+
+def retry_after(e):
+    """Segundos que pide la API en Retry-After / retry-after-ms (o None)."""
+    _, headers = _estado_http(e)
+    try:
+        ms, valor = headers.get("retry-after-ms"), headers.get("retry-after")
+    except AttributeError:
+        return None
+    try:
+        if ms is not None:
+            return max(0.0, float(ms) / 1000)
+    except ValueError:
+        pass
+    if valor is None:
+        return None
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+    try:
+        fecha = email.utils.parsedate_to_datetime(valor)
+    except (TypeError, ValueError):
+        return None  # ni segundos ni fecha HTTP: se usa el backoff normal
+    return max(0.0, fecha.timestamp() - time.time()) if fecha else None
+
+
+class Proveedor:
+    def __init__(self, nombre, rpm=0, upm=0, concurrencia=8, max_reintentos=6, base=1.0, tope=60.0):
+        self.nombre = nombre
+        self.pedidos = TokenBucket(rpm) if rpm else None
+        self.unidades = TokenBucket(upm) if upm else None
+        self.concurrencia = ConcurrenciaAdaptativa(concurrencia)
+        self.max_reintentos = max_reintentos
+        self.base = base
+        self.tope = tope
+        self.llamadas = 0
+        self.reintentos = 0
+        self.throttlings = 0
+        self._lock = threading.Lock()
+
+    def backoff(self, intento: int) -> float:
+        """Jitter completo: uniforme entre 0 y base·2^intento (acotado por `tope`)."""
+        return random.uniform(0, min(self.tope, self.base * 2 ** intento))
+
+    def llamar(self, fn, *args, unidades=0, **kwargs):
+        """Corre `fn(*args, **kwargs)` dentro de los límites del proveedor, reintentando errores transitorios."""
+        intento = 0
+        while True:
+            esperando = time.perf_counter()
+            if self.pedidos:
+                self.pedidos.adquirir(1)
+            if self.unidades and unidades:
+                self.unidades.adquirir(unidades)
+            self.concurrencia.entrar()
+            inicio = time.perf_counter()
+            metricas.ESPERA_SEGUNDOS.observar(inicio - esperando, proveedor=self.nombre)
+            if unidades:
+                metricas.UNIDADES.inc(unidades, proveedor=self.nombre)
+            try:
+                resultado = fn(*args, **kwargs)
+            except Exception as e:
+                estado, _ = _estado_http(e)
+                reintentar = es_reintentable(e) and intento < self.max_reintentos
+                self._medir(inicio, "reintento" if reintentar else "error")
+                if not reintentar:
+                    raise
+                if estado == 429:
+                    self.concurrencia.throttling()
+                espera = retry_after(e)
+                if espera is None:
+                    espera = self.backoff(intento)
+                # Un Retry-After enorme no deja al hilo dormido horas
+                espera = min(espera, self.tope)
+                with self._lock:
+                    self.reintentos += 1
+                    self.throttlings += estado == 429
+                metricas.REINTENTOS.inc(proveedor=self.nombre, motivo=estado or "red")
+                intento += 1
+            else:
+                self._medir(inicio, "ok")
+                self.concurrencia.exito()
+                with self._lock:
+                    self.llamadas += 1
+                return resultado
+            finally:
+                self.concurrencia.salir()
+            time.sleep(espera)
+
+    def _medir(self, inicio: float, resultado: str):
+        metricas.LLAMADA_SEGUNDOS.observar(time.perf_counter() - inicio, proveedor=self.nombre, resultado=resultado)
+        metricas.LLAMADAS.inc(proveedor=self.nombre, resultado=resultado)
+
+    def stats(self) -> dict:
+        return {
+            "llamadas": self.llamadas,
+            "reintentos": self.reintentos,
+            "throttlings": self.throttlings,
+            "concurrencia": self.concurrencia.limite,
+        }
+
+
+def _env(nombre, defecto):
+    return float(os.getenv(nombre, defecto))
+
+
+def _crear(nombre):
+    if nombre == "openai_chat":
+        return Proveedor(nombre, rpm=_env("LLM_RPM", "500"), upm=_env("LLM_TPM", "30000"),
+                         concurrencia=int(os.getenv("LLM_MAX_CONCURRENCY", "8")))
+    if nombre == "openai_images":
+        return Proveedor(nombre, rpm=_env("IMAGE_RPM", "15"),
+                         concurrencia=int(os.getenv("IMAGE_WORKERS", "4")))
+    if nombre == "elevenlabs":
+        return Proveedor(nombre, rpm=_env("TTS_RPM", "0"), upm=_env("TTS_CHARS_PER_MIN", "0"),
+                         concurrencia=int(os.getenv("TTS_MAX_CONCURRENCY", "4")))
+    raise KeyError(nombre)
+
+
+_proveedores = {}
+_proveedores_lock = threading.Lock()
+
+
+def proveedor(nombre) -> Proveedor:
+    with _proveedores_lock:
+        if nombre not in _proveedores:
+            _proveedores[nombre] = _crear(nombre)
+        return _proveedores[nombre]
+
+
+def reporte() -> str:
+    with _proveedores_lock:
+        items = list(_proveedores.items())
+    return "\n".join(
+        f"Límites {nombre}: {st['llamadas']} llamadas, {st['reintentos']} reintentos "
+        f"({st['throttlings']} por 429), concurrencia actual {st['concurrencia']}"
+        for nombre, st in ((n, p.stats()) for n, p in items)
+    )
+
+
+def estimar_tokens(texto: str, respuesta: int = 256) -> int:
+    """Aproximación de tokens (~4 caracteres por token) más lo que se espera de respuesta."""
+    return len(texto) // 4 + respuesta
@@ -0,0 +1,197 @@
+"""Ejecuta el pipeline dentro del proceso del servidor.
+
+Las etapas se importan una sola vez, los clientes de API se crean la primera
+vez que se usan y se reutilizan entre jobs, y la lista de slides pasa en
+memoria de una etapa a la siguiente (slides.json se escribe como salida, no
+como canal entre etapas).
+"""
+import time
+import traceback
+from datetime import datetime
+from pathlib import Path
+
+import checkpoint
+import chunking
+import clientes
+import generate_xml
+import image_gen
+import incremental
+import metricas
+import perfil
+import pipeline
+import ratelimit
+import subtitle_gen
+import voice_gen
+import workspace
+
+# Clientes compartidos con cualquier otra etapa que corra en el proceso (ver clientes.py)
+llm = clientes.llm
+openai_client = clientes.cliente_openai
+tts_client = clientes.cliente_tts
+
+
+class JobCancelado(Exception):
+    """El job se canceló desde afuera (p. ej. el worker perdió el lease)."""
+
+
+def ejecutar(nombre: str, guion: str, modo: str = "etapas", base_dir: Path = workspace.BASE_DIR,
+             on_evento=None, perfilar: bool = None, cancelado=None):
+    """Corre todas las etapas para un guion. Devuelve (ok, log, ruta_xml).
+
+    El proyecto viaja explícito a cada etapa (sin config.json), así que varios
+    jobs pueden correr a la vez; solo se serializan los que comparten carpeta.
+    `on_evento(dict)` recibe un evento al empezar/terminar cada etapa y cada slide.
+    Los tiempos del job quedan en `<proyecto>/tiempos.json` (ver `_ejecutar`).
+    Con `perfilar` (por defecto PROFILE_STAGES) cada etapa se perfila en `<proyecto>/perfil/`.
+    Si se activa el evento `cancelado`, el próximo slide o etapa corta el job.
+    """
+    nombre_proyecto = workspace.nombre_proyecto(nombre)
+    proyecto = workspace.Proyecto(nombre_proyecto, base_dir / nombre_proyecto)
+    on_evento = on_evento or (lambda evento: None)
+
+    def emitir(evento):
+        # Los eventos salen de cada slide y cada etapa: es el punto de corte de un job cancelado
+        if cancelado is not None and cancelado.is_set():
+            raise JobCancelado(f"job de {proyecto.nombre} cancelado")
+        on_evento(evento)
+
+    with workspace.bloqueo_proyecto(proyecto):
+        try:
+            ok, log, xml = _ejecutar(proyecto, guion, modo, emitir,
+                                     perfil.PROFILE_STAGES if perfilar is None else perfilar)
+        except JobCancelado as e:
+            metricas.JOBS.inc(resultado="cancelado")
+            return False, [f"[CANCELADO] {e}"], None
+    metricas.JOBS.inc(resultado="ok" if ok else "error")
+    return ok, log, xml
+
+
+def _ejecutar(proyecto: workspace.Proyecto, guion: str, modo: str, emitir, perfilar: bool):
+    log = []
+    # Un job que se cae a mitad de una etapa se retoma desde el último slide terminado
+    manifiesto = checkpoint.Manifiesto(proyecto.dir)
+    estado = {"slides": None, "xml": None, "inicio_etapa": None}
+    # tiempos.json: duración de cada etapa, en qué segundo de la etapa quedó listo
+    # cada slide, y lo que el job sumó a las llamadas a APIs y a las cachés
+    # (acumulados del proceso: si corren otros jobs a la vez, también suman lo suyo)
+    tiempos = {"proyecto": proyecto.nombre, "modo": modo, "inicio": datetime.now().isoformat(timespec="seconds"),
+               "etapas": []}
+    antes = metricas.instantanea()
+    inicio_job = time.perf_counter()
+    perfil_dir = proyecto.dir / "perfil"
+
+    def etapa(titulo, fn):
+        emitir({"tipo": "etapa", "etapa": titulo, "estado": "inicio"})
+        registro = {"etapa": titulo, "slides": []}
+        tiempos["etapas"].append(registro)
+        inicio = estado["inicio_etapa"] = time.perf_counter()
+        try:
+            if perfilar:
+                with perfil.perfilar_etapa(perfil_dir, len(tiempos["etapas"]), titulo):
+                    fn()
+            else:
+                fn()
+        except JobCancelado:
+            _cerrar(registro, "cancelado", round(time.perf_counter() - inicio, 2))
+            raise
+        except Exception as e:
+            segundos = round(time.perf_counter() - inicio, 2)
+            log.append(f"▶ {titulo}\n{traceback.format_exc()}[error {segundos:.1f}s]")
+            emitir({"tipo": "etapa", "etapa": titulo, "estado": "error", "segundos": segundos, "error": str(e)})
+            _cerrar(registro, "error", segundos)
+            return False
+        segundos = round(time.perf_counter() - inicio, 2)
+        log.append(f"▶ {titulo} [ok {segundos:.1f}s]")
+        emitir({"tipo": "etapa", "etapa": titulo, "estado": "ok", "segundos": segundos})
+        _cerrar(registro, "ok", segundos)
+        return True
+
+    def _cerrar(registro, resultado, segundos):
+        registro.update(resultado=resultado, segundos=segundos)
+        metricas.ETAPA_SEGUNDOS.observar(segundos, etapa=registro["etapa"], resultado=resultado)
+
+    def progreso(titulo):
+        def _progreso(i, total=None):
+            total = total or len(estado["slides"] or ())
+            registro = tiempos["etapas"][-1]
+            # En incremental/pipeline las sub-etapas reportan dentro de una sola etapa del runner
+            registro["slides"].append({"etapa": titulo, "slide": i + 1,
+                                       "listo_s": round(time.perf_counter() - estado["inicio_etapa"], 3)})
+            emitir({"tipo": "slide", "etapa": titulo, "slide": i + 1, "total": total})
+        return _progreso
+
+    def _chunking():
+        estado["slides"] = chunking.generar_slides_guion(guion, llm(), progreso=progreso("chunking"),
+                                                         manifiesto=manifiesto)
+        workspace.guardar_slides(proyecto, estado["slides"])
+
+    def _streaming():
+        chunks = chunking.splitter_script(guion)
+        estado["slides"] = pipeline.ejecutar(
+            chunks, proyecto, chunking.prompt_template | llm(), chunking.prompt_visual | llm(),
+            openai_client(), tts_client(),
+            progreso=lambda titulo, i: progreso(titulo)(i, len(chunks)),
+            manifiesto=manifiesto,
+        )
+        workspace.guardar_slides(proyecto, estado["slides"])
+
+    def _incremental():
+        chunks = chunking.splitter_script(guion)
+        estado["slides"], resumen = incremental.reconstruir(
+            proyecto, chunks, llm(), openai_client(), tts_client(),
+            progreso=lambda titulo, i, total: progreso(titulo)(i, total),
+            manifiesto=manifiesto,
+        )
+        log.append(resumen)
+
+    def _xml():
+        estado["xml"] = generate_xml.escribir_xml(proyecto.nombre, estado["slides"], proyecto.dir)
+
+    if incremental.disponible(proyecto):
+        etapas = [("incremental", _incremental)]
+    elif modo == "streaming":
+        etapas = [("pipeline", _streaming)]
+    else:
+        etapas = [
+            ("chunking", _chunking),
+            ("image_gen", lambda: image_gen.generar_imagenes(
+                openai_client(), estado["slides"], proyecto.imgs_dir, progreso=progreso("image_gen"),
+                manifiesto=manifiesto)),
+            ("voice_gen", lambda: voice_gen.generar_voces(
+                tts_client(), estado["slides"], proyecto.voice_dir, progreso=progreso("voice_gen"),
+                manifiesto=manifiesto)),
+        ]
+        # Con títulos nativos (SUBTITLE_MODE=texto) no hay nada que rasterizar
+        if not subtitle_gen.TEXTO_NATIVO:
+            # cProfile no ve los procesos del pool: al perfilar se renderiza en línea
+            etapas.append(("subtitle_gen", lambda: subtitle_gen.generar_subtitulos(
+                estado["slides"], proyecto.subs_dir, progreso=progreso("subtitle_gen"),
+                manifiesto=manifiesto, workers=1 if perfilar else None)))
+    etapas += [
+        ("slides.json", lambda: workspace.guardar_slides(proyecto, estado["slides"])),
+        ("generate_xml", _xml),
+    ]
+
+    def guardar_tiempos(ok):
+        tiempos.update(ok=ok, segundos=round(time.perf_counter() - inicio_job, 2),
+                       **metricas.desde(antes))
+        try:
+            workspace.guardar_tiempos(proyecto, tiempos)
+        except OSError as e:
+            log.append(f"WARNING: no se pudo guardar {proyecto.tiempos_path.name}: {e}")
+        if perfilar:
+            log.append(f"Perfiles por etapa (.pstats, .collapsed, .alloc.txt): {perfil_dir}")
+
+    for titulo, fn in etapas:
+        if not etapa(titulo, fn):
+            guardar_tiempos(False)
+            return False, log, None
+
+    incremental.guardar_huellas(proyecto)
+    log.append("\n".join(r() for r in (chunking.reporte_cache, image_gen.reporte_store, voice_gen.reporte_cache,
+                                       ratelimit.reporte)))
+    for c in (chunking.llm_cache, image_gen.image_store, voice_gen.audio_store):
+        c.evict()
+    guardar_tiempos(True)
+    log.append(f"Tiempos del job: {proyecto.tiempos_path}")
+    return True, log, str(estado["xml"])
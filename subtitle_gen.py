@@ -1,7 +1,22 @@
-import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
 from pathlib import Path
-from PIL import Image, ImageDraw, ImageFont
 import textwrap
+from typing import TYPE_CHECKING
+
+import cache
+import checkpoint
+import metricas
+import workspace
+
+if TYPE_CHECKING:  # solo para las anotaciones: PIL se importa recién al renderizar
+    from PIL import ImageDraw, ImageFont
 
 WIDTH = 1080
 HEIGHT = 1350
@@ -16,6 +31,15 @@ START_FONT_SIZE = 64
 MIN_FONT_SIZE = 36
 LINE_SPACING_RATIO = 0.12   
 
+# SUBTITLE_CROP=1: PNG del tamaño del recuadro (su ubicación va a slides.json)
+# en lugar de un cuadro completo de WIDTH x HEIGHT casi todo transparente
+SUBTITLE_CROP = os.getenv("SUBTITLE_CROP", "0") == "1"
+SUBTITLE_WORKERS = int(os.getenv("SUBTITLE_WORKERS", "0")) or os.cpu_count() or 1
+# SUBTITLE_MODE=texto: no se rasteriza nada; generate_xml escribe títulos de texto
+# editables con el mismo tamaño de fuente, cortes de línea y ubicación
+SUBTITLE_MODE = os.getenv("SUBTITLE_MODE", "png")
+TEXTO_NATIVO = SUBTITLE_MODE == "texto"
+
 CANDIDATE_FONTS = [
     "/System/Library/Fonts/Supplemental/Arial Unicode.ttf",
     "/System/Library/Fonts/SFNS.ttf",
@@ -25,94 +49,291 @@ CANDIDATE_FONTS = [
     "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
 ]
 
-def load_font(size: int) -> ImageFont.FreeTypeFont:
+@lru_cache(maxsize=None)
+def _ruta_fuente():
+    """Primera fuente de CANDIDATE_FONTS que se puede cargar; None = fuente por defecto de PIL.
+
+    Se resuelve una sola vez por proceso en lugar de sondear el disco en cada tamaño.
+    """
+    from PIL import ImageFont
     for fp in CANDIDATE_FONTS:
         p = Path(fp)
         if p.exists():
             try:
-                return ImageFont.truetype(str(p), size=size)
+                ImageFont.truetype(str(p), size=START_FONT_SIZE)
+                return str(p)
             except Exception:
                 continue
-    return ImageFont.load_default()
-
-def fit_text_to_box(draw: ImageDraw.ImageDraw, text: str, max_w: int, max_h: int) -> tuple[ImageFont.ImageFont, list[str]]:
-    """Reduce el font-size hasta que el bloque entre en el recuadro (max_w x max_h)."""
-    size = START_FONT_SIZE
-    while size >= MIN_FONT_SIZE:
-        font = load_font(size)
-        avg_char_w = draw.textlength("M", font=font) or 1
-        max_chars = max(8, int(max_w / avg_char_w))
-        wrapped = textwrap.wrap(text, width=max_chars)
-
-        line_h = font.getbbox("Ay")[3] - font.getbbox("Ay")[1]
-        line_spacing = int(line_h * LINE_SPACING_RATIO)
-        total_h = len(wrapped) * line_h + (len(wrapped) - 1) * line_spacing
-
-        w_max = 0
-        for line in wrapped:
+    return None
+
+# Un FT_Face de FreeType no se puede usar desde dos hilos a la vez (pipeline.py
+# renderiza subtítulos en paralelo): cada hilo guarda sus propias fuentes
+_fuentes = threading.local()
+
+def load_font(size: int) -> "ImageFont.FreeTypeFont":
+    from PIL import ImageFont
+    cache_hilo = _fuentes.__dict__.setdefault("por_tamano", {})
+    font = cache_hilo.get(size)
+    if font is None:
+        ruta = _ruta_fuente()
+        font = ImageFont.truetype(ruta, size=size) if ruta else ImageFont.load_default()
+        cache_hilo[size] = font
+    return font
+
+# Métricas por tamaño: son datos puros, se comparten entre hilos
+_altos_linea = {}
+_anchos_glifo = {}
+
+def _alto_linea(font, size: int) -> int:
+    alto = _altos_linea.get(size)
+    if alto is None:
+        bbox = font.getbbox("Ay")
+        alto = _altos_linea[size] = bbox[3] - bbox[1]
+    return alto
+
+def _ancho_estimado(font, size: int, line: str) -> float:
+    """Suma de avances de glifo cacheados; difiere de textlength solo por el kerning."""
+    anchos = _anchos_glifo.setdefault(size, {})
+    total = 0.0
+    for ch in line:
+        w = anchos.get(ch)
+        if w is None:
+            w = anchos[ch] = font.getlength(ch)
+        total += w
+    return total
+
+def _entra_a_lo_ancho(draw, font, size: int, lines: list[str], max_w: int) -> bool:
+    for line in lines:
+        w = _ancho_estimado(font, size, line)
+        # Cerca del borde el kerning puede decidir: ahí se mide exacto
+        if abs(w - max_w) <= 2 + 0.02 * w:
             w = draw.textlength(line, font=font)
-            if w > w_max:
-                w_max = w
-        if w_max <= max_w and total_h <= max_h:
+        if w > max_w:
+            return False
+    return True
+
+def _layout(draw, text: str, size: int, max_w: int, max_h: int):
+    font = load_font(size)
+    avg_char_w = _ancho_estimado(font, size, "M") or 1
+    max_chars = max(8, int(max_w / avg_char_w))
+    wrapped = textwrap.wrap(text, width=max_chars)
+
+    line_h = _alto_linea(font, size)
+    line_spacing = int(line_h * LINE_SPACING_RATIO)
+    total_h = len(wrapped) * line_h + (len(wrapped) - 1) * line_spacing
+    entra = total_h <= max_h and _entra_a_lo_ancho(draw, font, size, wrapped, max_w)
+    return entra, font, wrapped
+
+def fit_text_to_box(draw: "ImageDraw.ImageDraw", text: str, max_w: int, max_h: int) -> tuple["ImageFont.ImageFont", list[str]]:
+    """Reduce el font-size (de START_FONT_SIZE a MIN_FONT_SIZE, de a 2) hasta que el
+    bloque entre en el recuadro (max_w x max_h).
+
+    Recorrido lineal desde el más grande: con el cambio de tamaño cambia el corte
+    de líneas y que un tamaño entre no es monótono, así que una búsqueda binaria
+    podría elegir uno menor. Con fuentes y anchos de glifo en caché cada prueba es barata.
+    """
+    for size in range(START_FONT_SIZE, MIN_FONT_SIZE - 1, -2):
+        entra, font, wrapped = _layout(draw, text, size, max_w, max_h)
+        if entra:
             return font, wrapped
-        size -= 2
 
     font = load_font(MIN_FONT_SIZE)
     wrapped = textwrap.wrap(text, width= max(8, int(max_w / (draw.textlength("M", font=font) or 1))))
     return font, wrapped
 
-def main():
-    ROOT = Path(__file__).resolve().parent
-    CONFIG_PATH = ROOT / "config.json"
-    if not CONFIG_PATH.exists():
-        raise FileNotFoundError(f"No se encontró config.json en {CONFIG_PATH}")
-    config = json.loads(CONFIG_PATH.read_text(encoding="utf-8"))
-    proyecto = config.get("nombre_proyecto")
-    if not proyecto:
-        raise ValueError("config.json debe incluir 'nombre_proyecto'")
-
-    PROJ_DIR = ROOT / proyecto
-    SLIDES_PATH = PROJ_DIR / "slides.json"
-    if not SLIDES_PATH.exists():
-        raise FileNotFoundError(f"No se encontró slides.json en {SLIDES_PATH}")
-
-    slides = json.loads(SLIDES_PATH.read_text(encoding="utf-8"))
-    subs_dir = PROJ_DIR / "SUBS"
-    subs_dir.mkdir(parents=True, exist_ok=True)
+def _recuadro(text_screen: str):
+    """Fuente, líneas y recuadro (izquierda, arriba, ancho, alto) del subtítulo en el cuadro."""
+    from PIL import Image, ImageDraw
+    max_box_h = int(HEIGHT * BOX_MAX_HEIGHT_RATIO)
+    max_box_w = WIDTH - 2 * SAFE_MARGIN_X
 
-    for idx, slide in enumerate(slides, start=1):
-        text_screen = (slide.get("texto_pantalla") or "").strip()
-        if not text_screen:
-            text_screen = ""
+    medida = ImageDraw.Draw(Image.new("RGBA", (1, 1)))
+    font, lines = fit_text_to_box(medida, text_screen, max_box_w - 2*BOX_PADDING_X, max_box_h - 2*BOX_PADDING_Y)
+    line_h = font.getbbox("Ay")[3] - font.getbbox("Ay")[1]
+    line_spacing = int(line_h * LINE_SPACING_RATIO)
+    text_h = len(lines) * line_h + (len(lines) - 1) * line_spacing
+    text_w = max((medida.textlength(line, font=font) for line in lines), default=0)
 
-        im = Image.new("RGBA", (WIDTH, HEIGHT), (0, 0, 0, 0))
-        draw = ImageDraw.Draw(im)
+    box_w = min(max_box_w, int(text_w) + 2*BOX_PADDING_X)
+    box_h = min(max_box_h, int(text_h) + 2*BOX_PADDING_Y)
+    box_left = (WIDTH - box_w) // 2
+    box_top = HEIGHT - SAFE_MARGIN_BOTTOM - box_h
+    return font, lines, line_h, line_spacing, (box_left, box_top, box_w, box_h)
 
-        max_box_h = int(HEIGHT * BOX_MAX_HEIGHT_RATIO)
-        max_box_w = WIDTH - 2 * SAFE_MARGIN_X
+def titulo(text_screen: str) -> dict:
+    """Lo que necesita un título nativo del XML: texto con sus cortes, fuente, tamaño y ubicación."""
+    from PIL import ImageFont
+    font, lines, line_h, line_spacing, (box_left, box_top, box_w, box_h) = _recuadro(text_screen.strip())
+    familia = font.getname()[0] if isinstance(font, ImageFont.FreeTypeFont) else "Arial"
+    return {
+        "texto": "\n".join(lines),
+        "fuente": familia,
+        "tamano": font.size if isinstance(font, ImageFont.FreeTypeFont) else MIN_FONT_SIZE,
+        "interlineado": line_spacing,
+        "x": box_left, "y": box_top, "ancho": box_w + 1, "alto": box_h + 1,
+    }
 
-        font, lines = fit_text_to_box(draw, text_screen, max_box_w - 2*BOX_PADDING_X, max_box_h - 2*BOX_PADDING_Y)
-        line_h = font.getbbox("Ay")[3] - font.getbbox("Ay")[1]
-        line_spacing = int(line_h * LINE_SPACING_RATIO)
-        text_h = len(lines) * line_h + (len(lines) - 1) * line_spacing
-        text_w = max((draw.textlength(line, font=font) for line in lines), default=0)
+def render_subtitle(text_screen: str, out_path: Path, recortar: bool = None) -> dict:
+    """Dibuja el subtítulo y lo guarda como PNG. Devuelve su ubicación en el cuadro.
 
-        box_w = min(max_box_w, int(text_w) + 2*BOX_PADDING_X)
-        box_h = min(max_box_h, int(text_h) + 2*BOX_PADDING_Y)
-        box_left = (WIDTH - box_w) // 2
-        box_top = HEIGHT - SAFE_MARGIN_BOTTOM - box_h
+    Con `recortar` el PNG mide solo el recuadro (x, y, ancho, alto en píxeles del
+    cuadro de WIDTH x HEIGHT); sin él es el cuadro completo transparente.
+    """
+    from PIL import Image, ImageDraw
+    recortar = SUBTITLE_CROP if recortar is None else recortar
+    font, lines, line_h, line_spacing, (box_left, box_top, box_w, box_h) = _recuadro(text_screen)
 
-        draw.rectangle([box_left, box_top, box_left + box_w, box_top + box_h], fill=BOX_BG)
+    # El rectángulo incluye sus dos bordes: ocupa box_w + 1 x box_h + 1 píxeles
+    if recortar:
+        ubicacion = {"x": box_left, "y": box_top, "ancho": box_w + 1, "alto": box_h + 1}
+    else:
+        ubicacion = {"x": 0, "y": 0, "ancho": WIDTH, "alto": HEIGHT}
+    # Desplazar el origen por enteros deja los píxeles idénticos a recortar el cuadro completo
+    ox, oy = ubicacion["x"], ubicacion["y"]
+    im = Image.new("RGBA", (ubicacion["ancho"], ubicacion["alto"]), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(im)
 
-        y = box_top + BOX_PADDING_Y
-        for line in lines:
-            w = draw.textlength(line, font=font)
-            x = box_left + (box_w - w) // 2
-            draw.text((x, y), line, font=font, fill=TEXT_FILL)
-            y += line_h + line_spacing
+    draw.rectangle([box_left - ox, box_top - oy, box_left + box_w - ox, box_top + box_h - oy], fill=BOX_BG)
+
+    y = box_top + BOX_PADDING_Y
+    for line in lines:
+        w = draw.textlength(line, font=font)
+        x = box_left + (box_w - w) // 2
+        draw.text((x - ox, y - oy), line, font=font, fill=TEXT_FILL)
+        y += line_h + line_spacing
+
+    # Temporal + rename: un PNG a medio escribir nunca queda con el nombre final
+    fd, tmp = tempfile.mkstemp(suffix=".png", prefix=".tmp_", dir=Path(out_path).parent)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            im.save(f, format="PNG")
+        os.replace(tmp, out_path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return ubicacion
+
+def nombre_subtitulo(numero_slide: int) -> str:
+    return f"sub_{numero_slide:04d}.png"
+
+def clave_subtitulo(text_screen: str) -> str:
+    return cache.clave(text_screen, WIDTH, HEIGHT, BOX_MAX_HEIGHT_RATIO, START_FONT_SIZE, MIN_FONT_SIZE,
+                       SUBTITLE_CROP)
+
+def anotar_ubicacion(slide: dict, ubicacion: dict):
+    """Guarda en el slide dónde va un subtítulo recortado (generate_xml lo posiciona con Center)."""
+    if ubicacion and (ubicacion["ancho"], ubicacion["alto"]) != (WIDTH, HEIGHT):
+        slide["subtitulo"] = ubicacion
+    else:
+        slide.pop("subtitulo", None)
+
+def _pendiente(slide: dict, subs_dir: Path, numero: int, manifiesto):
+    """(texto, ruta, clave) si hay que renderizar; None si el manifiesto ya lo tiene (y anota su ubicación)."""
+    text_screen = (slide.get("texto_pantalla") or "").strip()
+    nombre = nombre_subtitulo(slide.get("slide", numero))
+    out_path = subs_dir / nombre
+    k = clave_subtitulo(text_screen)
+    datos = manifiesto.vigente("subtitulos", nombre, k, out_path) if manifiesto else None
+    if datos is not None:
+        anotar_ubicacion(slide, datos.get("ubicacion"))
+        return None
+    return text_screen, out_path, k
+
+def _terminar(slide: dict, out_path: Path, k: str, ubicacion: dict, manifiesto):
+    anotar_ubicacion(slide, ubicacion)
+    if manifiesto:
+        manifiesto.marcar("subtitulos", out_path.name, k, out_path, ubicacion=ubicacion)
+
+def _render_medido(text_screen: str, out_path: Path, recortar: bool = None):
+    """render_subtitle + sus segundos (en el pool, el tiempo se mide en el proceso hijo)."""
+    inicio = time.perf_counter()
+    ubicacion = render_subtitle(text_screen, out_path, recortar)
+    return ubicacion, time.perf_counter() - inicio
+
+def render_subtitle_slide(slide: dict, subs_dir: Path, numero: int = None, manifiesto=None):
+    """Renderiza el subtítulo de un slide salvo que el manifiesto ya lo tenga completo."""
+    pendiente = _pendiente(slide, subs_dir, numero, manifiesto)
+    if pendiente is None:
+        return
+    text_screen, out_path, k = pendiente
+    ubicacion, segundos = _render_medido(text_screen, out_path)
+    metricas.SLIDE_SEGUNDOS.observar(segundos, etapa="subtitle_gen")
+    _terminar(slide, out_path, k, ubicacion, manifiesto)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _pool_procesos() -> ProcessPoolExecutor:
+    """Pool de SUBTITLE_WORKERS procesos compartido por todas las llamadas y jobs del proceso.
+
+    Con forkserver (spawn donde no existe) y no fork: el servidor y los workers
+    tienen hilos, y un hijo creado con fork puede heredar un lock tomado por otro
+    hilo y colgarse. Los hijos viven lo que el proceso, así que conservan las
+    cachés de fuentes y de anchos de glifo de un job al siguiente.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            metodo = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=SUBTITLE_WORKERS, mp_context=multiprocessing.get_context(metodo))
+        return _pool
+
+
+def _descartar_pool(pool: ProcessPoolExecutor):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def generar_subtitulos(slides: list, subs_dir: Path, progreso=None, manifiesto=None, workers=None):
+    """Renderiza los subtítulos en el pool de procesos compartido (SUBTITLE_WORKERS).
+
+    El render es CPU puro (layout + codificación PNG), así que escala con procesos
+    y no con hilos. Con `workers=1` (o un solo subtítulo pendiente) se renderiza
+    en línea. `progreso(i)` se llama al terminar cada subtítulo, en orden.
+    """
+    subs_dir.mkdir(parents=True, exist_ok=True)
+    pendientes = [_pendiente(slide, subs_dir, idx, manifiesto) for idx, slide in enumerate(slides, start=1)]
+    trabajos = [p for p in pendientes if p is not None]
+    workers = min(workers or SUBTITLE_WORKERS, len(trabajos))
+
+    pool = _pool_procesos() if workers > 1 else None
+    futuros = {}
+    try:
+        for idx, pendiente in enumerate(pendientes):
+            if pendiente is not None and pool:
+                text_screen, out_path, _ = pendiente
+                futuros[idx] = pool.submit(_render_medido, text_screen, out_path, SUBTITLE_CROP)
+        for idx, (slide, pendiente) in enumerate(zip(slides, pendientes)):
+            if pendiente is not None:
+                text_screen, out_path, k = pendiente
+                ubicacion, segundos = futuros[idx].result() if pool else _render_medido(text_screen, out_path)
+                metricas.SLIDE_SEGUNDOS.observar(segundos, etapa="subtitle_gen")
+                _terminar(slide, out_path, k, ubicacion, manifiesto)
+            if progreso:
+                progreso(idx)
+    except BrokenProcessPool:
+        _descartar_pool(pool)  # murió un hijo: el próximo job arma un pool nuevo
+        raise
+    finally:
+        # El pool es compartido: ante un error o un job cancelado solo se descarta lo de este job
+        for futuro in futuros.values():
+            futuro.cancel()
+    return slides
+
+def main():
+    proyecto = workspace.cargar_proyecto()
+    if not proyecto.slides_path.exists():
+        raise FileNotFoundError(f"No se encontró slides.json en {proyecto.slides_path}")
 
-        out_path = subs_dir / f"sub_{idx:04d}.png"
-        im.save(out_path, format="PNG")
+    slides = workspace.cargar_slides(proyecto)
+    generar_subtitulos(slides, proyecto.subs_dir, manifiesto=checkpoint.Manifiesto(proyecto.dir))
+    # Con SUBTITLE_CROP=1 cada slide lleva la ubicación de su subtítulo recortado
+    workspace.guardar_slides(proyecto, slides)
 
     print(f"✅ Subs")
 
@@ -1,69 +1,263 @@
 import os
-import json
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from elevenlabs import VoiceSettings, save
-from elevenlabs.client import ElevenLabs
+
+import cache
+import checkpoint
+import clientes
+import fakes
+import metricas
+import ratelimit
+import workspace
 
 load_dotenv()
 api_key = os.getenv("ELEVENLABS_API_KEY")
-client = ElevenLabs(api_key=api_key)
 
-with open("config.json", "r", encoding="utf-8") as f:
-    config = json.load(f)
+VOICE_ID = "iDEmt5MnqUotdwCIVplo"
+MODEL_ID = "eleven_multilingual_v2"
+OUTPUT_FORMAT = "mp3_44100_128"
+VOICE_SETTINGS = {
+    "stability": 0.5,
+    "similarity_boost": 0.5,
+    "style": 0.5,
+    "use_speaker_boost": True,
+}
+FPS = 30
 
-PROYECTO = config["nombre_proyecto"]
-VOICE_DIR = f"{PROYECTO}/VOICE"
-SLIDES_PATH = f"{PROYECTO}/slides.json"
-os.makedirs(VOICE_DIR, exist_ok=True)
+# Conversiones TTS simultáneas contra ElevenLabs
+TTS_MAX_CONCURRENCY = int(os.getenv("TTS_MAX_CONCURRENCY", "4"))
 
-with open(f"{PROYECTO}/slides.json", "r", encoding="utf-8") as f:
-    slides = json.load(f)
+# Caché de audios (intros, outros, segmentos recurrentes); AUDIO_CACHE=0 la desactiva
+audio_store = cache.BlobStore(
+    cache.CACHE_DIR / "audio",
+    ext=".mp3",
+    max_bytes=int(os.getenv("AUDIO_CACHE_MAX_MB", "1024")) * 1024 * 1024,
+    activa=os.getenv("AUDIO_CACHE", "1") != "0",
+)
+metricas.registrar_cache("audio", audio_store)
 
-VOICE_ID = "iDEmt5MnqUotdwCIVplo"
-MODEL_ID = "eleven_multilingual_v2"
+# Tablas MPEG para Layer III (kbps / Hz), indexadas por los bits del header
+_BITRATES = {
+    "1": [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    "2": [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_SAMPLE_RATES = {
+    "1": [44100, 48000, 32000],
+    "2": [22050, 24000, 16000],
+    "2.5": [11025, 12000, 8000],
+}
+
+
+def crear_cliente():
+    if fakes.ACTIVOS:
+        return fakes.cliente_tts()
+    # ELEVENLABS_BASE_URL permite apuntar a un servidor local (fake_api.py)
+    from elevenlabs.client import ElevenLabs
+    base_url = os.getenv("ELEVENLABS_BASE_URL")
+    kwargs = {"base_url": base_url} if base_url else {}
+    return ElevenLabs(api_key=api_key, httpx_client=clientes.http_elevenlabs(), timeout=clientes.HTTP_READ_TIMEOUT,
+                      **kwargs)
+
+
+class MedidorMP3:
+    """Mide la duración de un MP3 contando sus frames a medida que llegan los bytes.
+
+    Evita reabrir el archivo con mutagen después de escribirlo. Solo entiende
+    MPEG Layer III (lo que devuelve ElevenLabs); ignora tags ID3 y el frame
+    Xing/Info si lo hubiera.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._saltar = 0
+        self._primer_frame = True
+        self.muestras = 0
+        self.sample_rate = 0
+
+    @property
+    def duracion_segundos(self) -> float:
+        return self.muestras / self.sample_rate if self.sample_rate else 0.0
+
+    def feed(self, datos: bytes):
+        self._buffer += datos
+        self._procesar()
+
+    def _procesar(self):
+        buf = self._buffer
+        while True:
+            if self._saltar:
+                n = min(self._saltar, len(buf))
+                del buf[:n]
+                self._saltar -= n
+                if self._saltar:
+                    return
+
+            if self._primer_frame and buf[:3] == b"ID3":
+                if len(buf) < 10:
+                    return
+                tam = (buf[6] << 21) | (buf[7] << 14) | (buf[8] << 7) | buf[9]
+                self._saltar = 10 + tam + (10 if buf[5] & 0x10 else 0)
+                continue
+
+            if len(buf) < 4:
+                return
+            frame = self._leer_header(buf)
+            if frame is None:
+                del buf[:1]  # re-sincroniza
+                continue
 
-for i, slide in enumerate(slides, start=1):
-    texto = slide["chunk"]
-    nombre_archivo = slide["nombre_audio"]
-    ruta_salida = os.path.join(VOICE_DIR, nombre_archivo)
+            largo, muestras, sample_rate = frame
+            if self._primer_frame:
+                # El frame Xing/Info es silencio con metadatos: no suma duración
+                if len(buf) < min(largo, 64):
+                    return
+                cabecera = bytes(buf[:min(largo, 64)])
+                if b"Xing" not in cabecera and b"Info" not in cabecera:
+                    self.muestras += muestras
+                self._primer_frame = False
+            else:
+                self.muestras += muestras
+            self.sample_rate = sample_rate
+            self._saltar = largo
 
+    @staticmethod
+    def _leer_header(buf):
+        if buf[0] != 0xFF or (buf[1] & 0xE0) != 0xE0:
+            return None
+        version_bits = (buf[1] >> 3) & 0x03
+        layer_bits = (buf[1] >> 1) & 0x03
+        if version_bits == 0b01 or layer_bits != 0b01:
+            return None
+        version = {0b11: "1", 0b10: "2", 0b00: "2.5"}[version_bits]
+        bitrate_idx = buf[2] >> 4
+        sr_idx = (buf[2] >> 2) & 0x03
+        if bitrate_idx in (0, 15) or sr_idx == 3:
+            return None
+        bitrate = _BITRATES["1" if version == "1" else "2"][bitrate_idx] * 1000
+        sample_rate = _SAMPLE_RATES[version][sr_idx]
+        padding = (buf[2] >> 1) & 0x01
+        if version == "1":
+            return 144 * bitrate // sample_rate + padding, 1152, sample_rate
+        return 72 * bitrate // sample_rate + padding, 576, sample_rate
+
+
+def clave_voz(texto):
+    return cache.clave(texto, VOICE_ID, MODEL_ID, OUTPUT_FORMAT, VOICE_SETTINGS)
+
+
+def _sintetizar(client, texto, ruta_salida):
+    from elevenlabs import VoiceSettings
     audio_stream = client.text_to_speech.convert(
         text=texto,
         voice_id=VOICE_ID,
         model_id=MODEL_ID,
-        output_format="mp3_44100_128",
-        voice_settings=VoiceSettings(
-            stability=0.5,
-            similarity_boost=0.5,
-            style=0.5,
-            use_speaker_boost=True
-        )
+        output_format=OUTPUT_FORMAT,
+        voice_settings=VoiceSettings(**VOICE_SETTINGS)
     )
 
-    save(audio_stream, ruta_salida)
+    medidor = MedidorMP3()
+    fd, nombre_temporal = tempfile.mkstemp(suffix=".mp3", prefix=".tmp_", dir=os.path.dirname(ruta_salida))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for bloque in audio_stream:
+                if bloque:
+                    f.write(bloque)
+                    medidor.feed(bloque)
+        os.replace(nombre_temporal, ruta_salida)
+    except BaseException:
+        if os.path.exists(nombre_temporal):
+            os.remove(nombre_temporal)
+        raise
+    return medidor
 
 
-from mutagen.mp3 import MP3
+def generar_voz(client, texto, ruta_salida):
+    """Sintetiza `texto` en `ruta_salida` y devuelve su duración en segundos."""
+    k = clave_voz(texto)
+    meta = audio_store.get(k, ruta_salida)
+    if meta is not None:
+        return meta["duracion_segundos"]
 
-FPS = 30
+    inicio = time.perf_counter()
+    # El stream entero va dentro del reintento: el error de la API puede llegar al empezar a leerlo
+    medidor = ratelimit.proveedor("elevenlabs").llamar(_sintetizar, client, texto, ruta_salida,
+                                                         unidades=len(texto))
 
-with open(SLIDES_PATH, "r", encoding="utf-8") as f:
-    slides = json.load(f)
+    if medidor.muestras:
+        duracion = medidor.duracion_segundos
+    else:
+        # Formato inesperado: se recurre a mutagen
+        from mutagen.mp3 import MP3
+        duracion = MP3(ruta_salida).info.length
 
-for slide in slides:
-    nombre_audio = slide["nombre_audio"]
-    ruta_audio = os.path.join(VOICE_DIR, nombre_audio)
+    audio_store.put(k, ruta_salida, {
+        "duracion_segundos": duracion,
+        "segundos": round(time.perf_counter() - inicio, 2),
+    })
+    return duracion
 
-    # Obtener duración del .mp3
-    audio = MP3(ruta_audio)
-    duracion_segundos = audio.info.length
-    duracion_frames = int(duracion_segundos * FPS)
 
-    # Guardar en el slide
+def anotar_duracion(slide, duracion_segundos):
     slide["duracion_segundos"] = round(duracion_segundos, 2)
-    slide["duracion_frames"] = duracion_frames
+    slide["duracion_frames"] = int(duracion_segundos * FPS)
+
+
+def generar_voz_slide(client, slide, voice_dir, manifiesto=None):
+    """Sintetiza el audio de un slide (o lo toma del manifiesto) y anota su duración."""
+    ruta = os.path.join(voice_dir, slide["nombre_audio"])
+    k = clave_voz(slide["chunk"])
+    datos = manifiesto.vigente("voces", slide["nombre_audio"], k, ruta) if manifiesto else None
+    if datos is not None:
+        duracion = datos["duracion_segundos"]
+    else:
+        with metricas.medir(metricas.SLIDE_SEGUNDOS, etapa="voice_gen"):
+            duracion = generar_voz(client, slide["chunk"], ruta)
+        if manifiesto:
+            manifiesto.marcar("voces", slide["nombre_audio"], k, ruta, duracion_segundos=duracion)
+    anotar_duracion(slide, duracion)
+
+
+def generar_voces(client, slides, voice_dir, max_concurrency=TTS_MAX_CONCURRENCY, progreso=None, manifiesto=None):
+    """Genera todos los audios en paralelo y anota la duración en cada slide.
+
+    `progreso(i)` se llama al terminar cada audio, en orden. Con `manifiesto`
+    se saltan los audios que ya quedaron completos en una corrida anterior.
+    """
+    os.makedirs(voice_dir, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+        futuros = [pool.submit(generar_voz_slide, client, slide, voice_dir, manifiesto) for slide in slides]
+        try:
+            for i, futuro in enumerate(futuros):
+                futuro.result()
+                if progreso:
+                    progreso(i)
+        except BaseException:
+            # Un error o un job cancelado: lo que sigue en cola no arranca
+            pool.shutdown(cancel_futures=True)
+            raise
+    return slides
+
+
+def reporte_cache():
+    st = audio_store.stats()
+    return f"Caché de audio: {st['hits']} aciertos, {st['misses']} sintetizados"
+
+
+def main():
+    proyecto = workspace.cargar_proyecto()
+    slides = workspace.cargar_slides(proyecto)
+
+    generar_voces(clientes.cliente_tts(), slides, proyecto.voice_dir, manifiesto=checkpoint.Manifiesto(proyecto.dir))
+
+    if audio_store.activa:
+        print(reporte_cache())
+        audio_store.evict()
+
+    workspace.guardar_slides(proyecto, slides)
 
-with open(SLIDES_PATH, "w", encoding="utf-8") as f:
-    json.dump(slides, f, indent=2, ensure_ascii=False)
+    print(f"✅ Voices")
 
-print(f"✅ Voices")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Worker de la cola durable: toma jobs de JOB_QUEUE_DB y corre el pipeline.
+
+Se pueden lanzar varios en la misma máquina o en otras que compartan el
+filesystem (la base de la cola y las carpetas de proyecto):
+
+    JOB_QUEUE_DB=/mnt/videonews/cola.db python worker.py --concurrencia 2
+
+Cada worker corre hasta `--concurrencia` jobs a la vez y renueva el lease de
+cada uno cada `lease/3` segundos. Con SIGTERM/Ctrl+C deja de tomar jobs nuevos
+y termina los que tiene en curso.
+"""
+import argparse
+import os
+import signal
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from pathlib import Path
+
+import job_queue
+import metricas
+import workspace
+
+
+class Worker:
+    def __init__(self, cola: job_queue.ColaJobs, ejecutar, concurrencia=1, espera=1.0, nombre=None):
+        self.cola = cola
+        self.ejecutar = ejecutar
+        self.concurrencia = concurrencia
+        self.espera = espera
+        self.nombre = nombre or f"{socket.gethostname()}:{os.getpid()}"
+        self.detener = threading.Event()
+
+    def correr(self):
+        hilos = [
+            threading.Thread(target=self._bucle, name=f"{self.nombre}#{i}", daemon=True)
+            for i in range(self.concurrencia)
+        ]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+
+    def _bucle(self):
+        # Cada hilo es un slot con identidad propia: el lease es por slot, no por proceso
+        slot = f"{threading.current_thread().name}/{uuid.uuid4().hex[:6]}"
+        while not self.detener.is_set():
+            fila = self.cola.tomar(slot)
+            if fila is None:
+                self.detener.wait(self.espera)
+                continue
+            self._correr_job(fila, slot)
+
+    def _correr_job(self, fila, slot):
+        job_id = fila["id"]
+        fin_latido = threading.Event()
+        cancelado = threading.Event()
+
+        def latido():
+            renovado = time.monotonic()
+            while not fin_latido.wait(self.cola.lease_segundos / 3):
+                try:
+                    vigente = self.cola.renovar(job_id, slot)
+                except sqlite3.Error as e:
+                    # Base bloqueada o filesystem compartido caído: se reintenta en el próximo
+                    # latido, salvo que el lease ya haya vencido
+                    if time.monotonic() - renovado < self.cola.lease_segundos:
+                        print(f"⚠️ {slot} no pudo renovar el lease de {job_id}: {e}")
+                        continue
+                    vigente = False
+                if not vigente:
+                    # Otro worker puede retomar el job: este deja de escribir en el proyecto
+                    print(f"⚠️ {slot} perdió el lease de {job_id}: se cancela")
+                    cancelado.set()
+                    return
+                renovado = time.monotonic()
+
+        hilo_latido = threading.Thread(target=latido, daemon=True)
+        hilo_latido.start()
+        try:
+            ok, log, xml = self.ejecutar(fila["nombre"], fila["guion"], fila["modo"],
+                                         lambda evento: self.cola.emitir(job_id, slot, evento),
+                                         perfilar=bool(fila["perfilar"]) or None, cancelado=cancelado)
+        except Exception:
+            ok, log, xml = False, [f"[EXCEPTION]\n{traceback.format_exc()}"], None
+        finally:
+            fin_latido.set()
+            hilo_latido.join()
+        if self.cola.terminar(job_id, slot, ok, log, xml):
+            print(f"{'✅' if ok else '❌'} {job_id} ({fila['nombre']}) en {slot}")
+
+
+def _ejecutar_runner(base_dir):
+    import runner
+
+    def ejecutar(nombre, guion, modo, emitir, perfilar=None, cancelado=None):
+        return runner.ejecutar(nombre, guion, modo=modo, base_dir=base_dir, on_evento=emitir, perfilar=perfilar,
+                               cancelado=cancelado)
+    return ejecutar
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=os.getenv("JOB_QUEUE_DB"), help="ruta de la base de la cola (JOB_QUEUE_DB)")
+    parser.add_argument("--concurrencia", type=int, default=int(os.getenv("WORKER_CONCURRENCY", "1")))
+    parser.add_argument("--lease", type=float, default=float(os.getenv("JOB_LEASE_SECONDS", "60")))
+    parser.add_argument("--base-dir", type=Path, default=workspace.BASE_DIR,
+                        help="carpeta donde se crean los proyectos (compartida entre máquinas)")
+    parser.add_argument("--puerto-metricas", type=int, default=int(os.getenv("WORKER_METRICS_PORT", "0")),
+                        help="sirve /metrics de Prometheus en este puerto (0 = no)")
+    args = parser.parse_args()
+    if not args.db:
+        parser.error("falta --db o JOB_QUEUE_DB")
+
+    cola = job_queue.ColaJobs(args.db, lease_segundos=args.lease)
+    worker = Worker(cola, _ejecutar_runner(args.base_dir), concurrencia=max(1, args.concurrencia))
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: worker.detener.set())
+
+    if args.puerto_metricas:
+        metricas.servir(args.puerto_metricas)
+    print(f"👷 {worker.nombre}: {worker.concurrencia} slot(s) sobre {args.db}")
+    worker.correr()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Contexto explícito de proyecto y workspace por job.
+
+Cada job tiene su carpeta `jobs/<job_id>/` con su propio `config.json`, así
+dos ejecuciones simultáneas nunca se pisan el puntero al proyecto. En modo
+subproceso la ruta de ese config viaja en la variable VIDEONEWS_CONFIG; sin
+ella se usa el `config.json` de la raíz como siempre (uso por CLI). El
+workspace se borra cuando el job termina bien; si falla queda para depurar.
+"""
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import date
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo se serializa dentro del proceso
+    fcntl = None
+
+import cache
+
+BASE_DIR = Path(__file__).resolve().parent
+JOBS_DIR = Path(os.getenv("VIDEONEWS_JOBS_DIR") or BASE_DIR / "jobs")
+
+
+def nombre_proyecto(nombre: str) -> str:
+    return f"video_{nombre}_{date.today().isoformat()}"
+
+
+@dataclass(frozen=True)
+class Proyecto:
+    nombre: str
+    dir: Path
+
+    @property
+    def imgs_dir(self) -> Path:
+        return self.dir / "IMGS"
+
+    @property
+    def voice_dir(self) -> Path:
+        return self.dir / "VOICE"
+
+    @property
+    def subs_dir(self) -> Path:
+        return self.dir / "SUBS"
+
+    @property
+    def slides_path(self) -> Path:
+        return self.dir / "slides.json"
+
+    @property
+    def tiempos_path(self) -> Path:
+        return self.dir / "tiempos.json"
+
+    @property
+    def xml_path(self) -> Path:
+        return self.dir / f"{self.nombre}.xml"
+
+
+def config_path() -> Path:
+    return Path(os.getenv("VIDEONEWS_CONFIG") or BASE_DIR / "config.json")
+
+
+def guardar_config(proyecto: Proyecto, path: Path = None):
+    path = path or config_path()
+    cache.escribir_atomico(path, json.dumps({
+        "nombre_proyecto": proyecto.nombre,
+        "dir_proyecto": str(proyecto.dir.resolve()),
+    }, indent=4).encode("utf-8"))
+
+
+def cargar_proyecto(path: Path = None) -> Proyecto:
+    path = path or config_path()
+    if not path.exists():
+        raise FileNotFoundError(f"No se encontró config.json en {path}")
+    config = json.loads(path.read_text(encoding="utf-8"))
+    nombre = config.get("nombre_proyecto")
+    if not nombre:
+        raise ValueError("config.json debe incluir 'nombre_proyecto'")
+    # Configs viejos solo traen el nombre: el proyecto vive junto a los scripts
+    return Proyecto(nombre, Path(config.get("dir_proyecto") or BASE_DIR / nombre))
+
+
+def cargar_slides(proyecto: Proyecto) -> list:
+    return json.loads(proyecto.slides_path.read_text(encoding="utf-8"))
+
+
+def guardar_slides(proyecto: Proyecto, slides: list):
+    # Atómico: una caída a mitad de escritura deja el slides.json anterior, nunca uno truncado
+    cache.escribir_atomico(proyecto.slides_path, json.dumps(slides, ensure_ascii=False, indent=2).encode("utf-8"))
+
+
+def guardar_tiempos(proyecto: Proyecto, reporte: dict):
+    cache.escribir_atomico(proyecto.tiempos_path, json.dumps(reporte, ensure_ascii=False, indent=2).encode("utf-8"))
+
+
+def crear_workspace(job_id: str) -> Path:
+    ws = JOBS_DIR / job_id
+    ws.mkdir(parents=True, exist_ok=True)
+    return ws
+
+
+def borrar_workspace(ws: Path):
+    shutil.rmtree(ws, ignore_errors=True)
+
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+@contextmanager
+def bloqueo_proyecto(proyecto: Proyecto):
+    """Serializa solo los jobs que escriben en la misma carpeta de proyecto.
+
+    Entre hilos con un lock del proceso y entre procesos (workers en otras
+    máquinas incluidos) con `flock` sobre `<proyecto>/.lock`.
+    """
+    clave = str(proyecto.dir.resolve())
+    with _locks_guard:
+        lock = _locks.setdefault(clave, threading.Lock())
+    with lock:
+        if fcntl is None:
+            yield
+            return
+        proyecto.dir.mkdir(parents=True, exist_ok=True)
+        with open(proyecto.dir / ".lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)